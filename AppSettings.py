@@ -25,6 +25,7 @@
 """
 import os
 import logging
+import hashlib
 from PyQt4 import QtCore
 import sys
 
@@ -57,7 +58,7 @@ TMP_PATH = APP_ABS_ROOT + "tmp" + os.sep
 APP_VERSION = "v0.0.7-dev"
 
 # App version
-APP_DB_VERSION = 1
+APP_DB_VERSION = 7
 
 # language
 LANG = "en"
@@ -68,6 +69,18 @@ WRONG_PASWD_SLEEP = 3
 # clipboard 'live' in miliseconds
 CLIPBOARD_LIVE_MSEC = 60000
 
+# passwords expiring in days are shown as expiring soon
+EXPIRY_SOON_DAYS = 7
+
+# interval in miliseconds, to check database changes from other app instances
+DB_WATCH_MSEC = 1000
+
+# decrypt worker processes of list selects, 0 or 1 disables parallel decryption
+DECRYPT_WORKERS = 0
+
+# min count of selected passwords decrypted in parallel, smaller selects are decrypted on access
+DECRYPT_PARALLEL_MIN = 1000
+
 # default user name for passwords user
 USER_NAME = "user"
 
@@ -101,9 +114,26 @@ TRANS_SUFFIX = ".txt"
 # backup path
 BACKUP_PATH = APP_ABS_ROOT + "backup" + os.sep
 
+# count of kept backups
+BACKUP_COUNT = 10
+
+# backup store chunk size in bytes, multiple of DB page size
+BACKUP_CHUNK_SIZE = 64 * 1024
+
 # app icon path
 APP_ICON_PATH = ICONS_PATH + "userpass.ico"
 
+# SQLite connection profiles, PRAGMA values applied on connect
+# default: WAL journal, sync on checkpoints, bigger cache and memory mapped I/O
+# durable: rollback journal and sync on every commit, max durability
+DB_PROFILES = {"default" : {"journal_mode" : "WAL", "synchronous" : "NORMAL", "mmap_size" : 64 * 1024 * 1024, 
+                            "cache_size" : -16000, "temp_store" : "MEMORY", "busy_timeout" : 5000},
+               "durable" : {"journal_mode" : "DELETE", "synchronous" : "FULL", "mmap_size" : 0, 
+                            "cache_size" : -2000, "temp_store" : "DEFAULT", "busy_timeout" : 5000}}
+
+# default SQLite connection profile
+DB_PROFILE = "default"
+
 """
     Settings keys.
 """
@@ -113,6 +143,19 @@ SET_KEY_DB = "database/file_path"
 # language key
 SET_KEY_LANG = "general/language"
 
+# DB connection profile key
+SET_KEY_DB_PROFILE = "database/profile"
+
+# DB connection PRAGMA keys prefix, overrides profile values, i.e. database/journal_mode
+SET_KEY_DB_PRAGMA = "database/"
+
+# decrypt worker processes key
+SET_KEY_DECRYPT_WORKERS = "general/decrypt_workers"
+
+# last backup of DB file, DB file signature and backup hash keys, formated by hash of absolute DB file path
+SET_KEY_BACKUP_SIGNATURE = "backup/%s/signature"
+SET_KEY_BACKUP_HASH = "backup/%s/hash"
+
 def writeSettings():
     """
     """
@@ -173,6 +216,122 @@ def writeLanguage(lang):
     settings = QtCore.QSettings(QtCore.QString.fromUtf8(SETTINGS_FILE_PATH), QtCore.QSettings.IniFormat)
     settings.setValue(SET_KEY_LANG, QtCore.QString.fromUtf8(lang))
     
+def readDbProfile():
+    """
+        Read SQLite connection profile. Values of selected profile can be overriden by PRAGMA keys.
+        
+        @return: dictionary, PRAGMA name and value
+    """
+    # open settings
+    settings = QtCore.QSettings(QtCore.QString.fromUtf8(SETTINGS_FILE_PATH), QtCore.QSettings.IniFormat)
+    name = str(settings.value(SET_KEY_DB_PROFILE, DB_PROFILE).toString().toUtf8())
+    
+    logging.debug("reading setting file: '%s', key: '%s', data: '%s'", SETTINGS_FILE_PATH, SET_KEY_DB_PROFILE, name)
+    
+    if (name not in DB_PROFILES):
+        logging.warning("unknown DB profile: '%s', using: '%s'", name, DB_PROFILE)
+        
+        name = DB_PROFILE
+    profile = dict(DB_PROFILES[name])
+    
+    # overriden values
+    for pragma in profile.keys():
+        key = SET_KEY_DB_PRAGMA + pragma
+        
+        if (settings.contains(key)):
+            profile[pragma] = str(settings.value(key).toString().toUtf8())
+            
+            logging.debug("reading setting file: '%s', key: '%s', data: '%s'", SETTINGS_FILE_PATH, key, profile[pragma])
+    return profile
+
+def writeDbProfile(name):
+    """
+        Write SQLite connection profile name.
+        
+        @param name: profile name, key of DB_PROFILES
+    """
+    logging.debug("writing setting file: '%s', key: '%s', data: '%s'", SETTINGS_FILE_PATH, SET_KEY_DB_PROFILE, name)
+        
+    # open settings
+    settings = QtCore.QSettings(QtCore.QString.fromUtf8(SETTINGS_FILE_PATH), QtCore.QSettings.IniFormat)
+    settings.setValue(SET_KEY_DB_PROFILE, QtCore.QString.fromUtf8(name))
+    
+def readDecryptWorkers():
+    """
+        Read count of decrypt worker processes.
+        
+        @return: workers count, 0 or 1 parallel decryption disabled
+    """
+    # open settings
+    settings = QtCore.QSettings(QtCore.QString.fromUtf8(SETTINGS_FILE_PATH), QtCore.QSettings.IniFormat)
+    workers = settings.value(SET_KEY_DECRYPT_WORKERS, DECRYPT_WORKERS).toInt()[0]
+    
+    logging.debug("reading setting file: '%s', key: '%s', data: '%s'", SETTINGS_FILE_PATH, SET_KEY_DECRYPT_WORKERS, workers)
+    
+    return workers
+
+def writeDecryptWorkers(workers):
+    """
+        Write count of decrypt worker processes.
+        
+        @param workers: workers count, 0 disables parallel decryption
+    """
+    logging.debug("writing setting file: '%s', key: '%s', data: '%s'", SETTINGS_FILE_PATH, SET_KEY_DECRYPT_WORKERS, workers)
+        
+    # open settings
+    settings = QtCore.QSettings(QtCore.QString.fromUtf8(SETTINGS_FILE_PATH), QtCore.QSettings.IniFormat)
+    settings.setValue(SET_KEY_DECRYPT_WORKERS, workers)
+    
+def backupStateKeys(db_path):
+    """
+        Return settings keys of last backup state of DB file, keyed by its absolute path.
+        
+        @param db_path: DB file path
+        
+        @return: touple (signature key, hash key)
+    """
+    path_hash = hashlib.sha1(os.path.abspath(db_path)).hexdigest()
+    
+    return (SET_KEY_BACKUP_SIGNATURE % path_hash, SET_KEY_BACKUP_HASH % path_hash)
+
+def readBackupState(db_path):
+    """
+        Read state of last backup of DB file, signature of backed up DB file and hash of backup.
+        
+        @param db_path: DB file path
+        
+        @return: touple (signature, hash), empty strings if there was no backup
+    """
+    signature_key, hash_key = backupStateKeys(db_path)
+    
+    # open settings
+    settings = QtCore.QSettings(QtCore.QString.fromUtf8(SETTINGS_FILE_PATH), QtCore.QSettings.IniFormat)
+    signature = str(settings.value(signature_key, "").toString().toUtf8())
+    digest = str(settings.value(hash_key, "").toString().toUtf8())
+    
+    logging.debug("reading setting file: '%s', key: '%s', data: '%s'", SETTINGS_FILE_PATH, signature_key, signature)
+    logging.debug("reading setting file: '%s', key: '%s', data: '%s'", SETTINGS_FILE_PATH, hash_key, digest)
+    
+    return (signature, digest)
+
+def writeBackupState(db_path, signature, digest):
+    """
+        Write state of last backup of DB file.
+        
+        @param db_path: DB file path
+        @param signature: signature of backed up DB file
+        @param digest: hash of backup
+    """
+    signature_key, hash_key = backupStateKeys(db_path)
+    
+    logging.debug("writing setting file: '%s', key: '%s', data: '%s'", SETTINGS_FILE_PATH, signature_key, signature)
+    logging.debug("writing setting file: '%s', key: '%s', data: '%s'", SETTINGS_FILE_PATH, hash_key, digest)
+    
+    # open settings
+    settings = QtCore.QSettings(QtCore.QString.fromUtf8(SETTINGS_FILE_PATH), QtCore.QSettings.IniFormat)
+    settings.setValue(signature_key, QtCore.QString.fromUtf8(signature))
+    settings.setValue(hash_key, QtCore.QString.fromUtf8(digest))
+    
 def decodePath(path):
     """
         Decode path from utf-8 to system encoding.
@@ -0,0 +1,265 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    MIT License
+
+    Copyright (c) 2013-2016 Frantisek Uhrecky
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import sqlite3
+import logging
+import itertools
+import CryptoBasics
+
+# attachment chunk size in bytes, have to be multiple of AES block size
+ATT_CHUNK_SIZE = 64 * 1024
+
+class AttachmentController:
+    """
+        Provides manipulating password attachments in database. Attachment is one AES-CBC stream encrypted
+        with password secret key and IV, stored in table Attachments in fixed size chunks. So it is encrypted
+        and decrypted chunk by chunk and memory does not depend on attachment size.
+    """
+    def __init__(self, db_controller, master):
+        self._db_ctrl = db_controller
+        self._master = master
+    
+    @property
+    def _connection(self):
+        """
+            Connection of current thread from DB controller pool.
+        """
+        return self._db_ctrl.connection()
+    
+    @property
+    def _cursor(self):
+        """
+            Cursor of current thread connection from DB controller pool.
+        """
+        return self._db_ctrl.cursor()
+    
+    def hasAttachment(self, p_id):
+        """
+            Check if password has attachment.
+            
+            @param p_id: password ID
+            @return: True if has attachment, else False
+        """
+        try:
+            self._cursor.execute("SELECT 1 FROM Attachments WHERE passwd_id = :id LIMIT 1;", {"id" : p_id})
+            
+            return self._cursor.fetchone() is not None
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+        
+    def selectChunks(self, p_id):
+        """
+            Select encrypted chunks of attachment, one by one ordered by sequence number.
+            
+            @param p_id: password ID
+            @return: generator of encrypted chunks
+        """
+        # own cursor, chunks are fetched lazily
+        cursor = self._connection.cursor()
+        
+        try:
+            cursor.execute("SELECT data FROM Attachments WHERE passwd_id = :id ORDER BY seq;", {"id" : p_id})
+            
+            # sqlite3 returns BLOB as buffer, ciphers accept str
+            for row in cursor:
+                yield str(row["data"])
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+        finally:
+            cursor.close()
+        
+    def selectPasswdIds(self):
+        """
+            Select IDs of passwords with attachment.
+            
+            @return: set of password IDs
+        """
+        try:
+            self._cursor.execute("SELECT DISTINCT passwd_id FROM Attachments;")
+            
+            return set(row["passwd_id"] for row in self._cursor.fetchall())
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+        
+    def writeAttachment(self, p_id, secret_key, iv, dst):
+        """
+            Decrypt attachment chunk by chunk and write it to file.
+            
+            @param p_id: password ID
+            @param secret_key: password secret key, see PasswdController.cipherKey()
+            @param iv: password cipher input vector
+            @param dst: opened binary file
+            @return: written bytes count
+        """
+        size = 0
+        
+        for chunk in CryptoBasics.decryptChunks(self.selectChunks(p_id), secret_key, iv):
+            dst.write(chunk)
+            size += len(chunk)
+        logging.info("attachment of password ID: %d, written bytes: %d", p_id, size)
+        
+        return size
+    
+    def selectAttachment(self, p_id, secret_key, iv):
+        """
+            Select and decrypt whole attachment.
+            
+            @param p_id: password ID
+            @param secret_key: password secret key, see PasswdController.cipherKey()
+            @param iv: password cipher input vector
+            @return: attachment data, empty string if has no attachment
+        """
+        return "".join(CryptoBasics.decryptChunks(self.selectChunks(p_id), secret_key, iv))
+        
+    def insertAttachment(self, p_id, secret_key, iv, src):
+        """
+            Encrypt and insert attachment chunk by chunk, replaces old attachment. Empty attachment is not stored.
+            
+            @param p_id: password ID
+            @param secret_key: password secret key, see PasswdController.cipherKey()
+            @param iv: password cipher input vector
+            @param src: opened binary file or attachment data string
+        """
+        if (isinstance(src, basestring)):
+            chunks = (src[i:i + ATT_CHUNK_SIZE] for i in range(0, len(src), ATT_CHUNK_SIZE))
+        else:
+            chunks = iter(lambda: src.read(ATT_CHUNK_SIZE), "")
+        
+        try:
+            self._cursor.execute("DELETE FROM Attachments WHERE passwd_id = :id;", {"id" : p_id})
+            
+            seq = 0
+            size = 0
+            first = next(chunks, "")
+            
+            # empty attachment is not stored
+            if (first):
+                for data in CryptoBasics.encryptChunks(itertools.chain([first], chunks), secret_key, iv):
+                    self._cursor.execute("INSERT INTO Attachments(passwd_id, seq, data) VALUES(:passwd_id, :seq, :data)",
+                                        {"passwd_id" : p_id, "seq" : seq, "data" : sqlite3.Binary(data)})
+                    seq += 1
+                    size += len(data)
+            self._db_ctrl.commit()
+            
+            logging.info("attachment of password ID: %d, chunks inserted: %d, encrypted size: %d", p_id, seq, size)
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            self._db_ctrl.rollback()
+            raise e
+            
+    def reencryptAttachment(self, p_id, secret_key, iv, new_key, new_iv):
+        """
+            Re-encrypt attachment chunk by chunk by other key. New chunks are inserted with negative sequence numbers,
+            then old chunks are deleted and new renumbered, so memory does not depend on attachment size.
+            Have to run in transaction.
+            
+            @param p_id: password ID
+            @param secret_key: current secret key
+            @param iv: current cipher input vector
+            @param new_key: new secret key
+            @param new_iv: new cipher input vector
+            @return: re-encrypted chunks count
+        """
+        # own cursor, old chunks are fetched lazily
+        cursor = self._connection.cursor()
+        seq = 0
+        
+        try:
+            cursor.execute("SELECT data FROM Attachments WHERE passwd_id = :id AND seq >= 0 ORDER BY seq;", {"id" : p_id})
+            
+            chunks = CryptoBasics.decryptChunks((str(row["data"]) for row in cursor), secret_key, iv)
+            first = next(chunks, None)
+            
+            # no attachment
+            if (first is None):
+                return 0
+            
+            for data in CryptoBasics.encryptChunks(itertools.chain([first], chunks), new_key, new_iv):
+                self._cursor.execute("INSERT INTO Attachments(passwd_id, seq, data) VALUES(:passwd_id, :seq, :data)",
+                                    {"passwd_id" : p_id, "seq" : -seq - 1, "data" : sqlite3.Binary(data)})
+                seq += 1
+            
+            self._cursor.execute("DELETE FROM Attachments WHERE passwd_id = :id AND seq >= 0;", {"id" : p_id})
+            self._cursor.execute("UPDATE Attachments SET seq = -seq - 1 WHERE passwd_id = :id;", {"id" : p_id})
+            
+            logging.info("attachment of password ID: %d, chunks re-encrypted: %d", p_id, seq)
+            
+            return seq
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+        finally:
+            cursor.close()
+        
+    def deleteAttachment(self, p_id):
+        """
+            Delete attachment of password.
+            
+            @param p_id: password ID
+        """
+        try:
+            self._cursor.execute("DELETE FROM Attachments WHERE passwd_id = :id;", {"id" : p_id})
+            
+            self._db_ctrl.commit()
+            
+            logging.info("attachment of password ID: %d, chunks deleted: %d", p_id, self._cursor.rowcount)
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            self._db_ctrl.rollback()
+            raise e
+        
+    def convertInline(self):
+        """
+            Move attachments stored in Passwords.attachment column to Attachments table. Ciphertext is sliced 
+            to chunks without decryption, CBC stream stays the same, so master password is not needed.
+        """
+        try:
+            self._cursor.execute("SELECT id, length(attachment) AS size FROM Passwords WHERE attachment IS NOT NULL;")
+            rows = self._cursor.fetchall()
+            
+            for row in rows:
+                self._cursor.execute("DELETE FROM Attachments WHERE passwd_id = :id;", {"id" : row["id"]})
+                
+                for seq in range(0, (row["size"] + ATT_CHUNK_SIZE - 1) // ATT_CHUNK_SIZE):
+                    self._cursor.execute("""INSERT INTO Attachments(passwd_id, seq, data) 
+                                        SELECT id, :seq, substr(attachment, :start, :len) FROM Passwords WHERE id = :id""", 
+                                        {"id" : row["id"], "seq" : seq, "start" : seq * ATT_CHUNK_SIZE + 1, "len" : ATT_CHUNK_SIZE})
+            self._cursor.execute("UPDATE Passwords SET attachment = NULL;")
+            
+            logging.info("inline attachments converted: %d", len(rows))
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            self._db_ctrl.rollback()
+            raise e
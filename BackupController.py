@@ -0,0 +1,482 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    MIT License
+
+    Copyright (c) 2013-2016 Frantisek Uhrecky
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import os
+import time
+import json
+import sqlite3
+import logging
+import hashlib
+import threading
+import AppSettings
+
+# running backups, see waitForBackups()
+_running = []
+
+# running backups are registered and removed from different threads
+_running_lock = threading.Lock()
+
+# one operation with backup store at time, chunk collection can't run during backup
+_store_lock = threading.RLock()
+
+def waitForBackups():
+    """
+        Wait until running backups are finished, i.e. before database conversion.
+    """
+    with _running_lock:
+        running = list(_running)
+    
+    for backup in running:
+        logging.info("waiting for backup: '%s'", backup._db_path)
+        
+        backup.join()
+
+class BackupController:
+    """
+        Provides backups of database in deduplicated backup store. Database snapshot is split into fixed size chunks,
+        every chunk is stored once by its SHA-256 hash, snapshot is described by manifest, list of its chunks.
+        So new backup writes just changed chunks.
+        
+        Store layout: chunks/<hash prefix>/<hash>, manifests/<time with microseconds>_<database name>.json
+    """
+    # hash read block size
+    __BLOCK_SIZE = 64 * 1024
+    
+    # SQLite VM instructions between progress callbacks
+    __PROGRESS_STEP = 100000
+    
+    # manifest format version
+    __MANIFEST_VERSION = 1
+    
+    def __init__(self, backup_path = AppSettings.BACKUP_PATH, chunk_size = AppSettings.BACKUP_CHUNK_SIZE):
+        """
+            @param backup_path: backup store directory
+            @param chunk_size: chunk size in bytes, have to be multiple of database page size
+        """
+        self._backup_path = backup_path
+        self._chunks_path = backup_path + "chunks" + os.sep
+        self._manifests_path = backup_path + "manifests" + os.sep
+        self._chunk_size = chunk_size
+        
+        for path in [self._chunks_path, self._manifests_path]:
+            if (not os.path.exists(AppSettings.decodePath(path))):
+                os.makedirs(AppSettings.decodePath(path))
+    
+    def signature(self, db_path):
+        """
+            Return signature of database file, modification time and size of database and its WAL file.
+            Empty WAL file is skipped, checkpoint truncates it and changes its modification time.
+            
+            @param db_path: database file path
+            
+            @return: signature string
+        """
+        signature = []
+        
+        for path in [db_path, db_path + "-wal"]:
+            path = AppSettings.decodePath(path)
+            
+            if (os.path.exists(path) and os.path.getsize(path) > 0):
+                stat = os.stat(path)
+                
+                signature.append("%r:%d" % (stat.st_mtime, stat.st_size))
+        return ";".join(signature)
+    
+    def chunkPath(self, digest):
+        """
+            Return chunk file path in system encoding.
+            
+            @param digest: chunk hash
+        """
+        return AppSettings.decodePath(self._chunks_path + digest[:2] + os.sep + digest)
+    
+    def storeChunk(self, data):
+        """
+            Store chunk, if is not stored yet.
+            
+            @param data: chunk data
+            
+            @return: touple (chunk hash, True if was written)
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunkPath(digest)
+        
+        if (os.path.exists(path)):
+            return (digest, False)
+        
+        if (not os.path.exists(os.path.dirname(path))):
+            os.makedirs(os.path.dirname(path))
+        
+        # whole chunk or nothing
+        with open(path + ".part", "wb") as f:
+            f.write(data)
+        os.rename(path + ".part", path)
+        
+        return (digest, True)
+    
+    def readChunks(self, f, size, progress = None, canceled = None):
+        """
+            Read file by chunks.
+            
+            @param f: opened file
+            @param size: count of bytes to read
+            @param progress: callable with arguments: read bytes, size
+            @param canceled: callable, returns True if reading should be interrupted
+            
+            @return: generator of chunks
+        """
+        done = 0
+        
+        while (done < size):
+            if (canceled and canceled()):
+                raise IOError("backup canceled")
+            
+            data = f.read(min(self._chunk_size, size - done))
+            
+            if (not data):
+                raise IOError("unexpected end of database file")
+            done += len(data)
+            
+            yield data
+            
+            if (progress):
+                progress(done, size)
+    
+    def backup(self, db_path, progress = None, canceled = None):
+        """
+            Create backup of database, if was changed since last backup. Database is compared with last backup
+            by file signature taken after checkpoint. Snapshot is read from database file in read transaction, 
+            if WAL file is empty after checkpoint, else is made by VACUUM INTO. Database not in WAL mode is always 
+            snapshotted by VACUUM INTO, read transaction would block writers while whole file is hashed.
+            
+            @param db_path: database file path
+            @param progress: callable with arguments: read bytes, database size
+            @param canceled: callable, returns True if backup should be interrupted
+            
+            @return: manifest name, None if backup was not created
+        """
+        with _store_lock:
+            last_signature, last_digest = AppSettings.readBackupState(db_path)
+            
+            con = sqlite3.connect(AppSettings.decodePath(db_path), isolation_level = None)
+            tmp_file = None
+            
+            try:
+                # copy WAL to database, signature is taken after it, checkpoint changes files
+                busy = con.execute("PRAGMA wal_checkpoint(TRUNCATE);").fetchone()[0]
+                signature = self.signature(db_path)
+                
+                if (signature == last_signature):
+                    logging.info("database: '%s' not changed since last backup", db_path)
+                    
+                    return None
+                
+                wal_mode = con.execute("PRAGMA journal_mode;").fetchone()[0].lower() == "wal"
+                
+                # hold read transaction, so database file is not changed while reading
+                con.execute("BEGIN;")
+                page_size = con.execute("PRAGMA page_size;").fetchone()[0]
+                size = page_size * con.execute("PRAGMA page_count;").fetchone()[0]
+                
+                wal = AppSettings.decodePath(db_path + "-wal")
+                
+                if (not wal_mode or busy or (os.path.exists(wal) and os.path.getsize(wal) > 0)):
+                    # database file is not consistent or read transaction would block writers, snapshot it
+                    con.execute("COMMIT;")
+                    
+                    tmp_file = AppSettings.decodePath(self._backup_path + os.path.basename(db_path) + ".part")
+                    
+                    if (os.path.exists(tmp_file)):
+                        os.remove(tmp_file)
+                    logging.info("creating database snapshot: '%s'", tmp_file)
+                    
+                    con.set_progress_handler(lambda: canceled and canceled(), self.__PROGRESS_STEP)
+                    con.execute("VACUUM INTO ?;", (tmp_file, ))
+                    
+                    # snapshot is read without lock
+                    con.close()
+                    
+                    size = os.path.getsize(tmp_file)
+                
+                manifest = self.storeFile(tmp_file or AppSettings.decodePath(db_path), size, progress, canceled)
+            except (sqlite3.Error, IOError, OSError) as e:
+                logging.exception(e)
+                
+                raise e
+            finally:
+                con.close()
+                
+                if (tmp_file and os.path.exists(tmp_file)):
+                    os.remove(tmp_file)
+            
+            name = None
+            
+            if (manifest["digest"] == last_digest):
+                logging.info("database: '%s' same as last backup", db_path)
+            else:
+                now = time.time()
+                
+                # microseconds, so backups created in same second have different names, names are sorted by time
+                name = (time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now)) + ".%06d_" % int(now % 1 * 1000000) 
+                        + os.path.basename(db_path))
+                
+                manifest["database"] = os.path.basename(db_path)
+                manifest["time"] = now
+                
+                self.writeManifest(name, manifest)
+            AppSettings.writeBackupState(db_path, signature, manifest["digest"])
+            
+            return name
+    
+    def storeFile(self, path, size, progress = None, canceled = None):
+        """
+            Store file chunks and create manifest.
+            
+            @param path: file path in system encoding
+            @param size: count of bytes to store
+            @param progress: callable with arguments: read bytes, size
+            @param canceled: callable, returns True if storing should be interrupted
+            
+            @return: manifest dictionary, without name
+        """
+        digest = hashlib.sha256()
+        chunks = []
+        written = 0
+        
+        with open(path, "rb") as f:
+            for data in self.readChunks(f, size, progress, canceled):
+                digest.update(data)
+                
+                chunk, new = self.storeChunk(data)
+                chunks.append(chunk)
+                
+                if (new):
+                    written += len(data)
+        logging.info("backup chunks: %d, written bytes: %d of: %d", len(chunks), written, size)
+        
+        return {"version" : self.__MANIFEST_VERSION, "size" : size, "chunk_size" : self._chunk_size, 
+                "digest" : digest.hexdigest(), "chunks" : chunks}
+    
+    def writeManifest(self, name, manifest):
+        """
+            Write backup manifest, existing manifest is not overwritten.
+            
+            @param name: backup name
+            @param manifest: manifest dictionary
+            @raise IOError: manifest with same name exists
+        """
+        path = AppSettings.decodePath(self._manifests_path + name + ".json")
+        
+        if (os.path.exists(path)):
+            raise IOError("backup manifest already exists: '%s'" % name)
+        
+        with open(path + ".part", "w") as f:
+            json.dump(manifest, f)
+        os.rename(path + ".part", path)
+        
+        logging.info("backup manifest written: '%s'", name)
+    
+    def readManifest(self, name):
+        """
+            Read backup manifest.
+            
+            @param name: backup name
+            
+            @return: manifest dictionary
+        """
+        with open(AppSettings.decodePath(self._manifests_path + name + ".json"), "r") as f:
+            manifest = json.load(f)
+        manifest["name"] = name
+        
+        return manifest
+    
+    def selectBackups(self, database = None):
+        """
+            Select backups from store, newest first.
+            
+            @param database: database file name, None all
+            
+            @return: list of manifest dictionaries
+        """
+        backups = []
+        
+        # names starts with time
+        for name in sorted(os.listdir(AppSettings.decodePath(self._manifests_path)), reverse = True):
+            if (name.endswith(".json")):
+                manifest = self.readManifest(name[:-len(".json")])
+                
+                if (database is None or manifest["database"] == database):
+                    backups.append(manifest)
+        return backups
+    
+    def restoreBackup(self, name, dst):
+        """
+            Restore backup to file. Chunk hashes are verified. Replaced file is removed with its WAL, shared memory
+            and rollback journal files.
+            
+            @param name: backup name
+            @param dst: destination file path
+        """
+        with _store_lock:
+            manifest = self.readManifest(name)
+            tmp_file = AppSettings.decodePath(dst + ".part")
+            
+            logging.info("restoring backup: '%s', to: '%s'", name, dst)
+            
+            try:
+                with open(tmp_file, "wb") as f:
+                    for chunk in manifest["chunks"]:
+                        with open(self.chunkPath(chunk), "rb") as c:
+                            data = c.read()
+                        
+                        if (hashlib.sha256(data).hexdigest() != chunk):
+                            raise IOError("damaged backup chunk: '%s'" % chunk)
+                        f.write(data)
+                
+                # journal files of replaced database would be applied to restored one
+                for path in [dst, dst + "-wal", dst + "-shm", dst + "-journal"]:
+                    if (os.path.exists(AppSettings.decodePath(path))):
+                        os.remove(AppSettings.decodePath(path))
+                os.rename(tmp_file, AppSettings.decodePath(dst))
+            except (IOError, OSError) as e:
+                logging.exception(e)
+                
+                if (os.path.exists(tmp_file)):
+                    os.remove(tmp_file)
+                raise e
+    
+    def deleteBackup(self, name):
+        """
+            Delete backup, chunks not used by other backups are removed.
+            
+            @param name: backup name
+        """
+        with _store_lock:
+            logging.info("deleting backup: '%s'", name)
+            
+            os.remove(AppSettings.decodePath(self._manifests_path + name + ".json"))
+            
+            self.collectChunks()
+    
+    def pruneBackups(self, database, count = AppSettings.BACKUP_COUNT):
+        """
+            Remove old backups of database, keep just last backups. Unused chunks are removed.
+            
+            @param database: database file name
+            @param count: count of kept backups
+        """
+        with _store_lock:
+            for manifest in self.selectBackups(database)[count:]:
+                logging.info("removing old backup: '%s'", manifest["name"])
+                
+                os.remove(AppSettings.decodePath(self._manifests_path + manifest["name"] + ".json"))
+            
+            self.collectChunks()
+    
+    def collectChunks(self):
+        """
+            Remove chunks, which are not used by any backup, and unfinished files.
+            
+            @return: count of removed chunks
+        """
+        with _store_lock:
+            used = set()
+            
+            for manifest in self.selectBackups():
+                used.update(manifest["chunks"])
+            
+            removed = 0
+            
+            for path, dirs, files in os.walk(AppSettings.decodePath(self._chunks_path)):
+                for name in files:
+                    if (name not in used):
+                        os.remove(os.path.join(path, name))
+                        
+                        removed += 1
+            for name in os.listdir(AppSettings.decodePath(self._manifests_path)):
+                if (name.endswith(".part")):
+                    os.remove(os.path.join(AppSettings.decodePath(self._manifests_path), name))
+            
+            logging.info("unused backup chunks removed: %d", removed)
+            
+            return removed
+
+class BackupThread(threading.Thread):
+    """
+        Backups database in background thread, so application startup is not blocked. Old backups are pruned after backup.
+    """
+    def __init__(self, db_path, backup_path = AppSettings.BACKUP_PATH, count = AppSettings.BACKUP_COUNT, progress = None):
+        """
+            Initialize backup, it is started by start().
+            
+            @param db_path: database file path
+            @param backup_path: backup store directory
+            @param count: count of kept backups
+            @param progress: callable called from backup thread with arguments: read bytes, database size
+        """
+        threading.Thread.__init__(self, name = "backup")
+        
+        self._db_path = db_path
+        self._backup_ctrl = BackupController(backup_path)
+        self._count = count
+        self._progress = progress
+        
+        # manifest name, if backup was created
+        self._backup_name = None
+        self._canceled = False
+        
+    def start(self):
+        """
+            Register backup as running before thread is started, so waitForBackups() called right after start waits for it.
+        """
+        with _running_lock:
+            _running.append(self)
+        
+        try:
+            threading.Thread.start(self)
+        except:
+            with _running_lock:
+                _running.remove(self)
+            
+            raise
+        
+    def run(self):
+        """
+            Backup database and prune old backups, runs in backup thread.
+        """
+        try:
+            self._backup_name = self._backup_ctrl.backup(self._db_path, self._progress, lambda: self._canceled)
+            self._backup_ctrl.pruneBackups(os.path.basename(self._db_path), self._count)
+        except Exception as e:
+            logging.exception(e)
+        finally:
+            with _running_lock:
+                _running.remove(self)
+        
+    def cancel(self):
+        """
+            Cancel running backup.
+        """
+        self._canceled = True
@@ -0,0 +1,181 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    MIT License
+
+    Copyright (c) 2013-2016 Frantisek Uhrecky
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+from PyQt4 import QtGui, QtCore
+from TransController import tr
+import logging
+import os
+import time
+import AppSettings
+import InfoMsgBoxes
+from BackupController import BackupController
+
+class BackupsDialog(QtGui.QDialog):
+    """
+        Backups dialog window, lists backups of database, restores, deletes and prunes them.
+    """
+    def __init__(self, db_path):
+        """
+            @param db_path: database file path, its backups are shown
+        """
+        self.__db_path = db_path
+        self.__backup_ctrl = BackupController()
+        
+        super(BackupsDialog, self).__init__()
+        
+        self.initUI()
+        self.center()
+        self.initConnections()
+        self.loadBackups()
+        
+    def initUI(self):
+        """
+            Initialize UI components.
+        """
+        self.setWindowTitle(tr("Backups"))
+        self.resize(500, 300)
+        
+        # create main grid layout
+        layout_gl = QtGui.QGridLayout()
+        self.setLayout(layout_gl)
+        
+        # backups list
+        self._backups_tw = QtGui.QTreeWidget()
+        self._backups_tw.setHeaderLabels([tr("Time"), tr("Size")])
+        self._backups_tw.setRootIsDecorated(False)
+        
+        layout_gl.addWidget(self._backups_tw, 0, 0)
+        
+        # create buttons
+        self._button_box = QtGui.QDialogButtonBox(QtCore.Qt.Vertical)
+        
+        self.__restore_button = QtGui.QPushButton(tr("&Restore"))
+        self.__delete_button = QtGui.QPushButton(tr("&Delete"))
+        self.__prune_button = QtGui.QPushButton(tr("&Prune"))
+        self.__close_button = QtGui.QPushButton(tr("&Close"))
+        
+        self._button_box.addButton(self.__restore_button, QtGui.QDialogButtonBox.ActionRole)
+        self._button_box.addButton(self.__delete_button, QtGui.QDialogButtonBox.ActionRole)
+        self._button_box.addButton(self.__prune_button, QtGui.QDialogButtonBox.ActionRole)
+        self._button_box.addButton(self.__close_button, QtGui.QDialogButtonBox.RejectRole)
+        
+        layout_gl.addWidget(self._button_box, 0, 1)
+        
+    def initConnections(self):
+        """
+            Init connections, reaction on signals.
+        """
+        self._button_box.rejected.connect(self.close)
+        
+        self.__restore_button.clicked.connect(self.restoreBackup)
+        self.__delete_button.clicked.connect(self.deleteBackup)
+        self.__prune_button.clicked.connect(self.pruneBackups)
+        
+    def loadBackups(self):
+        """
+            Load backups of database to list.
+        """
+        self._backups_tw.clear()
+        
+        for backup in self.__backup_ctrl.selectBackups(os.path.basename(self.__db_path)):
+            item = QtGui.QTreeWidgetItem([QtCore.QString.fromUtf8(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(backup["time"]))), 
+                                          QtCore.QString.fromUtf8("%.1f kB" % (backup["size"] / 1024.0))])
+            item.setData(0, QtCore.Qt.UserRole, QtCore.QString.fromUtf8(backup["name"]))
+            
+            self._backups_tw.addTopLevelItem(item)
+            
+    def currentBackupName(self):
+        """
+            Return name of selected backup.
+            
+            @return: backup name, None if nothing is selected
+        """
+        item = self._backups_tw.currentItem()
+        
+        if (not item):
+            return None
+        return str(item.data(0, QtCore.Qt.UserRole).toString().toUtf8())
+        
+    def restoreBackup(self):
+        """
+            Restore selected backup to file.
+        """
+        name = self.currentBackupName()
+        
+        if (not name):
+            return
+        file_path = QtGui.QFileDialog.getSaveFileName(self, tr("Save DB file"), QtCore.QString.fromUtf8(AppSettings.DB_PATH + name))
+        
+        if (not file_path.isEmpty()):
+            file_path = str(file_path.toUtf8())
+            
+            if (os.path.abspath(file_path) == os.path.abspath(self.__db_path)):
+                InfoMsgBoxes.showInfoMsg(tr("Backup can't be restored to opened database."))
+                
+                return
+            try:
+                self.__backup_ctrl.restoreBackup(name, file_path)
+                
+                InfoMsgBoxes.showInfoMsg(tr("Backup successfully restored."))
+            except (IOError, OSError) as e:
+                logging.exception(e)
+                
+                InfoMsgBoxes.showErrorMsg(e)
+        
+    def deleteBackup(self):
+        """
+            Delete selected backup.
+        """
+        name = self.currentBackupName()
+        
+        if (name):
+            msg = QtGui.QMessageBox(QtGui.QMessageBox.Question, tr("Backups"), tr("Do you want delete backup '") 
+                              + QtCore.QString.fromUtf8(name) + "'?")
+            msg.addButton(QtGui.QMessageBox.Yes)
+            msg.addButton(QtGui.QMessageBox.No)
+            
+            if (msg.exec_() == QtGui.QMessageBox.Yes):
+                self.__backup_ctrl.deleteBackup(name)
+                self.loadBackups()
+        
+    def pruneBackups(self):
+        """
+            Remove old backups, keep just last backups.
+        """
+        self.__backup_ctrl.pruneBackups(os.path.basename(self.__db_path))
+        self.loadBackups()
+        
+    def center(self):
+        """
+            Center window.
+        """
+        # get frame geometry
+        wg = self.frameGeometry()
+        
+        # get screen center
+        cs = QtGui.QDesktopWidget().availableGeometry().center()
+        wg.moveCenter(cs)
+        
+        self.move(wg.topLeft())
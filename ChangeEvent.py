@@ -0,0 +1,49 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    MIT License
+
+    Copyright (c) 2013-2016 Frantisek Uhrecky
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+class ChangeEvent:
+    """
+        Holds changed rows of one table, controllers record it to DB controller,
+        listeners get it after changes are commited.
+    """
+    # change types:
+    INSERTED = 1
+    UPDATED = 2
+    DELETED = 3
+    
+    def __init__(self, table, change, ids):
+        """
+            Initialize ChangeEvent.
+            
+            @param table: table name, i.e. Passwords
+            @param change: change type, INSERTED, UPDATED or DELETED
+            @param ids: list of changed row IDs
+        """
+        self._table = table
+        self._change = change
+        self._ids = list(ids)
+        
+    def __str__(self):
+        return "{'table' : '" + self._table + "', 'change' : '" + str(self._change) + "', 'ids' : '" + str(self._ids) + "'}"
@@ -0,0 +1,221 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    MIT License
+
+    Copyright (c) 2013-2016 Frantisek Uhrecky
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+from PyQt4 import QtGui, QtCore
+from TransController import tr
+import logging
+import InfoMsgBoxes
+from LoginController import LoginController
+
+class ChangeMasterDialog(QtGui.QDialog):
+    """
+        Change master password dialog window. All passwords are re-encrypted, progress is shown.
+    """
+    # emmitted signal, when master password is changed
+    # param is user object with new master password
+    signalMasterChanged = QtCore.pyqtSignal(object)
+    
+    def __init__(self, parent):
+        """
+            @param parent: main window, with logged user and database controller
+        """
+        self.__parent = parent
+        
+        super(ChangeMasterDialog, self).__init__(parent)
+        
+        self.initUI()
+        self.center()
+        self.initConnections()
+        
+    def initUI(self):
+        """
+            Initialize UI components.
+        """
+        self.setWindowTitle(tr("Change master password"))
+        self.setFixedSize(500, 170)
+        
+        # create main grid layout
+        layout_gl = QtGui.QGridLayout()
+        self.setLayout(layout_gl)
+        
+        # labels
+        old_label = QtGui.QLabel("<b>" + tr("Old master password:") + "</b>")
+        new_label = QtGui.QLabel("<b>" + tr("New master password:") + "</b>")
+        confirm_label = QtGui.QLabel("<b>" + tr("Confirm new password:") + "</b>")
+        
+        layout_gl.addWidget(old_label, 0, 0)
+        layout_gl.addWidget(new_label, 1, 0)
+        layout_gl.addWidget(confirm_label, 2, 0)
+        
+        # password lines, hidden
+        self._old_passwd = QtGui.QLineEdit()
+        self._new_passwd = QtGui.QLineEdit()
+        self._confirm_passwd = QtGui.QLineEdit()
+        
+        for line in (self._old_passwd, self._new_passwd, self._confirm_passwd):
+            line.setEchoMode(QtGui.QLineEdit.Password)
+        
+        layout_gl.addWidget(self._old_passwd, 0, 1)
+        
+        # password visibility check box
+        passwd_hl = QtGui.QHBoxLayout()
+        passwd_hl.addWidget(self._new_passwd)
+        
+        self._show_passwd_check = QtGui.QCheckBox(tr("Show"))
+        self._show_passwd_check.setChecked(False)
+        passwd_hl.addWidget(self._show_passwd_check)
+        
+        layout_gl.addLayout(passwd_hl, 1, 1)
+        layout_gl.addWidget(self._confirm_passwd, 2, 1)
+        
+        # re-encryption progress
+        self._progress_bar = QtGui.QProgressBar()
+        self._progress_bar.setValue(0)
+        
+        layout_gl.addWidget(self._progress_bar, 3, 0, 1, 2)
+        
+        # create buttons
+        self._button_box = QtGui.QDialogButtonBox()
+        
+        self.__change_button = QtGui.QPushButton(tr("C&hange"))
+        self.__change_button.setEnabled(False)
+        
+        self.__close_button = QtGui.QPushButton(tr("&Close"))
+        
+        self._button_box.addButton(self.__change_button, QtGui.QDialogButtonBox.AcceptRole)
+        self._button_box.addButton(self.__close_button, QtGui.QDialogButtonBox.RejectRole)
+        
+        layout_gl.addWidget(self._button_box, 4, 0, 1, 2)
+        
+    def initConnections(self):
+        """
+            Init connections, reaction on signals.
+        """
+        # show/hide password
+        self._show_passwd_check.stateChanged.connect(self.setVisibilityPass)
+        
+        # enable change button
+        self._old_passwd.textChanged.connect(self.enableChangeButton)
+        self._new_passwd.textChanged.connect(self.enableChangeButton)
+        self._confirm_passwd.textChanged.connect(self.enableChangeButton)
+        
+        self._button_box.accepted.connect(self.changeMaster)
+        self._button_box.rejected.connect(self.close)
+        
+    def changeMaster(self):
+        """
+            Verify inputs and change master password, passwords are re-encrypted in one transaction.
+        """
+        if (self._new_passwd.text() != self._confirm_passwd.text()):
+            InfoMsgBoxes.showInfoMsg(tr("New passwords don't match."))
+            
+            return
+        
+        old_master = str(self._old_passwd.text().toUtf8())
+        new_master = str(self._new_passwd.text().toUtf8())
+        
+        # inputs are disabled, until passwords are re-encrypted
+        self.setEnabled(False)
+        QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        
+        # timers would access database inside re-encryption transaction, events are processed by progress
+        self.__parent._expiry_ctrl.stop()
+        self.__parent._db_watcher.stop()
+        
+        try:
+            login_ctrl = LoginController(self.__parent._db_ctrl)
+            
+            user = login_ctrl.changeMaster(self.__parent._user, old_master, new_master, self.setProgress)
+        except Exception as e:
+            logging.exception(e)
+            
+            user = None
+            
+            QtGui.QApplication.restoreOverrideCursor()
+            InfoMsgBoxes.showErrorMsg(e)
+        else:
+            QtGui.QApplication.restoreOverrideCursor()
+        
+        self.setEnabled(True)
+        self._progress_bar.setValue(0)
+        
+        # nothing changed, on success main window is reloaded
+        if (not user):
+            self.__parent._expiry_ctrl.schedule()
+            self.__parent._db_watcher.resume()
+        
+        if (user is False):
+            QtGui.QMessageBox(QtGui.QMessageBox.Critical, tr("Wrong credentials!"), tr("Old master password is wrong.")).exec_()
+        elif (user):
+            self.signalMasterChanged.emit(user)
+            
+            InfoMsgBoxes.showInfoMsg(tr("Master password successfully changed."))
+            
+            self.close()
+        
+    def setProgress(self, done, total):
+        """
+            Show progress of re-encryption, called after every batch of passwords.
+            
+            @param done: count of re-encrypted passwords
+            @param total: count of all passwords
+        """
+        self._progress_bar.setMaximum(max(total, 1))
+        self._progress_bar.setValue(done)
+        
+        # window is repainted, re-encryption runs in GUI thread
+        QtCore.QCoreApplication.processEvents(QtCore.QEventLoop.ExcludeUserInputEvents)
+        
+    def setVisibilityPass(self, state):
+        """
+            Set visibility of passwords, depends on checkbox.
+        """
+        if (state == QtCore.Qt.Checked):
+            mode = QtGui.QLineEdit.Normal
+        else:
+            mode = QtGui.QLineEdit.Password
+        
+        for line in (self._old_passwd, self._new_passwd, self._confirm_passwd):
+            line.setEchoMode(mode)
+        
+    def enableChangeButton(self):
+        """
+            Enable change button, if all passwords are filled.
+        """
+        self.__change_button.setEnabled(not (self._old_passwd.text().isEmpty() or self._new_passwd.text().isEmpty() 
+                                             or self._confirm_passwd.text().isEmpty()))
+        
+    def center(self):
+        """
+            Center window.
+        """
+        # get frame geometry
+        wg = self.frameGeometry()
+        
+        # get screen center
+        cs = QtGui.QDesktopWidget().availableGeometry().center()
+        wg.moveCenter(cs)
+        
+        self.move(wg.topLeft())
@@ -25,19 +25,16 @@
 """
 import logging
 import AppSettings
-import sqlite3
-import os
-import shutil
+from AttachmentController import AttachmentController
 
 class ConvertDb():
     """
         Implements logic from converting database from older versions to newer, when are some changes made on DB model.
+        Database is converted in place, step by step from its version to current. Every step runs in one transaction
+        together with version update, so interrupted conversion is rolled back to last finished step and resumed from it.
     """
-    # we need dump just data, if possible
-    __ENABLED_KEY_WORDS = ["INSERT"]
-    __DUMP_FILE_NAME = "dump.sql"
-    __DUMP_FILE_PATH = AppSettings.TMP_PATH + __DUMP_FILE_NAME
-    __LINES_COUNT = 0
+    # tables of version 0 database, in creation order
+    __V0_TABLES = ["Users", "Icons", "Version", "Groups", "Passwords"]
     
     def __init__(self, db_ctrl):
         """
@@ -45,118 +42,157 @@ class ConvertDb():
             @param db_ctrl: application DB controller.
         """
         self.__db_ctrl = db_ctrl
-       
-    def convertDbToV1(self, old):
+        
+        # migration registry, version: method converting from previous version
+        self.__MIGRATIONS = {1 : self.convertDbToV1, 2 : self.convertDbToV2, 3 : self.convertDbToV3, 
+                              4 : self.convertDbToV4, 5 : self.convertDbToV5, 6 : self.convertDbToV6, 
+                              7 : self.convertDbToV7}
+        
+    def convert(self, progress = None):
         """
-            Convert database to version 1. Create dump, create new db, read and insert dump, set version, rewrite old DB and connect.
+            Convert database from its version to current version, runs missing steps in order.
+            Foreign keys are disabled during conversion and checked after every step.
             
-            @param old: old database
+            @param progress: callable called after every step, with arguments: converted version, steps done, steps count
         """
-        logging.info("converting database to version 1")
-        
-        # first create data dump from old database
-        self.createDump(old)
+        version = self.__db_ctrl.getAppDBVersion() or 0
+        steps = range(version + 1, AppSettings.APP_DB_VERSION + 1)
         
-        # get db name
-        db_name = os.path.basename(old)
-        
-        # create db in tmp folder
-        db_tmp = AppSettings.TMP_PATH + db_name
-        logging.info("tmp db: '%s'", db_tmp)
-        
-        # if is in tmp dir, first remove
-        if (os.path.exists(AppSettings.decodePath(db_tmp))):
-            logging.info("removing from tmp dir")
-            os.remove(AppSettings.decodePath(db_tmp))
-            
-        # connect to db and create new
-        self.__db_ctrl.connectDB(db_tmp)
-        self.__db_ctrl.createTables()
+        logging.info("converting database from version: %d, steps: %d", version, len(steps))
         
-        # disable foreign key constrains
+        # tables are rebuilt, can't be changed in transaction
         self.__db_ctrl.enForeignKey(False)
         
-        # now read dump file and insert data into new db
-        fr = None
         try:
-            fr = open(AppSettings.decodePath(self.__DUMP_FILE_PATH), "r")
-            
-            # temp line count
-            tmp_count = 0.0
-            # read every line
-            for line in fr:
-                tmp_count += 1
+            for done, step in enumerate(steps, 1):
+                with self.__db_ctrl.transaction():
+                    self.__MIGRATIONS[step]()
+                    
+                    self.checkForeignKeys()
                 
-                logging.info("line: '%s'", line)
+                logging.info("database converted to version: %d, step: %d/%d", step, done, len(steps))
                 
-                self.__db_ctrl._cursor.execute(line)
-                self.__db_ctrl._connection.commit()
-            # now insert version
-            self.__db_ctrl.insertAppDBVersion()
-            
+                if (progress):
+                    progress(step, done, len(steps))
         except Exception as e:
             logging.exception(e)
-            self.__db_ctrl._connection.rollback()
             
             raise e
         finally:
-            if (fr):
-                logging.info("closing dump file")
-                fr.close()
-            logging.info("removing dump file")
-            os.remove(AppSettings.decodePath(self.__DUMP_FILE_PATH))
-        # first disconnect from DB
-        self.__db_ctrl.disconnectDB()
+            self.__db_ctrl.enForeignKey()
+       
+    def convertDbToV1(self):
+        """
+            Convert database to version 1. Old tables are renamed, new tables created and rows moved by INSERT ... SELECT,
+            so are IDs kept. Columns are listed, new tables can have more columns. Old tables are dropped.
+        """
+        logging.info("converting database to version 1")
+        
+        cursor = self.__db_ctrl.cursor()
         
-        # copy copy new db to old
-        logging.info("coppying converted DB")
-        shutil.copyfile(AppSettings.decodePath(db_tmp), AppSettings.decodePath(old))
-        os.remove(AppSettings.decodePath(db_tmp))
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table';")
+        existing = [row["name"] for row in cursor.fetchall()]
+        tables = [table for table in self.__V0_TABLES if table in existing]
         
-        # reconnect to new DB
-        self.__db_ctrl.connectDB(old)
+        for table in tables:
+            cursor.execute("ALTER TABLE %s RENAME TO %s_v0;" % (table, table))
         
-    def createDump(self, old):
+        self.__db_ctrl.createTables()
+        
+        for table in tables:
+            # version is inserted bellow
+            if (table != "Version"):
+                columns = ", ".join(self.__db_ctrl.tableColumns(table + "_v0"))
+                
+                cursor.execute("INSERT INTO %s(%s) SELECT %s FROM %s_v0;" % (table, columns, columns, table))
+                
+                logging.info("table: %s, rows moved: %d", table, cursor.rowcount)
+        
+        # referencing tables first
+        for table in reversed(tables):
+            cursor.execute("DROP TABLE %s_v0;" % table)
+        
+        self.__db_ctrl.insertAppDBVersion(1)
+        
+    def convertDbToV2(self):
         """
-            Create dump of older database. Just data dump, without tables etc.
-            
-            @param old: path to database
+            Convert database to version 2. Create Attachments table and move attachments from Passwords table to it.
         """
-        # Convert file database to SQL dump file dump.sql    
-        con = sqlite3.connect(old)
-        f = None
+        logging.info("converting database to version 2")
         
-        try:
-            f = open(AppSettings.decodePath(self.__DUMP_FILE_PATH), 'w')
-            logging.info("creating data dump for database: '%s', dump file: '%s'", old, self.__DUMP_FILE_PATH)
-            
-            self.__LINES_COUNT = 0
-            
-            for line in con.iterdump():
-                if (self.containsKeyWords(line)):
-                    # count every line
-                    self.__LINES_COUNT += 1
-                    
-                    f.write('%s\n' % line)
-            logging.info("dump lines count: %i", self.__LINES_COUNT)
-        except IOError as e:
-            logging.exception(e)
-            
-            raise e
-        finally:
-            if (f):
-                f.close()
-            
-    def containsKeyWords(self, line):
+        self.__db_ctrl.createAttachmentsTable()
+        
+        AttachmentController(self.__db_ctrl, None).convertInline()
+        
+        self.__db_ctrl.updateAppDBVersion(2)
+        
+    def convertDbToV3(self):
+        """
+            Convert database to version 3. Create indexes on Passwords and Groups.
+        """
+        logging.info("converting database to version 3")
+        
+        self.__db_ctrl.createIndexes()
+        
+        self.__db_ctrl.updateAppDBVersion(3)
+        
+    def convertDbToV4(self):
         """
-            Check if the input line contains enabled key words.
+            Convert database to version 4. Create SearchIndex table, passwords are indexed after user login,
+            because master password is needed.
+        """
+        logging.info("converting database to version 4")
+        
+        self.__db_ctrl.createSearchIndexTable()
+        
+        self.__db_ctrl.updateAppDBVersion(4)
+        
+    def convertDbToV5(self):
+        """
+            Convert database to version 5. Rebuild Passwords table, encrypted columns can be empty and packed record
+            is added. Old rows keep format 1, they are repacked after user login, because master password is needed.
+        """
+        logging.info("converting database to version 5")
+        
+        self.__db_ctrl.rebuildTable("Passwords")
+        
+        self.__db_ctrl.updateAppDBVersion(5)
+        
+    def convertDbToV6(self):
+        """
+            Convert database to version 6. Rebuild Users table, master key derivation parameters and wrapped vault key
+            are added. Users get vault key after login, because master password is needed.
+        """
+        logging.info("converting database to version 6")
+        
+        self.__db_ctrl.rebuildTable("Users")
+        
+        self.__db_ctrl.updateAppDBVersion(6)
+        
+    def convertDbToV7(self):
+        """
+            Convert database to version 7. Search index key is derived from vault key, tokens made by master password
+            are deleted. Passwords are indexed again after user login, because vault key is needed.
+        """
+        logging.info("converting database to version 7")
+        
+        self.__db_ctrl.cursor().execute("DELETE FROM SearchIndex;")
+        
+        self.__db_ctrl.updateAppDBVersion(7)
+        
+    def checkForeignKeys(self):
+        """
+            Check foreign key constrains, they are disabled during conversion. Violations are just logged,
+            older databases could contain them.
             
-            @param line: dump line
-            @return: True on succes (contains key word), else False
+            @return: count of violations
         """
-        for kw in self.__ENABLED_KEY_WORDS:
-            if (line.find(kw) >= 0):
-                logging.info("contains key word, line: '%s'", line)
-                
-                return True
-        return False
\ No newline at end of file
+        cursor = self.__db_ctrl.cursor()
+        
+        cursor.execute("PRAGMA foreign_key_check;")
+        violations = cursor.fetchall()
+        
+        for row in violations:
+            logging.warning("foreign key violation, table: %s, row ID: %s, parent: %s", row[0], row[1], row[2])
+        
+        return len(violations)
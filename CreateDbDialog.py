@@ -168,14 +168,17 @@ class CreateDbDialog(QtGui.QDialog):
         
         self.__db_ctrl.connectDB(db_path)
         self.__db_ctrl.createTables()
-        self.__db_ctrl.insertDefRows()
         
-        logging.debug("inserting user to DB: '%s'", AppSettings.USER_NAME)
-        
-        master = str(self._passwd.text().toUtf8())
-        
-        user = UserController(self.__db_ctrl)
-        user.insertUser(AppSettings.USER_NAME, master)
+        # default rows and user at once
+        with self.__db_ctrl.transaction():
+            self.__db_ctrl.insertDefRows()
+            
+            logging.debug("inserting user to DB: '%s'", AppSettings.USER_NAME)
+            
+            master = str(self._passwd.text().toUtf8())
+            
+            user = UserController(self.__db_ctrl)
+            user.insertUser(AppSettings.USER_NAME, master)
         
         self.signalDbCreated.emit()
         self.close()
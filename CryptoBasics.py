@@ -27,7 +27,13 @@ import logging
 import os
 import binascii
 import hashlib
-from Crypto.Cipher import AES
+import hmac
+import struct
+import threading
+import time
+from collections import OrderedDict
+from Crypto.Cipher import AES, ChaCha20_Poly1305
+from Crypto.Util.strxor import strxor
 
 # password salt len in bytes
 SALT_PASSWD_LEN = 64
@@ -41,6 +47,209 @@ IV_LEN = 16
 # cipher mode
 CIPHER_MODE = AES.MODE_CBC
 
+# max blocks of item encrypted by shared ECB cipher in encryptMany(), longer items have own cipher
+ENCRYPT_MANY_BLOCKS = 8
+
+# nonce len for authenticated cipher ChaCha20-Poly1305 in bytes
+AEAD_NONCE_LEN = 12
+
+# authentication tag len of Poly1305 in bytes
+AEAD_TAG_LEN = 16
+
+# HKDF info of search index key derived from vault key, index key differs from row keys
+INDEX_KEY_INFO = "search-index"
+
+# search index token len in bytes
+INDEX_TOKEN_LEN = 16
+
+# max count of derived secret keys kept by session key cache
+KEY_CACHE_SIZE = 65536
+
+# master key derivation function, PBKDF2 with HMAC of this hash
+KDF_HASH = "sha256"
+
+# target latency of master key derivation in ms, iterations are calibrated to it
+KDF_TARGET_MSEC = 500
+
+# min iterations of master key derivation, even on fast machine
+KDF_MIN_ITER = 100000
+
+# iterations used to measure speed of this machine
+KDF_PROBE_ITER = 10000
+
+# vault key len in bytes, random key of user, wrapped by master key
+VAULT_KEY_LEN = 32
+
+# HKDF info prefix of per-row keys derived from vault key, salt of row is appended
+ROW_KEY_INFO = "row-key:"
+
+class KeyCache(object):
+    """
+        Bounded LRU cache of secret keys derived by genCipherKey() or genRowKey(). Keys derived by password are keyed
+        by password digest and salt, so other password just misses, see getPasswdDigest(). Session also holds
+        vault key of logged in user, see open(). Keys are kept in bytearrays, so they can be overwritten by clear().
+    """
+    def __init__(self, size = KEY_CACHE_SIZE):
+        """
+            @param size: max count of cached keys
+        """
+        self._size = size
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        
+        # logged in user ID, digest of its password, vault key and its HKDF pseudorandom key
+        self._user = None
+        self._digest = None
+        self._vault_key = None
+        self._vault_prk = None
+        
+        self._hits = 0
+        self._misses = 0
+        
+    def get(self, passwd, salt):
+        """
+            Return secret key of salt, key is generated on miss. Least recently used key is removed, if cache is full.
+            
+            @param passwd: user password string
+            @param salt: secret key salt string
+            @return: secret key
+        """
+        name = (getPasswdDigest(passwd), salt)
+        
+        with self._lock:
+            secret_key = self._keys.pop(name, None)
+            
+            if (secret_key is None):
+                self._misses += 1
+                secret_key = bytearray(genCipherKey(passwd, salt))
+                
+                if (len(self._keys) >= self._size):
+                    self._keys.popitem(last = False)[1][:] = bytearray(len(secret_key))
+            else:
+                self._hits += 1
+            # most recently used last
+            self._keys[name] = secret_key
+            
+            return secret_key
+        
+    def open(self, u_id, passwd, vault_key):
+        """
+            Open session of user with unwrapped vault key, per-row keys are derived from it.
+            Cache is cleared, if other user or vault key is opened.
+            
+            @param u_id: user ID
+            @param passwd: user password string
+            @param vault_key: unwrapped vault key
+        """
+        with self._lock:
+            if (u_id != self._user or self._vault_key != bytearray(vault_key)):
+                self.wipe()
+                
+                self._user = u_id
+                self._vault_key = bytearray(vault_key)
+                self._vault_prk = bytearray(genVaultPrk(str(self._vault_key)))
+            self._digest = getPasswdDigest(passwd)
+            
+    def vaultKey(self, u_id, passwd):
+        """
+            Return vault key of opened session, if it belongs to user and password.
+            
+            @param u_id: user ID
+            @param passwd: user password string
+            @return: vault key, None if session is not opened
+        """
+        with self._lock:
+            if (self._vault_key is None or u_id != self._user or getPasswdDigest(passwd) != self._digest):
+                return None
+            return str(self._vault_key)
+        
+    def indexKey(self, u_id):
+        """
+            Return search index key derived from vault key of opened session, see genIndexKey().
+            
+            @param u_id: user ID
+            @return: search index key
+            @raise ValueError: session is not opened for user
+        """
+        with self._lock:
+            if (self._vault_prk is None or u_id != self._user):
+                raise ValueError("vault key is locked, user is not logged in")
+            return genIndexKey(hmac.new(str(self._vault_prk), digestmod = hashlib.sha256))
+        
+    def getRow(self, salt):
+        """
+            Return per-row key of salt derived from vault key, key is generated on miss.
+            
+            @param salt: secret key salt string
+            @return: secret key
+            @raise ValueError: session is not opened
+        """
+        with self._lock:
+            if (self._vault_prk is None):
+                raise ValueError("vault key is locked, user is not logged in")
+            
+            # row keys differ from keys derived by master
+            name = ROW_KEY_INFO + salt
+            secret_key = self._keys.pop(name, None)
+            
+            if (secret_key is None):
+                self._misses += 1
+                secret_key = bytearray(genRowKey(hmac.new(str(self._vault_prk), digestmod = hashlib.sha256), salt))
+                
+                if (len(self._keys) >= self._size):
+                    self._keys.popitem(last = False)[1][:] = bytearray(len(secret_key))
+            else:
+                self._hits += 1
+            self._keys[name] = secret_key
+            
+            return secret_key
+        
+    def wipe(self):
+        """
+            Overwrite and remove all keys, lock must be held.
+        """
+        for secret_key in self._keys.values():
+            secret_key[:] = bytearray(len(secret_key))
+        self._keys.clear()
+        
+        for secret_key in (self._vault_key, self._vault_prk):
+            if (secret_key is not None):
+                secret_key[:] = bytearray(len(secret_key))
+        self._user = None
+        self._digest = None
+        self._vault_key = None
+        self._vault_prk = None
+        
+    def clear(self):
+        """
+            Overwrite and remove all keys, i.e. on logout or close. Counters are logged and reset.
+        """
+        with self._lock:
+            logging.info("clearing key cache, keys: %d, hits: %d, misses: %d", len(self._keys), self._hits, self._misses)
+            
+            self.wipe()
+            
+            self._hits = 0
+            self._misses = 0
+        
+    def hits(self):
+        """
+            @return: count of keys found in cache
+        """
+        return self._hits
+    
+    def misses(self):
+        """
+            @return: count of generated keys
+        """
+        return self._misses
+    
+    def __len__(self):
+        return len(self._keys)
+
+# secret keys of logged in user session
+session_keys = KeyCache()
+
 def genSalt(l):
     """
         Generates random salt using cryptographic safe random generator, but depends on OS implementation.
@@ -63,6 +272,19 @@ def genKeySalt():
     """
     return genSalt(SALT_KEY_LEN)
 
+def getPasswdDigest(passwd):
+    """
+        Calculates digest of exact password, session checks password by it, see KeyCache. Same password passed 
+        as utf8 str or unicode has same digest. Unicode forms are not normalized, keys, password hash and master key
+        are derived from exact password, so other form is other password.
+        @param passwd: user password, unicode or utf8 string
+        @return: sha256 digest bytes
+    """
+    if (isinstance(passwd, unicode)):
+        passwd = passwd.encode("utf8")
+    
+    return hashlib.sha256(passwd).digest()
+
 def getSha256(string):
     """
         Calculates sha256 checksum on input string.
@@ -119,6 +341,167 @@ def genCipherKey(passwd, salt):
     
     return binascii.unhexlify(getSha256(tmp))
 
+def getCipherKey(passwd, salt):
+    """
+        Returns secret key from session key cache, key is generated by genCipherKey() on miss.
+        @param passwd: user password string
+        @param salt: secret key salt string
+    """
+    return session_keys.get(passwd, salt)
+
+def getRowKey(salt):
+    """
+        Returns per-row secret key from session key cache, key is generated by genRowKey() on miss.
+        @param salt: secret key salt string
+    """
+    return session_keys.getRow(salt)
+
+def openSession(u_id, passwd, vault_key):
+    """
+        Opens session key cache for logged in user, see KeyCache.open().
+        @param u_id: user ID
+        @param passwd: user password string
+        @param vault_key: unwrapped vault key
+    """
+    session_keys.open(u_id, passwd, vault_key)
+
+def getSessionVaultKey(u_id, passwd):
+    """
+        Returns vault key of opened session, so it is not unwrapped again, see KeyCache.vaultKey().
+        @param u_id: user ID
+        @param passwd: user password string
+    """
+    return session_keys.vaultKey(u_id, passwd)
+
+def getSessionIndexKey(u_id):
+    """
+        Returns search index key of opened session, see KeyCache.indexKey().
+        @param u_id: user ID
+    """
+    return session_keys.indexKey(u_id)
+
+def clearSessionKeys():
+    """
+        Overwrites and removes all keys of session key cache.
+    """
+    session_keys.clear()
+
+def calibrateKdf(target_msec = KDF_TARGET_MSEC):
+    """
+        Calibrates iterations of master key derivation, so it takes target time on this machine.
+        @param target_msec: target latency in ms
+        @return: iterations, at least KDF_MIN_ITER
+    """
+    start = time.time()
+    genMasterKey(u"calibration", genKeySalt(), KDF_PROBE_ITER)
+    elapsed = max(time.time() - start, 1e-6)
+    
+    iterations = max(KDF_MIN_ITER, int(KDF_PROBE_ITER * target_msec / (elapsed * 1000.0)))
+    logging.info("KDF probe: %.1f ms, iterations: %d", elapsed * 1000.0, iterations)
+    
+    return iterations
+
+def genMasterKey(passwd, salt, iterations):
+    """
+        Generates master key from user password by PBKDF2, slow on purpose. It wraps vault key.
+        @param passwd: user password string
+        @param salt: KDF salt string
+        @param iterations: KDF iterations, see calibrateKdf()
+        @return: master key bytes
+    """
+    logging.info("generating master key, iterations: %d", iterations)
+    
+    return hashlib.pbkdf2_hmac(KDF_HASH, passwd.encode("utf8"), str(salt), iterations)
+
+def genVaultKey():
+    """
+        Generates random vault key using cryptographic safe random generator.
+        @return: vault key bytes
+    """
+    return os.urandom(VAULT_KEY_LEN)
+
+def wrapVaultKey(vault_key, master_key, header):
+    """
+        Encrypts and authenticates vault key by master key, implements encryptDataAead().
+        @param vault_key: vault key bytes
+        @param master_key: master key, see genMasterKey()
+        @param header: associated data, i.e. KDF salt
+        @return: wrapped vault key
+    """
+    return encryptDataAead(str(vault_key), master_key, str(header))
+
+def unwrapVaultKey(data, master_key, header):
+    """
+        Decrypts vault key wrapped by wrapVaultKey(), implements decryptDataAead().
+        @param data: wrapped vault key
+        @param master_key: master key, see genMasterKey()
+        @param header: associated data, same as on wrapping
+        @return: vault key bytes
+        @raise ValueError: wrong password or modified data
+    """
+    return decryptDataAead(str(data), master_key, str(header))
+
+def genVaultPrk(vault_key):
+    """
+        Generates HKDF-SHA256 pseudorandom key from vault key (extract step), with zero salt.
+        @param vault_key: vault key bytes
+        @return: pseudorandom key bytes
+    """
+    return hmac.new("\x00" * hashlib.sha256().digest_size, vault_key, hashlib.sha256).digest()
+
+def genVaultHmac(vault_key):
+    """
+        Prepares HMAC keyed by HKDF-SHA256 pseudorandom key of vault key, see genVaultPrk(), it is copied for every row key.
+        @param vault_key: vault key bytes
+        @return: HMAC object keyed by pseudorandom key
+    """
+    return hmac.new(genVaultPrk(vault_key), digestmod = hashlib.sha256)
+
+def genRowKey(vault_hmac, salt):
+    """
+        Generates per-row secret key from vault key by HKDF-SHA256 expand step, one block, info is ROW_KEY_INFO and salt.
+        Fast, cost is paid by master key derivation at login.
+        @param vault_hmac: prepared HMAC, see genVaultHmac()
+        @param salt: secret key salt string
+        @return: AES-256 key bytes
+    """
+    row_hmac = vault_hmac.copy()
+    row_hmac.update(ROW_KEY_INFO + str(salt) + struct.pack("B", 1))
+    
+    return row_hmac.digest()
+
+def genIndexKey(vault_hmac):
+    """
+        Generates search index key from vault key by HKDF-SHA256 expand step, one block, info is INDEX_KEY_INFO.
+        Key can't be derived without vault key, so index doesn't allow to test master password offline.
+        @param vault_hmac: prepared HMAC, see genVaultHmac()
+        @return: search index key bytes
+    """
+    index_hmac = vault_hmac.copy()
+    index_hmac.update(INDEX_KEY_INFO + struct.pack("B", 1))
+    
+    return index_hmac.digest()
+
+def genIndexHmac(key):
+    """
+        Prepares keyed HMAC-SHA256 for search index tokens, it is copied for every token.
+        @param key: search index key
+        @return: HMAC object
+    """
+    return hmac.new(key, digestmod = hashlib.sha256)
+
+def genIndexToken(index_hmac, data):
+    """
+        Generates search index token, keyed HMAC-SHA256 truncated to INDEX_TOKEN_LEN.
+        @param index_hmac: prepared HMAC, see genIndexHmac()
+        @param data: indexed data string
+        @return: token bytes
+    """
+    token = index_hmac.copy()
+    token.update(data)
+    
+    return token.digest()[:INDEX_TOKEN_LEN]
+
 def encryptData(plaintext, key, iv):
     """
         Encrypts data using AES-256 with CIPHER_MODE, default AES_CBC.
@@ -143,6 +526,40 @@ def decryptData(ciphertext, key, iv):
     
     return cipher.decrypt(ciphertext)
 
+def encryptDataAead(plaintext, key, header = ""):
+    """
+        Encrypts and authenticates data in one pass, using ChaCha20-Poly1305 with 256-bit key.
+        Random nonce is generated for every call.
+        
+        @param plaintext: input plaintext, any length
+        @param key: secret key
+        @param header: associated data, authenticated but not encrypted
+        @return: nonce, encrypted data and authentication tag
+    """
+    nonce = os.urandom(AEAD_NONCE_LEN)
+    
+    cipher = ChaCha20_Poly1305.new(key = key, nonce = nonce)
+    cipher.update(header)
+    
+    ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+    
+    return nonce + ciphertext + tag
+
+def decryptDataAead(data, key, header = ""):
+    """
+        Decrypts and verifies data encrypted by encryptDataAead().
+        
+        @param data: nonce, encrypted data and authentication tag
+        @param key: secret key
+        @param header: associated data, same as on encryption
+        @return: decrypted data
+        @raise ValueError: data or header were modified, or key is wrong
+    """
+    cipher = ChaCha20_Poly1305.new(key = key, nonce = data[:AEAD_NONCE_LEN])
+    cipher.update(header)
+    
+    return cipher.decrypt_and_verify(data[AEAD_NONCE_LEN:-AEAD_TAG_LEN], data[-AEAD_TAG_LEN:])
+
 def encryptDataAutoPad(plaintext, key, iv):
     """
         Encrypts and generate padding to data. Implements encryptData(), addPadding().
@@ -165,6 +582,155 @@ def decryptDataAutoPad(ciphertext, key, iv):
     """
     return remPadding(decryptData(ciphertext, key, iv))
 
+def encryptMany(items, key):
+    """
+        Encrypts many items with one key, using AES-256 with CIPHER_MODE, default AES_CBC. Like encryptDataAutoPad()
+        for every item. Items are padded into one preallocated buffer. CBC chaining is sequential just inside item,
+        so n-th blocks of all short items are encrypted by one ECB call, cipher is created just once.
+        Items longer than ENCRYPT_MANY_BLOCKS blocks are encrypted by own CBC cipher.
+        
+        @param items: list of touples (iv, plaintext), plaintext without padding
+        @param key: secret key
+        @return: list of encrypted data
+    """
+    sizes = [len(data) + AES.block_size - (len(data) % AES.block_size) for iv, data in items]
+    offsets = []
+    buf = bytearray(sum(sizes))
+    out = bytearray(len(buf))
+    
+    offset = 0
+    
+    for (iv, data), size in zip(items, sizes):
+        end = offset + size
+        padding = size - len(data)
+        
+        buf[offset:end - padding] = data
+        buf[end - padding:end] = chr(padding) * padding
+        
+        offsets.append(offset)
+        offset = end
+    
+    short = []
+    
+    for i, (iv, data) in enumerate(items):
+        if (sizes[i] > ENCRYPT_MANY_BLOCKS * AES.block_size):
+            out[offsets[i]:offsets[i] + sizes[i]] = AES.new(key, CIPHER_MODE, iv).encrypt(buf[offsets[i]:offsets[i] + sizes[i]])
+        else:
+            short.append(i)
+    
+    ecb = AES.new(key, AES.MODE_ECB)
+    block = AES.block_size
+    
+    # n-th blocks of short items, chained by IV or previous encrypted block
+    for n in range(ENCRYPT_MANY_BLOCKS):
+        short = [i for i in short if sizes[i] > n * block]
+        
+        if (not short):
+            break
+        plain = bytearray(len(short) * block)
+        chained = bytearray(len(plain))
+        
+        for j, i in enumerate(short):
+            pos = offsets[i] + n * block
+            
+            plain[j * block:(j + 1) * block] = buf[pos:pos + block]
+            chained[j * block:(j + 1) * block] = items[i][0] if (n == 0) else out[pos - block:pos]
+        
+        encrypted = ecb.encrypt(strxor(plain, chained))
+        
+        for j, i in enumerate(short):
+            pos = offsets[i] + n * block
+            
+            out[pos:pos + block] = encrypted[j * block:(j + 1) * block]
+    
+    return [str(out[offset:offset + size]) for offset, size in zip(offsets, sizes)]
+
+def decryptMany(items, key):
+    """
+        Decrypts many items encrypted by encryptDataAutoPad() or encryptMany() with one key, in CBC mode.
+        Every item can have own IV. All blocks are decrypted by one ECB call and XORed with previous ciphertext blocks
+        by one call, which is CBC decryption of every item, so cipher is created just once. Ciphertexts and IVs
+        are copied into preallocated buffers, padding is removed by slicing decrypted buffer.
+        
+        @param items: list of touples (iv, ciphertext), ciphertext must be 16*n bytes
+        @param key: secret key
+        @return: list of decrypted data without padding
+    """
+    size = sum(len(data) for iv, data in items)
+    
+    if (not size):
+        return ["" for item in items]
+    
+    ciphertext = bytearray(size)
+    chained = bytearray(size)
+    offset = 0
+    
+    for iv, data in items:
+        end = offset + len(data)
+        
+        # previous block of first block is IV
+        ciphertext[offset:end] = data
+        chained[offset:offset + AES.block_size] = iv
+        chained[offset + AES.block_size:end] = ciphertext[offset:end - AES.block_size]
+        
+        offset = end
+    
+    plain = strxor(AES.new(key, AES.MODE_ECB).decrypt(ciphertext), chained)
+    
+    results = []
+    offset = 0
+    
+    for iv, data in items:
+        end = offset + len(data)
+        padding = ord(plain[end - 1])
+        
+        results.append(plain[offset:end - padding])
+        offset = end
+    return results
+
+def encryptChunks(chunks, key, iv):
+    """
+        Encrypts chunks of data as one stream, cipher state is kept between chunks. Padding is added to last chunk.
+        Generator, yields encrypted chunks, each multiple of AES.block_size.
+        
+        @param chunks: iterable of plaintext chunks
+        @param key: secret key
+        @param iv: input vector
+    """
+    cipher = AES.new(key, CIPHER_MODE, iv)
+    rest = ""
+    
+    for chunk in chunks:
+        data = rest + chunk
+        
+        # encrypt just whole blocks, rest to next chunk
+        end = len(data) - (len(data) % AES.block_size)
+        rest = data[end:]
+        
+        if (end):
+            yield cipher.encrypt(data[:end])
+    yield cipher.encrypt(addPadding(rest))
+    
+def decryptChunks(chunks, key, iv):
+    """
+        Decrypts chunks of data encrypted by encryptChunks(). Padding is removed from last chunk.
+        Generator, yields decrypted chunks.
+        
+        @param chunks: iterable of encrypted chunks
+        @param key: secret key
+        @param iv: input vector
+    """
+    cipher = AES.new(key, CIPHER_MODE, iv)
+    prev = None
+    
+    for chunk in chunks:
+        if (prev is not None):
+            yield prev
+        prev = cipher.decrypt(chunk)
+        
+    if (prev is not None):
+        yield remPadding(prev)
+
 def addPadding(data):
     """
         Append padding to data, max padding AES.block_size.
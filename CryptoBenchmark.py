@@ -0,0 +1,366 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    MIT License
+
+    Copyright (c) 2013-2016 Frantisek Uhrecky
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import logging
+import sys
+import os
+import time
+import json
+import platform
+import argparse
+import struct
+from collections import OrderedDict
+import AppSettings
+import CryptoBasics
+import DecryptPool
+from PasswdController import PasswdController, decryptTask
+
+# payload sizes of encryption benchmarks, in bytes
+SIZES = [16, 1024, 64 * 1024, 1024 ** 2, 16 * 1024 ** 2, 100 * 1024 ** 2]
+
+# minimal time of measured loops, in seconds
+MIN_TIME = 0.2
+
+# count of measurements, best is taken
+REPEAT = 3
+
+# relative slowdown against baseline reported as regression
+TOLERANCE = 0.2
+
+# rows decrypted by worker scaling benchmark
+WORKER_ROWS = 10000
+
+# password of benchmark session, keys are random
+BENCH_PASSWD = u"benchmark"
+
+def formatSize(size):
+    """
+        Format size to short string, used in benchmark names.
+        
+        @param size: size in bytes
+        @return: i.e. 16B, 64KB, 100MB
+    """
+    for unit, scale in (("MB", 1024 ** 2), ("KB", 1024)):
+        if (size >= scale and size % scale == 0):
+            return "%d%s" % (size // scale, unit)
+    return "%dB" % size
+
+def timeLoops(func, loops):
+    """
+        Call function in loop.
+        
+        @param func: function without parameters
+        @param loops: count of calls
+        @return: elapsed time in seconds
+    """
+    start = time.time()
+    
+    for i in xrange(loops):
+        func()
+    return time.time() - start
+
+def measure(func, min_time = MIN_TIME, repeat = REPEAT):
+    """
+        Measure time of one call. Loops are doubled until they take min_time, then best of repeat runs is taken.
+        
+        @param func: function without parameters
+        @param min_time: minimal time of loops, in seconds
+        @param repeat: count of runs
+        @return: touple (seconds per call, loops)
+    """
+    loops = 1
+    
+    while (True):
+        elapsed = timeLoops(func, loops)
+        
+        if (elapsed >= min_time):
+            break
+        loops *= 2
+    
+    for i in range(repeat - 1):
+        elapsed = min(elapsed, timeLoops(func, loops))
+    return (elapsed / loops, loops)
+
+def result(func, size = None, rows = None, **kwargs):
+    """
+        Measure function and prepare result dictionary, with throughput if size or rows are known.
+        
+        @param func: function without parameters
+        @param size: payload bytes processed by one call, or None
+        @param rows: rows processed by one call, or None
+        @param kwargs: parameters of measure()
+        @return: dictionary with sec, loops and mb_s or rows_s
+    """
+    sec, loops = measure(func, **kwargs)
+    res = {"sec" : sec, "loops" : loops}
+    
+    if (size is not None):
+        res["bytes"] = size
+        res["mb_s"] = size / sec / 1024 ** 2
+    if (rows is not None):
+        res["rows"] = rows
+        res["rows_s"] = rows / sec
+    return res
+
+def benchKeys(results):
+    """
+        Key derivation and password hash benchmarks.
+        
+        @param results: dictionary, results are added
+    """
+    salt = CryptoBasics.genKeySalt()
+    salt_p = CryptoBasics.genUserPassSalt()
+    vault_hmac = CryptoBasics.genVaultHmac(CryptoBasics.genVaultKey())
+    
+    results["genCipherKey"] = result(lambda: CryptoBasics.genCipherKey(BENCH_PASSWD, salt))
+    results["getUserPassHash"] = result(lambda: CryptoBasics.getUserPassHash(salt_p, BENCH_PASSWD))
+    results["genMasterKey_%d" % CryptoBasics.KDF_MIN_ITER] = result(lambda: CryptoBasics.genMasterKey(BENCH_PASSWD, salt, 
+                                                                                                        CryptoBasics.KDF_MIN_ITER), repeat = 1)
+    results["genRowKey"] = result(lambda: CryptoBasics.genRowKey(vault_hmac, salt))
+
+def benchData(results, max_size):
+    """
+        Encryption and decryption of payloads, CBC with padding and authenticated ChaCha20-Poly1305.
+        
+        @param results: dictionary, results are added
+        @param max_size: largest payload size
+    """
+    key = CryptoBasics.genCipherKey(BENCH_PASSWD, CryptoBasics.genKeySalt())
+    iv = CryptoBasics.genIV()
+    
+    for size in [size for size in SIZES if size <= max_size]:
+        data = os.urandom(size)
+        name = formatSize(size)
+        
+        # large payloads are measured once
+        repeat = REPEAT if size < 16 * 1024 ** 2 else 1
+        
+        encrypted = CryptoBasics.encryptDataAutoPad(data, key, iv)
+        
+        if (CryptoBasics.decryptDataAutoPad(encrypted, key, iv) != data):
+            raise ValueError("CBC round-trip mismatch, size: %d" % size)
+        
+        results["encryptDataAutoPad_" + name] = result(lambda: CryptoBasics.encryptDataAutoPad(data, key, iv), size, repeat = repeat)
+        results["decryptDataAutoPad_" + name] = result(lambda: CryptoBasics.decryptDataAutoPad(encrypted, key, iv), size, repeat = repeat)
+        
+        encrypted = CryptoBasics.encryptDataAead(data, key)
+        
+        if (CryptoBasics.decryptDataAead(encrypted, key) != data):
+            raise ValueError("AEAD round-trip mismatch, size: %d" % size)
+        
+        results["encryptDataAead_" + name] = result(lambda: CryptoBasics.encryptDataAead(data, key), size, repeat = repeat)
+        results["decryptDataAead_" + name] = result(lambda: CryptoBasics.decryptDataAead(encrypted, key), size, repeat = repeat)
+        
+        # free large payloads before next size
+        data = encrypted = None
+
+def benchRows(results):
+    """
+        Row benchmarks, encryptAndPrepRow() of current format with record decryption, 
+        and decryptRow() of older format with separately encrypted columns.
+        
+        @param results: dictionary, results are added
+    """
+    passwd_ctrl = PasswdController(None, BENCH_PASSWD)
+    
+    dic = {"title" : "Benchmark title", "username" : "user@example.com", "passwd" : "correct horse battery staple", 
+           "url" : "https://example.com/login", "comment" : "Benchmark comment " * 4, "c_date" : time.time(), 
+           "m_date" : time.time(), "e_date" : time.time() + 86400, "att_name" : "attachment.txt", "expire" : "false"}
+    salt = CryptoBasics.genKeySalt()
+    iv = CryptoBasics.genIV()
+    
+    def encryptRow():
+        return passwd_ctrl.encryptAndPrepRow(dic["title"], dic["username"], dic["passwd"], dic["url"], dic["comment"], 
+                                             dic["c_date"], dic["e_date"], 1, 1, None, dic["att_name"], salt, iv, dic["expire"], 
+                                             dic["m_date"])
+    row = encryptRow()
+    record = str(row["record"])
+    
+    def decryptRecord():
+        return passwd_ctrl.decryptRecord(record, passwd_ctrl.cipherKey(salt), row["format"], salt)
+    
+    if (decryptRecord() != dic):
+        raise ValueError("record round-trip mismatch")
+    
+    results["encryptAndPrepRow"] = result(encryptRow, rows = 1)
+    results["decryptRecord"] = result(decryptRecord, rows = 1)
+    results["rowRoundTrip"] = result(lambda: passwd_ctrl.decryptRecord(str(encryptRow()["record"]), passwd_ctrl.cipherKey(salt), 
+                                                                       row["format"], salt), rows = 1)
+    
+    # older format, every column encrypted separately
+    key = passwd_ctrl.cipherKey(salt, passwd_ctrl._FORMAT_COLUMNS)
+    columns = ["title", "username", "passwd", "url", "comment", "c_date", "m_date", "e_date", "att_name", "expire"]
+    values = [struct.pack(passwd_ctrl._TIME_PRECISION, dic[col]) if col in passwd_ctrl._DATE_COLUMNS else dic[col] for col in columns]
+    legacy = dict(zip(columns, CryptoBasics.encryptMany([(iv, value) for value in values], key)))
+    
+    def decryptRow():
+        return passwd_ctrl.decryptRow(1, legacy["title"], legacy["username"], legacy["passwd"], legacy["url"], legacy["comment"], 
+                                      legacy["c_date"], legacy["m_date"], legacy["e_date"], 1, 1, None, legacy["att_name"], 
+                                      salt, iv, legacy["expire"])
+    decrypted = decryptRow()
+    
+    if ([decrypted[col] for col in columns] != [dic[col] for col in columns]):
+        raise ValueError("legacy row round-trip mismatch")
+    
+    results["decryptRow"] = result(decryptRow, rows = 1)
+
+def benchWorkers(results, workers):
+    """
+        Decryption of packed records by worker processes, see PasswdController.decryptParallel().
+        0 workers decrypt in this process.
+        
+        @param results: dictionary, results are added
+        @param workers: list of worker counts
+    """
+    passwd_ctrl = PasswdController(None, BENCH_PASSWD)
+    columns = ["title", "username", "passwd", "url"]
+    tasks = []
+    
+    for i in xrange(WORKER_ROWS):
+        salt = CryptoBasics.genKeySalt()
+        key = passwd_ctrl.cipherKey(salt)
+        dic = {"title" : "title %d" % i, "username" : "user", "passwd" : "passwd %d" % i, "url" : "https://example.com", 
+               "comment" : "", "c_date" : 0.0, "m_date" : 0.0, "e_date" : 0.0, "att_name" : "", "expire" : "false"}
+        
+        tasks.append(({"format" : passwd_ctrl._FORMAT_CURRENT, "record" : passwd_ctrl.encryptRecord(dic, key, salt)}, 
+                      str(key), "", salt, columns))
+    
+    try:
+        for count in workers:
+            if (count < 2):
+                func = lambda: [decryptTask(task) for task in tasks]
+            else:
+                func = lambda: DecryptPool.mapOrdered(decryptTask, tasks, count)
+            
+            results["decryptWorkers_%d" % count] = result(func, rows = len(tasks), repeat = 2)
+    finally:
+        DecryptPool.closePool()
+
+def runBenchmarks(max_size = SIZES[-1], workers = None):
+    """
+        Run all benchmarks in session with random vault key, session keys are cleared after.
+        
+        @param max_size: largest payload size of encryption benchmarks
+        @param workers: list of worker counts for decryption scaling, None or empty skips it
+        @return: ordered dictionary of results, name: dictionary with sec per call
+    """
+    results = OrderedDict()
+    
+    CryptoBasics.openSession(0, BENCH_PASSWD, CryptoBasics.genVaultKey())
+    
+    try:
+        benchKeys(results)
+        benchData(results, max_size)
+        benchRows(results)
+        
+        if (workers):
+            benchWorkers(results, workers)
+    finally:
+        CryptoBasics.clearSessionKeys()
+    
+    return results
+
+def compareBaseline(results, baseline, tolerance = TOLERANCE):
+    """
+        Compare results with baseline, benchmarks missing in one of them are skipped.
+        
+        @param results: dictionary of results
+        @param baseline: dictionary of baseline results
+        @param tolerance: relative slowdown reported as regression
+        @return: list of touples (name, baseline sec, current sec) of regressions
+    """
+    regressions = []
+    
+    for name in sorted(set(results) & set(baseline)):
+        if (results[name]["sec"] > baseline[name]["sec"] * (1 + tolerance)):
+            regressions.append((name, baseline[name]["sec"], results[name]["sec"]))
+    return regressions
+
+def printResults(results, baseline = None):
+    """
+        Print results table, with ratio to baseline if given.
+        
+        @param results: dictionary of results
+        @param baseline: dictionary of baseline results, or None
+    """
+    for name, res in results.items():
+        line = "%-28s %12.3f us" % (name, res["sec"] * 1e6)
+        
+        if ("mb_s" in res):
+            line += " %10.1f MB/s" % res["mb_s"]
+        elif ("rows_s" in res):
+            line += " %10.0f rows/s" % res["rows_s"]
+        else:
+            line += " " * 16
+        
+        if (baseline and name in baseline):
+            line += "  x%.2f" % (res["sec"] / baseline[name]["sec"])
+        print line
+
+def main(argv):
+    """
+        Run benchmarks from command line, write JSON results and compare them with baseline.
+        
+        @param argv: command line arguments
+        @return: exit status, 1 if there is regression
+    """
+    parser = argparse.ArgumentParser(description = "Crypto micro-benchmarks of UserPass Manager.")
+    parser.add_argument("-o", "--output", help = "write JSON results to file, use it later as baseline")
+    parser.add_argument("-b", "--baseline", help = "compare with JSON results from file")
+    parser.add_argument("-t", "--tolerance", type = float, default = TOLERANCE, help = "relative slowdown reported as regression")
+    parser.add_argument("-s", "--max-size", type = int, default = SIZES[-1], help = "largest payload in bytes")
+    parser.add_argument("-w", "--workers", default = "", help = "comma separated worker counts, i.e. 0,2,4")
+    args = parser.parse_args(argv)
+    
+    workers = [int(count) for count in args.workers.split(",") if count]
+    baseline = None
+    
+    if (args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    
+    results = runBenchmarks(args.max_size, workers)
+    
+    printResults(results, baseline)
+    
+    if (args.output):
+        with open(args.output, "w") as f:
+            json.dump({"app_version" : AppSettings.APP_VERSION, "python" : platform.python_version(), 
+                       "machine" : platform.machine(), "time" : time.time(), "results" : results}, f, indent = 2)
+    
+    if (baseline):
+        regressions = compareBaseline(results, baseline, args.tolerance)
+        
+        for name, base, sec in regressions:
+            print "regression: %s %.3f us -> %.3f us" % (name, base * 1e6, sec * 1e6)
+        
+        if (regressions):
+            return 1
+    return 0
+
+if (__name__ == "__main__"):
+    logging.basicConfig(format='[%(asctime)s] %(levelname)s::%(module)s::%(funcName)s() %(message)s', level=logging.WARNING)
+    
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,536 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    MIT License
+
+    Copyright (c) 2013-2016 Frantisek Uhrecky
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import logging
+import sys
+import os
+import time
+import struct
+import sqlite3
+import argparse
+import tempfile
+import shutil
+import unicodedata
+from collections import OrderedDict
+import AppSettings
+import CryptoBasics
+from DbController import DbController
+from ConvertDb import ConvertDb
+from UserController import UserController
+from PasswdController import PasswdController
+
+# passwords in largest database of benchmarks
+DB_ROWS = 10000
+
+# passwords in selected group of group select benchmark
+GROUP_ROWS = 100
+
+# password counts of list load query count check
+QUERY_ROWS = (10, 1000)
+
+# passwords edited one by one by DB profile benchmark, every edit is committed
+EDIT_ROWS = 100
+
+# inline attachment size of migrated database, every tenth password has it, in bytes
+MIGRATE_ATT_SIZE = 16 * 1024
+
+# attachment size of attachment benchmarks, in bytes
+ATT_SIZE = 1024 ** 2
+
+# passwords re-encrypted by master password change benchmark, every tenth has attachment
+REKEY_ROWS = 1000
+
+# attachment size of master password change benchmark, in bytes
+REKEY_ATT_SIZE = 16 * 1024
+
+# count of measurements, best is taken
+REPEAT = 3
+
+# user and password of benchmark databases
+BENCH_USER = "benchmark"
+BENCH_PASSWD = "benchmark"
+
+# master password in decomposed unicode form, keys have to be derived from exact password
+BENCH_PASSWD_NFD = unicodedata.normalize("NFD", u"b\u00e9nchmark").encode("utf8")
+
+class CountingCursor(object):
+    """
+        Cursor proxy, counts executed statements. sqlite3 of Python 2 has no trace callback.
+    """
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._count = 0
+    
+    def execute(self, *args):
+        self._count += 1
+        
+        return self._cursor.execute(*args)
+    
+    def executemany(self, *args):
+        self._count += 1
+        
+        return self._cursor.executemany(*args)
+    
+    def __iter__(self):
+        return iter(self._cursor)
+    
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+def measure(func, repeat = REPEAT):
+    """
+        Measure time of one call, best of repeat runs is taken. Database operations are long, they are not looped.
+        
+        @param func: function without parameters
+        @param repeat: count of runs
+        @return: seconds per call
+    """
+    best = None
+    
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        
+        if (best is None or elapsed < best):
+            best = elapsed
+    return best
+
+def result(func, rows = None, size = None, **kwargs):
+    """
+        Measure function and prepare result dictionary, with throughput of rows or bytes.
+        
+        @param func: function without parameters
+        @param rows: rows processed by one call, or None
+        @param size: bytes processed by one call, or None
+        @param kwargs: parameters of measure()
+        @return: dictionary with sec and rows_s or mb_s
+    """
+    sec = measure(func, **kwargs)
+    res = {"sec" : sec}
+    
+    if (rows is not None):
+        res["rows"] = rows
+        res["rows_s"] = rows / sec
+    if (size is not None):
+        res["bytes"] = size
+        res["mb_s"] = size / sec / 1024 ** 2
+    return res
+
+def genPasswords(user_id, count, grp_ids = (2, 3, 4, 5, 6), att_rows = 0, att_size = ATT_SIZE):
+    """
+        Generate synthetic passwords for insertPasswords(), spread over groups.
+        
+        @param user_id: user ID
+        @param count: count of passwords
+        @param grp_ids: IDs of groups, passwords are spread over them in turn
+        @param att_rows: count of first passwords with random attachment
+        @param att_size: attachment size in bytes
+        @return: list of dictionaries
+    """
+    now = time.time()
+    
+    return [{"title" : "title%d" % i, "username" : "username%d" % i, "passwd" : "passwd%d" % i, "url" : "https://example.com/%d" % i, 
+             "comment" : "comment", "c_date" : now, "e_date" : now, "grp_id" : grp_ids[i % len(grp_ids)], "user_id" : user_id, 
+             "attachment" : os.urandom(att_size) if i < att_rows else None, "att_name" : "att%d.bin" % i if i < att_rows else "", 
+             "expire" : "false"} for i in xrange(count)]
+
+def insertRows(passwd_ctrl, user_id, count, grp_ids = (2, 3, 4, 5, 6)):
+    """
+        Insert synthetic passwords at once, spread over groups.
+        
+        @param passwd_ctrl: PasswdController of user
+        @param user_id: user ID
+        @param count: count of passwords
+        @param grp_ids: IDs of groups, passwords are spread over them in turn
+    """
+    passwd_ctrl.insertPasswords(genPasswords(user_id, count, grp_ids))
+
+def createDb(path, rows = 0, att_rows = 0, att_size = ATT_SIZE, passwd = BENCH_PASSWD):
+    """
+        Create benchmark database with user and its passwords.
+        
+        @param path: database file path
+        @param rows: count of passwords
+        @param att_rows: count of passwords with attachment
+        @param att_size: attachment size in bytes
+        @param passwd: master password of user, utf8 string
+        @return: touple (DbController, logged UserModel)
+    """
+    db_ctrl = DbController()
+    db_ctrl.connectDB(path)
+    db_ctrl.createTables()
+    db_ctrl.insertDefRows()
+    
+    UserController(db_ctrl).insertUser(BENCH_USER, passwd)
+    user = UserController(db_ctrl).selectByNameMaster(BENCH_USER, passwd)
+    
+    PasswdController(db_ctrl, user._master).insertPasswords(genPasswords(user._id, rows, att_rows = att_rows, att_size = att_size))
+    
+    return (db_ctrl, user)
+
+def downgradeDb(db_ctrl, user):
+    """
+        Change benchmark database to version 0 layout. Tables and indexes of later versions are dropped, passwords are
+        stored in format 1, every column encrypted separately by key derived from master password. Every tenth password
+        gets inline attachment of random bytes, encrypted by same key.
+        
+        @param db_ctrl: DB controller of database created by createDb()
+        @param user: logged user, owner of passwords
+    """
+    cursor = db_ctrl.cursor()
+    passwords = PasswdController(db_ctrl, user._master).selectByUserId(user._id, PasswdController._ROW_COLUMNS)
+    rows = []
+    
+    for passwd in passwords:
+        secret_key = CryptoBasics.genCipherKey(user._master, passwd._salt)
+        values = [passwd._title, passwd._username, passwd._passwd, passwd._url, passwd._comment, 
+                  struct.pack("<d", passwd._c_date), struct.pack("<d", passwd._m_date), struct.pack("<d", passwd._e_date), 
+                  passwd._att_name, passwd._expire]
+        
+        row = dict(zip(PasswdController._RECORD_COLUMNS, 
+                       [sqlite3.Binary(value) for value in CryptoBasics.encryptMany([(passwd._iv, value) for value in values], secret_key)]))
+        row["id"] = passwd._id
+        row["attachment"] = None
+        
+        if (passwd._id % 10 == 0):
+            row["attachment"] = sqlite3.Binary(CryptoBasics.encryptDataAutoPad(os.urandom(MIGRATE_ATT_SIZE), secret_key, passwd._iv))
+        rows.append(row)
+    
+    with db_ctrl.transaction():
+        cursor.execute("DROP TABLE Attachments;")
+        cursor.execute("DROP TABLE SearchIndex;")
+        
+        for index in ("PasswordsUserGrp", "PasswordsGrp", "GroupsIcon"):
+            cursor.execute("DROP INDEX %s;" % index)
+        cursor.executemany("""UPDATE Passwords SET title = :title, username = :username, passwd = :passwd, url = :url, 
+            comment = :comment, c_date = :c_date, m_date = :m_date, e_date = :e_date, att_name = :att_name, expire = :expire, 
+            attachment = :attachment, format = 1, record = NULL WHERE id = :id;""", rows)
+        
+        db_ctrl.updateAppDBVersion(0)
+
+def migrate(db_ctrl, passwd = BENCH_PASSWD):
+    """
+        Convert database to current version and upgrade records of benchmark user after login, like first start
+        of new version.
+        
+        @param db_ctrl: DB controller of database changed by downgradeDb()
+        @param passwd: master password of user, utf8 string
+        @return: count of upgraded passwords
+    """
+    ConvertDb(db_ctrl).convert()
+    
+    user = UserController(db_ctrl).selectByNameMaster(BENCH_USER, passwd)
+    
+    return PasswdController(db_ctrl, user._master).upgradeRecords(user._id)
+
+def benchMigrate(results, tmp_dir, rows = DB_ROWS):
+    """
+        Database migration benchmark, from version 0 with passwords in format 1 to current version and format.
+        Conversion and record upgrade run once, database is changed by them.
+        
+        @param results: dictionary, results are added
+        @param tmp_dir: directory for benchmark database
+        @param rows: count of passwords
+        @throws ValueError: if database is not converted to current version or passwords are not upgraded
+    """
+    db_ctrl, user = createDb(os.path.join(tmp_dir, "migrate.db"), rows)
+    
+    try:
+        downgradeDb(db_ctrl, user)
+        
+        CryptoBasics.clearSessionKeys()
+        
+        upgraded = []
+        
+        results["migrate_%d" % rows] = result(lambda: upgraded.append(migrate(db_ctrl)), rows, repeat = 1)
+        
+        if (db_ctrl.getAppDBVersion() != AppSettings.APP_DB_VERSION):
+            raise ValueError("Database is not converted to current version.")
+        
+        if (upgraded != [rows]):
+            raise ValueError("Passwords are not upgraded, upgraded: %s of: %d." % (upgraded, rows))
+    finally:
+        db_ctrl.disconnectDB()
+
+def checkPasswdForms(tmp_dir, rows = 100):
+    """
+        Check that keys are derived from exact master password. User with master password in NFD form has passwords
+        in format 1, keys of format 1 are derived from master password, all of them have to be upgraded after login.
+        Same master password in NFC form is other password, it can't log in.
+        
+        @param tmp_dir: directory for check database
+        @param rows: count of passwords
+        @throws ValueError: if passwords are not upgraded or master password in other form is accepted
+    """
+    db_ctrl, user = createDb(os.path.join(tmp_dir, "forms.db"), rows, passwd = BENCH_PASSWD_NFD)
+    
+    try:
+        downgradeDb(db_ctrl, user)
+        
+        CryptoBasics.clearSessionKeys()
+        
+        upgraded = migrate(db_ctrl, BENCH_PASSWD_NFD)
+        
+        if (upgraded != rows):
+            raise ValueError("Passwords of NFD master password are not upgraded, upgraded: %d of: %d." % (upgraded, rows))
+        
+        # session is opened by NFD form
+        nfc = unicodedata.normalize("NFC", BENCH_PASSWD_NFD.decode("utf8")).encode("utf8")
+        
+        if (UserController(db_ctrl).selectByNameMaster(BENCH_USER, nfc)):
+            raise ValueError("Master password in other unicode form is accepted.")
+    finally:
+        db_ctrl.disconnectDB()
+
+def checkQueryCount(tmp_dir, sizes = QUERY_ROWS):
+    """
+        Check that list load is O(1) statements. Statements of selectByUserId() are counted by cursor proxy, 
+        for every vault size, with group, icon and user of passwords accessed. Counts have to be same.
+        
+        @param tmp_dir: directory for benchmark databases
+        @param sizes: password counts of vaults
+        @return: list of statement counts
+        @throws ValueError: if statement count grows with vault size
+    """
+    counts = []
+    
+    for size in sizes:
+        db_ctrl, user = createDb(os.path.join(tmp_dir, "query_%d.db" % size), size)
+        
+        try:
+            # models are loaded from DB, not from identity map
+            db_ctrl.invalidateModel()
+            cursor = db_ctrl._cursor = CountingCursor(db_ctrl.cursor())
+            
+            for passwd in PasswdController(db_ctrl, user._master).selectByUserId(user._id, ["title"]):
+                (passwd._title, passwd._grp._name, passwd._grp._icon._name, passwd._user._name)
+            
+            db_ctrl._cursor = cursor._cursor
+            counts.append(cursor._count)
+        finally:
+            db_ctrl.disconnectDB()
+    
+    if (len(set(counts)) != 1):
+        raise ValueError("Statements of list load grow with vault size: %s" % dict(zip(sizes, counts)))
+    return counts
+
+def benchGroupSelect(results, tmp_dir, rows = DB_ROWS):
+    """
+        Group select benchmarks by vault size. Selected group keeps GROUP_ROWS passwords while vault grows,
+        titles are decrypted, as in passwords table. Group is selected by index, so time should stay flat.
+        
+        @param results: dictionary, results are added
+        @param tmp_dir: directory for benchmark database
+        @param rows: count of passwords in largest vault
+    """
+    db_ctrl, user = createDb(os.path.join(tmp_dir, "group.db"))
+    
+    try:
+        passwd_ctrl = PasswdController(db_ctrl, user._master)
+        select = lambda: [passwd._title for passwd in passwd_ctrl.selectByUserGrpId(user._id, 1, ["title"])]
+        
+        insertRows(passwd_ctrl, user._id, GROUP_ROWS, (1, ))
+        size = GROUP_ROWS
+        
+        for vault in (rows // 100, rows // 10, rows):
+            if (vault <= size):
+                continue
+            insertRows(passwd_ctrl, user._id, vault - size)
+            size = vault
+            
+            results["groupSelect_%d" % size] = result(select, GROUP_ROWS)
+    finally:
+        db_ctrl.disconnectDB()
+
+def benchBulk(results, tmp_dir, rows = DB_ROWS):
+    """
+        Bulk insert and update benchmarks, passwords are encrypted as batch and written in one transaction.
+        
+        @param results: dictionary, results are added
+        @param tmp_dir: directory for benchmark database
+        @param rows: count of passwords in batch
+    """
+    db_ctrl, user = createDb(os.path.join(tmp_dir, "bulk.db"))
+    
+    try:
+        passwd_ctrl = PasswdController(db_ctrl, user._master)
+        passwords = genPasswords(user._id, rows)
+        
+        results["bulkInsert_%d" % rows] = result(lambda: passwd_ctrl.insertPasswords(passwords), rows)
+        
+        p_ids = [passwd._id for passwd in passwd_ctrl.selectByUserId(user._id, ["title"])][:rows]
+        updates = [dict(passwd, p_id = p_id) for p_id, passwd in zip(p_ids, passwords)]
+        
+        results["bulkUpdate_%d" % rows] = result(lambda: passwd_ctrl.updatePasswords(updates), rows)
+    finally:
+        db_ctrl.disconnectDB()
+
+def benchProfiles(results, tmp_dir, rows = EDIT_ROWS):
+    """
+        DB profile benchmarks, passwords are edited one by one and every edit is committed, 
+        so cost of commit in every profile is compared, see AppSettings.DB_PROFILES.
+        
+        @param results: dictionary, results are added
+        @param tmp_dir: directory for benchmark databases
+        @param rows: count of edited passwords
+    """
+    for name in sorted(AppSettings.DB_PROFILES):
+        db_ctrl, user = createDb(os.path.join(tmp_dir, "profile_%s.db" % name), rows)
+        
+        try:
+            db_ctrl.applyProfile(AppSettings.DB_PROFILES[name])
+            
+            passwd_ctrl = PasswdController(db_ctrl, user._master)
+            p_ids = [passwd._id for passwd in passwd_ctrl.selectByUserId(user._id, ["title"])]
+            
+            def edit():
+                for p_id in p_ids:
+                    passwd_ctrl.updatePasswd(p_id, "title", "username", "passwd", "https://example.com", "comment", time.time(), 2, 
+                                             user._id, None, "", "false")
+            
+            results["edit_%s" % name] = result(edit, len(p_ids))
+        finally:
+            db_ctrl.disconnectDB()
+
+def benchAttachment(results, tmp_dir, size = ATT_SIZE):
+    """
+        Attachment store and read benchmarks. Round-trip is checked first, attachment is stored, read back, 
+        then updated and read again.
+        
+        @param results: dictionary, results are added
+        @param tmp_dir: directory for benchmark database
+        @param size: attachment size in bytes
+        @throws ValueError: if attachment read back differs
+    """
+    db_ctrl, user = createDb(os.path.join(tmp_dir, "attachment.db"), 1)
+    
+    try:
+        passwd_ctrl = PasswdController(db_ctrl, user._master)
+        p_id = passwd_ctrl.selectByUserId(user._id, ["title"])[0]._id
+        data = [os.urandom(size), os.urandom(size)]
+        
+        def store(i):
+            passwd_ctrl.updatePasswd(p_id, "title", "username", "passwd", "https://example.com", "comment", time.time(), 2, 
+                                     user._id, data[i], "att.bin", "false")
+        
+        def read():
+            return passwd_ctrl.selectById(p_id)[0]._attachment
+        
+        # round-trip, update replaces stored attachment
+        for i in range(len(data)):
+            store(i)
+            
+            if (read() != data[i]):
+                raise ValueError("Attachment read back differs from stored one.")
+        
+        results["attachmentStore_%dKB" % (size // 1024)] = result(lambda: store(0), size = size)
+        results["attachmentRead_%dKB" % (size // 1024)] = result(read, size = size)
+    finally:
+        db_ctrl.disconnectDB()
+
+def benchRekey(results, tmp_dir, rows = REKEY_ROWS):
+    """
+        Master password change benchmark, passwords and attachments are re-encrypted by new vault key.
+        Session is opened with new vault key after every run, as by LoginController.changeMaster().
+        
+        @param results: dictionary, results are added
+        @param tmp_dir: directory for benchmark database
+        @param rows: count of passwords
+    """
+    db_ctrl, user = createDb(os.path.join(tmp_dir, "rekey.db"), rows, rows // 10, REKEY_ATT_SIZE)
+    
+    try:
+        passwd_ctrl = PasswdController(db_ctrl, user._master)
+        
+        def rekey():
+            vault_key = CryptoBasics.genVaultKey()
+            
+            with db_ctrl.transaction():
+                passwd_ctrl.rekeyPasswords(user._id, vault_key, workers = 0)
+            
+            CryptoBasics.openSession(user._id, user._master, vault_key)
+        
+        results["rekey_%d" % rows] = result(rekey, rows)
+    finally:
+        db_ctrl.disconnectDB()
+
+def runBenchmarks(rows = DB_ROWS):
+    """
+        Run all benchmarks on databases in temporary directory, it is removed after. List load query count and key
+        derivation from exact master password are checked first.
+        
+        @param rows: count of passwords in largest database
+        @return: ordered dictionary of results, name: dictionary with sec per call
+    """
+    results = OrderedDict()
+    tmp_dir = tempfile.mkdtemp(prefix = "upm_bench_")
+    
+    try:
+        checkQueryCount(tmp_dir)
+        checkPasswdForms(tmp_dir)
+        
+        benchGroupSelect(results, tmp_dir, rows)
+        benchBulk(results, tmp_dir, rows)
+        benchProfiles(results, tmp_dir)
+        benchMigrate(results, tmp_dir, rows)
+        benchAttachment(results, tmp_dir)
+        benchRekey(results, tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir, True)
+    
+    return results
+
+def printResults(results):
+    """
+        Print results table.
+        
+        @param results: dictionary of results
+    """
+    for name, res in results.items():
+        if ("mb_s" in res):
+            print "%-28s %12.3f ms %10.1f MB/s" % (name, res["sec"] * 1e3, res["mb_s"])
+        else:
+            print "%-28s %12.3f ms %10.0f rows/s" % (name, res["sec"] * 1e3, res["rows_s"])
+
+def main(argv):
+    """
+        Run benchmarks from command line.
+        
+        @param argv: command line arguments
+        @return: exit status
+    """
+    parser = argparse.ArgumentParser(description = "Database benchmarks of UserPass Manager.")
+    parser.add_argument("-r", "--rows", type = int, default = DB_ROWS, help = "passwords in largest benchmark database")
+    args = parser.parse_args(argv)
+    
+    printResults(runBenchmarks(args.rows))
+    
+    return 0
+
+if (__name__ == "__main__"):
+    logging.basicConfig(format='[%(asctime)s] %(levelname)s::%(module)s::%(funcName)s() %(message)s', level=logging.WARNING)
+    
+    sys.exit(main(sys.argv[1:]))
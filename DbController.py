@@ -25,11 +25,15 @@
 """
 import sqlite3
 import logging
+import contextlib
+import threading
 from GroupController import GroupController
 from IconController import IconController
 import os
 import AppSettings
 from ConvertDb import ConvertDb
+from ChangeEvent import ChangeEvent
+import BackupController
 import InfoMsgBoxes
 from TransController import tr
 
@@ -37,17 +41,63 @@ class DbController:
     """
         Implements basic DB initialitation.
     """
+    # allowed connection profile PRAGMAs and their values, empty means integer
+    __PROFILE_PRAGMAS = {"journal_mode" : ["DELETE", "TRUNCATE", "PERSIST", "WAL", "MEMORY"],
+                         "synchronous" : ["OFF", "NORMAL", "FULL", "EXTRA"],
+                         "temp_store" : ["DEFAULT", "FILE", "MEMORY"],
+                         "mmap_size" : [], "cache_size" : [], "busy_timeout" : []}
+    
+    # tables in creation order, name and create statement, Attachments and SearchIndex are created by own methods
+    # Passwords: format 1 rows have every column encrypted separately, format 2 rows have all in packed record,
+    # format 3 rows have packed record authenticated by ChaCha20-Poly1305, format 4 rows too, but by per-row key
+    # derived from user vault key
+    # Users: vault_key is random key wrapped by master key derived by PBKDF2 with kdf_salt and kdf_iter,
+    # users without it have just passwd hash, they are upgraded after login
+    __TABLES = [("Users", """CREATE TABLE Users(id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, 
+                    passwd TEXT NOT NULL, salt_p TEXT NOT NULL,
+                    kdf_salt TEXT, kdf_iter INTEGER, vault_key BLOB);"""),
+                ("Icons", """CREATE TABLE Icons(id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, icon BLOB);"""),
+                ("Version", """CREATE TABLE Version(id INTEGER PRIMARY KEY, version INTEGER UNIQUE NOT NULL);"""),
+                ("Groups", """CREATE TABLE Groups(id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, 
+                    description TEXT, 
+                    icon_id INTEGER DEFAULT 0 REFERENCES Icons(id) ON DELETE SET DEFAULT);"""),
+                ("Passwords", """CREATE TABLE Passwords(id INTEGER PRIMARY KEY, title BLOB, username BLOB,
+                    passwd BLOB, url BLOB, comment BLOB, 
+                    c_date BLOB, m_date BLOB, e_date BLOB,
+                    grp_id INTEGER REFERENCES Groups(id) ON DELETE CASCADE, 
+                    user_id INTEGER REFERENCES Users(id) ON DELETE CASCADE, 
+                    attachment BLOB, att_name BLOB,
+                    salt TEXT, iv BLOB, expire TEXT,
+                    format INTEGER NOT NULL DEFAULT 1, record BLOB);""")]
+    
     def __init__(self, database = None):
         """
             If DB file is specified, then create DB, and tables if did not exist.
         """
+        # main connection, used by thread which connected DB, usually GUI thread
         self._cursor = None
         self._database = database
         self._connection = None
+        self._thread = None
+        
+        # connection pool, other threads get own connection, see connection()
+        self._local = threading.local()
+        self._pool = []
+        self._pool_lock = threading.Lock()
+        
+        # serializes write transactions of all threads
+        self._write_lock = threading.RLock()
         
         # whether DB file existed
         self._existed = False
         
+        # identity map, one shared model object per table row ID, valid for current connection, used by all threads
+        self._models = {}
+        self._models_lock = threading.Lock()
+        
+        # called with list of ChangeEvent objects after commit, see addChangeListener()
+        self._listeners = []
+        
         if (database):
             self.connectDB()
             
@@ -73,9 +123,12 @@ class DbController:
                 # turn on dictionary mode
                 self._connection.row_factory = sqlite3.Row
                 self._cursor = self._connection.cursor()
+            self._thread = threading.current_thread()
             logging.info("'%s' successfully opened.", self._database)
             logging.info("SQLite version %s", self.getDBVersion())
             
+            self.applyProfile(AppSettings.readDbProfile())
+            
             # if is old, check for conversion
             if (self._existed):
                 # check version 
@@ -88,6 +141,29 @@ class DbController:
             logging.exception(e)
             raise e
     
+    def applyProfile(self, profile):
+        """
+            Apply connection profile, set PRAGMA values. Have to be called out of transaction.
+            
+            @param profile: dictionary, PRAGMA name and value, see AppSettings.DB_PROFILES
+        """
+        for pragma, value in sorted(profile.items()):
+            if (pragma not in self.__PROFILE_PRAGMAS):
+                logging.warning("unknown PRAGMA: '%s'", pragma)
+                
+                continue
+            # PRAGMA value can't be bound, so check it
+            value = str(value).upper()
+            
+            if (not (value in self.__PROFILE_PRAGMAS[pragma] or (not self.__PROFILE_PRAGMAS[pragma] and value.lstrip("-").isdigit()))):
+                logging.warning("wrong PRAGMA value, %s: '%s'", pragma, value)
+                
+                continue
+            
+            self.cursor().execute("PRAGMA %s = %s;" % (pragma, value))
+            
+            logging.info("PRAGMA %s = %s", pragma, value)
+    
     def checkVersion(self):
         """
             Check opened database version, if neccessaary and posible, then convert to current.
@@ -97,9 +173,11 @@ class DbController:
         if ((version == False) or (version < AppSettings.APP_DB_VERSION)):
             # need to be converted
             logging.info("need to convert from version: '%s'", version)
-            converter = ConvertDb(self)
             
-            converter.convertDbToV1(self._database)
+            # backup of old version have to be finished
+            BackupController.waitForBackups()
+            
+            ConvertDb(self).convert()
             
             InfoMsgBoxes.showInfoMsg(tr("Database successfully converted to new version."))
     
@@ -110,18 +188,364 @@ class DbController:
         if (self._connection):
             logging.info("disconnecting DB: '%s'", self._database)
             
+            with self._pool_lock:
+                for connection in self._pool:
+                    connection.close()
+                self._pool = []
+            
             self._connection.close()
             del self._connection
             self._connection = None
+            self._cursor = None
+            self._thread = None
+            self._local = threading.local()
+            
+            self.invalidateModel()
+            
+    def connection(self):
+        """
+            Return connection of current thread. Thread which connected DB uses main connection,
+            other threads get own connection from pool, opened on first use. Pool connections are read only,
+            writes have to be done in transaction(), which serializes writers.
+            
+            @return: sqlite3 connection
+        """
+        if (threading.current_thread() is self._thread):
+            return self._connection
+        
+        connection = getattr(self._local, "connection", None)
+        
+        if (not connection):
+            if (not self._connection):
+                raise sqlite3.ProgrammingError("not connected to DB")
+            try:
+                # closed from disconnectDB(), can be other thread
+                connection = sqlite3.connect(self._database, check_same_thread = False)
+                connection.row_factory = sqlite3.Row
+                
+                self._local.connection = connection
+                self._local.cursor = connection.cursor()
+                
+                with self._pool_lock:
+                    self._pool.append(connection)
+                logging.info("pool connection opened, thread: '%s', connections: %d", threading.current_thread().name, len(self._pool))
+                
+                self.applyProfile(AppSettings.readDbProfile())
+                self.enForeignKey()
+                self.cursor().execute("PRAGMA query_only = ON;")
+            except sqlite3.Error as e:
+                logging.exception(e)
+                
+                self.releaseConnection()
+                
+                raise e
+        return connection
+    
+    def cursor(self):
+        """
+            Return shared cursor of current thread connection, see connection().
+            
+            @return: sqlite3 cursor
+        """
+        if (threading.current_thread() is self._thread):
+            return self._cursor
+        
+        self.connection()
+        
+        return self._local.cursor
+    
+    def releaseConnection(self):
+        """
+            Close pool connection of current thread, worker thread should call it when finishes.
+        """
+        connection = getattr(self._local, "connection", None)
+        
+        if (connection):
+            with self._pool_lock:
+                if (connection in self._pool):
+                    self._pool.remove(connection)
+            
+            connection.close()
+            
+            self._local.connection = None
+            self._local.cursor = None
+            
+            logging.info("pool connection closed, thread: '%s'", threading.current_thread().name)
+    
+    def transactions(self):
+        """
+            Return opened transaction levels of current thread, see transaction().
             
+            @return: list of [savepoint name, rollback only, count of changes recorded before]
+        """
+        if (not hasattr(self._local, "transactions")):
+            self._local.transactions = []
+        
+        return self._local.transactions
+            
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+            Transaction context, all changes inside are commited at once on exit, or rolled back on exception.
+            Controllers join opened transaction, their commit() is postponed to end of transaction.
+            Nested transaction is savepoint, rolled back without outer transaction.
+            
+            Usage: with db_ctrl.transaction(): ...
+        """
+        if (not self.transactions()):
+            # one writer at time
+            self._write_lock.acquire()
+            
+            try:
+                # finish implicit transaction, and handle transaction manually
+                self.connection().commit()
+                self.connection().isolation_level = None
+                
+                if (threading.current_thread() is not self._thread):
+                    self.cursor().execute("PRAGMA query_only = OFF;")
+                self.cursor().execute("BEGIN IMMEDIATE;")
+            except:
+                self.endWrite()
+                
+                raise
+            name = None
+        else:
+            name = "level_%d" % len(self.transactions())
+            
+            self.cursor().execute("SAVEPOINT %s;" % name)
+        self.transactions().append([name, False, len(self.changes())])
+        
+        logging.debug("transaction level: %d started", len(self.transactions()))
+        
+        try:
+            yield self
+        except:
+            self.endTransaction(False)
+            
+            raise
+        else:
+            # some controller rolled back
+            if (self.transactions()[-1][1]):
+                self.endTransaction(False)
+                
+                raise sqlite3.DatabaseError("transaction rolled back")
+            self.endTransaction(True)
+    
+    def endTransaction(self, commit):
+        """
+            End innermost transaction level, opened by transaction().
+            
+            @param commit: commit or release savepoint if True, else rollback
+        """
+        level = self.transactions().pop()
+        name = level[0]
+        
+        logging.debug("transaction level: %d ended, commit: %s", len(self.transactions()) + 1, commit)
+        
+        if (not commit):
+            # loaded models can be from rolled back changes
+            self.invalidateModel()
+            
+            self.discardChanges(level[2])
+        
+        if (name):
+            if (not commit):
+                self.cursor().execute("ROLLBACK TO %s;" % name)
+            self.cursor().execute("RELEASE %s;" % name)
+        else:
+            try:
+                if (commit):
+                    self.cursor().execute("COMMIT;")
+                else:
+                    self.cursor().execute("ROLLBACK;")
+            except:
+                self.discardChanges()
+                
+                raise
+            finally:
+                self.endWrite()
+            
+            self.publishChanges()
+    
+    def dataVersion(self):
+        """
+            Return data version of current thread connection. It changes, when other connection commits changes to database,
+            i.e. other app instance, changes commited by this connection don't change it.
+            
+            @return: data version number
+        """
+        try:
+            self.cursor().execute("PRAGMA data_version;")
+            
+            return self.cursor().fetchone()[0]
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+    
+    def endWrite(self):
+        """
+            Back to implicit transactions, after outer transaction end. Release writer lock.
+        """
+        try:
+            self.connection().isolation_level = ""
+            
+            if (threading.current_thread() is not self._thread):
+                self.cursor().execute("PRAGMA query_only = ON;")
+        finally:
+            self._write_lock.release()
+    
+    def commit(self):
+        """
+            Commit changes, if is transaction opened by transaction(), commit is done at its end.
+        """
+        if (not self.transactions()):
+            self.connection().commit()
+            
+            self.publishChanges()
+            
+    def rollback(self):
+        """
+            Rollback changes, if is transaction opened by transaction(), whole transaction level will be rolled back.
+        """
+        if (self.transactions()):
+            logging.warning("transaction level: %d marked to rollback", len(self.transactions()))
+            
+            self.transactions()[-1][1] = True
+        else:
+            self.connection().rollback()
+            
+            self.discardChanges()
+    
+    def changes(self):
+        """
+            Return changes of current thread recorded, but not commited yet, see recordChange().
+            
+            @return: list of ChangeEvent objects
+        """
+        if (not hasattr(self._local, "changes")):
+            self._local.changes = []
+        
+        return self._local.changes
+    
+    def recordChange(self, table, change, ids):
+        """
+            Record changed rows. Listeners get them after commit, rolled back changes are discarded.
+            Controllers have to record change before commit().
+            
+            @param table: table name, i.e. Passwords
+            @param change: change type, ChangeEvent.INSERTED, UPDATED or DELETED
+            @param ids: list of changed row IDs
+        """
+        if (ids):
+            self.changes().append(ChangeEvent(table, change, ids))
+    
+    def discardChanges(self, index = 0):
+        """
+            Discard not commited changes.
+            
+            @param index: changes recorded from index are discarded, 0 all
+        """
+        del self.changes()[index:]
+    
+    def publishChanges(self):
+        """
+            Pass commited changes to listeners. Listeners are called in commiting thread.
+        """
+        changes = self.changes()[:]
+        self.discardChanges()
+        
+        if (not changes):
+            return
+        
+        logging.debug("publishing changes: %d", len(changes))
+        
+        for listener in self._listeners[:]:
+            try:
+                listener(changes)
+            except Exception as e:
+                # changes are already commited
+                logging.exception(e)
+    
+    def addChangeListener(self, listener):
+        """
+            Add listener of commited changes.
+            
+            @param listener: callable, gets list of ChangeEvent objects
+        """
+        self._listeners.append(listener)
+    
+    def removeChangeListener(self, listener):
+        """
+            Remove listener of commited changes.
+            
+            @param listener: callable added by addChangeListener()
+        """
+        if (listener in self._listeners):
+            self._listeners.remove(listener)
+    
+    def selectModel(self, table, m_id):
+        """
+            Return shared model object from identity map.
+            
+            @param table: table name, i.e. Groups
+            @param m_id: row ID
+            
+            @return: model object, if not mapped None
+        """
+        with self._models_lock:
+            return self._models.get(table, {}).get(m_id)
+    
+    def selectModels(self, table):
+        """
+            Return all shared model objects of table from identity map.
+            
+            @param table: table name, i.e. Groups
+            
+            @return: list of model objects
+        """
+        with self._models_lock:
+            return list(self._models.get(table, {}).values())
+    
+    def storeModel(self, table, m_id, model):
+        """
+            Store model object to identity map.
+            
+            @param table: table name, i.e. Groups
+            @param m_id: row ID
+            @param model: model object
+        """
+        with self._models_lock:
+            self._models.setdefault(table, {})[m_id] = model
+        
+    def invalidateModel(self, table = None, m_id = None):
+        """
+            Remove model objects from identity map.
+            
+            @param table: table name, if None whole map is cleared
+            @param m_id: row ID, if None all table models are removed
+        """
+        with self._models_lock:
+            if (table is None):
+                logging.debug("clearing identity map")
+                
+                self._models = {}
+            elif (m_id is None):
+                logging.debug("clearing identity map table: '%s'", table)
+                
+                self._models.pop(table, None)
+            else:
+                logging.debug("removing from identity map table: '%s', ID: %s", table, m_id)
+                
+                self._models.get(table, {}).pop(m_id, None)
     
     def getDBVersion(self):
         """ 
             Returns SQLite version 
         """
-        self._cursor.execute('SELECT SQLITE_VERSION()')
+        self.cursor().execute('SELECT SQLITE_VERSION()')
     
-        return self._cursor.fetchone()[0]
+        return self.cursor().fetchone()[0]
     
     def getAppDBVersion(self):
         """
@@ -129,9 +553,9 @@ class DbController:
         """
         if (self._connection):
             try:
-                self._cursor.execute("SELECT version FROM Version;")
+                self.cursor().execute("SELECT version FROM Version;")
                 
-                row = self._cursor.fetchone()
+                row = self.cursor().fetchone()
                 
                 if (row):
                     return int(row["version"])
@@ -151,74 +575,147 @@ class DbController:
             Icons table: contains icons for groups
             Groups table: groups of passwords i.e. (Page, SSH, E-Mail, PC and user defined)
             Password table: holds usernames, passwords and their metada in ecrypted form
+            Attachments table: password attachments, encrypted in chunks
+            SearchIndex table: blind search tokens of passwords
         """ 
         try:
-            self._cursor.executescript("""
-                DROP TABLE IF EXISTS Users;
-                CREATE TABLE Users(id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, 
-                    passwd TEXT NOT NULL, salt_p TEXT NOT NULL);
-                
-                DROP TABLE IF EXISTS Icons;
-                CREATE TABLE Icons(id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, icon BLOB);
-                
-                DROP TABLE IF EXISTS Version;
-                CREATE TABLE Version(id INTEGER PRIMARY KEY, version INTEGER UNIQUE NOT NULL);
+            with self.transaction():
+                for table in self.__TABLES:
+                    self.cursor().execute("DROP TABLE IF EXISTS %s;" % table[0])
+                    self.cursor().execute(table[1])
+                self.cursor().execute("DROP TABLE IF EXISTS Attachments;")
+                self.cursor().execute("DROP TABLE IF EXISTS SearchIndex;")
                 
-                DROP TABLE IF EXISTS Groups;
-                CREATE TABLE Groups(id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, 
-                    description TEXT, 
-                    icon_id INTEGER DEFAULT 0 REFERENCES Icons(id) ON DELETE SET DEFAULT);
-                
-                DROP TABLE IF EXISTS Passwords;
-                CREATE TABLE Passwords(id INTEGER PRIMARY KEY, title BLOB NOT NULL, username BLOB NOT NULL,
-                    passwd BLOB NOT NULL, url BLOB, comment BLOB, 
-                    c_date BLOB NOT NULL, m_date BLOB NOT NULL, e_date BLOB NOT NULL,
-                    grp_id INTEGER REFERENCES Groups(id) ON DELETE CASCADE, 
-                    user_id INTEGER REFERENCES Users(id) ON DELETE CASCADE, 
-                    attachment BLOB, att_name BLOB,
-                    salt TEXT, iv BLOB, expire TEXT);
-                """)
-            self._connection.commit()
+                self.createAttachmentsTable()
+                self.createSearchIndexTable()
+                self.createIndexes()
             
-            logging.info("%i tables created.", self._cursor.rowcount)
+            logging.info("%i tables created.", len(self.__TABLES) + 2)
         except sqlite3.Error as e:
             logging.exception(e)
             
-            # rollback changes
-            self._connection.rollback()
             raise e
     
-    def insertDefRows(self):
+    def tableColumns(self, table):
         """
-            Insert default values to rows.
+            Return column names of table.
+            
+            @param table: table name
+            
+            @return: list of column names
+        """
+        try:
+            self.cursor().execute("PRAGMA table_info(%s);" % table)
+            
+            return [row["name"] for row in self.cursor().fetchall()]
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+    
+    def rebuildTable(self, table):
+        """
+            Rebuild table by its current create statement, i.e. when column constraints are changed.
+            Rows are copied by common columns, so IDs are kept. Have to run in transaction with disabled foreign keys,
+            references from other tables are kept, because rebuilt table has same name.
+            
+            @param table: table name from __TABLES
         """
-        # insert default icons
-        self.insertDefaultIcons()
+        old = self.tableColumns(table)
+        sql = dict(self.__TABLES)[table]
         
-        # insert default groups
-        self.insertDefaultGroups()
+        self.cursor().execute(sql.replace("CREATE TABLE %s(" % table, "CREATE TABLE %s_new(" % table, 1))
         
-        # insert App DB version
-        self.insertAppDBVersion()
+        columns = ", ".join(col for col in self.tableColumns(table + "_new") if col in old)
+        
+        self.cursor().execute("INSERT INTO %s_new(%s) SELECT %s FROM %s;" % (table, columns, columns, table))
+        
+        logging.info("table: %s rebuilt, rows moved: %d", table, self.cursor().rowcount)
+        
+        self.cursor().execute("DROP TABLE %s;" % table)
+        self.cursor().execute("ALTER TABLE %s_new RENAME TO %s;" % (table, table))
+        
+        # indexes were dropped with table
+        self.createIndexes()
     
-    def insertAppDBVersion(self):
+    def createAttachmentsTable(self):
+        """
+            Creates Attachments table, if does not exist. Attachment is stored in chunks ordered by seq.
+        """
+        self.cursor().execute("""CREATE TABLE IF NOT EXISTS Attachments(id INTEGER PRIMARY KEY, 
+                    passwd_id INTEGER NOT NULL REFERENCES Passwords(id) ON DELETE CASCADE, 
+                    seq INTEGER NOT NULL, data BLOB NOT NULL, UNIQUE(passwd_id, seq));""")
+    
+    def createSearchIndexTable(self):
+        """
+            Creates SearchIndex table, if does not exist. Blind search tokens of passwords, see SearchController.
+        """
+        self.cursor().execute("""CREATE TABLE IF NOT EXISTS SearchIndex(token BLOB NOT NULL, 
+                    passwd_id INTEGER NOT NULL REFERENCES Passwords(id) ON DELETE CASCADE, 
+                    PRIMARY KEY(token, passwd_id)) WITHOUT ROWID;""")
+        self.cursor().execute("CREATE INDEX IF NOT EXISTS SearchIndexPasswd ON SearchIndex(passwd_id);")
+    
+    def createIndexes(self):
+        """
+            Creates indexes, if do not exist. Passwords are selected by user and group, 
+            and deleted by cascade from Users and Groups, groups icon is set default by Icons.
+        """
+        self.cursor().execute("CREATE INDEX IF NOT EXISTS PasswordsUserGrp ON Passwords(user_id, grp_id);")
+        self.cursor().execute("CREATE INDEX IF NOT EXISTS PasswordsGrp ON Passwords(grp_id);")
+        self.cursor().execute("CREATE INDEX IF NOT EXISTS GroupsIcon ON Groups(icon_id);")
+    
+    def insertDefRows(self):
+        """
+            Insert default values to rows.
+        """
+        # all at once
+        with self.transaction():
+            # insert default icons
+            self.insertDefaultIcons()
+            
+            # insert default groups
+            self.insertDefaultGroups()
+            
+            # insert App DB version
+            self.insertAppDBVersion()
+    
+    def insertAppDBVersion(self, version = AppSettings.APP_DB_VERSION):
         """
             Insert into DB app version DB.
+            
+            @param version: DB version, default current
         """
         try:
-            self._cursor.execute("INSERT INTO Version(version) VALUES(:version)",
-                                  {"version" : AppSettings.APP_DB_VERSION})
-            self._connection.commit()
+            self.cursor().execute("INSERT INTO Version(version) VALUES(:version)",
+                                  {"version" : version})
+            self.commit()
             
-            logging.info("Version with ID: %d, inserted: %s", self._cursor.lastrowid, AppSettings.APP_DB_VERSION)
+            logging.info("Version with ID: %d, inserted: %s", self.cursor().lastrowid, version)
         except sqlite3.IntegrityError as e:
             logging.warning(e)
             
-            self._connection.rollback()
+            self.rollback()
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            self.rollback()
+            raise e
+    
+    def updateAppDBVersion(self, version):
+        """
+            Update app DB version, after conversion.
+            
+            @param version: new DB version
+        """
+        try:
+            self.cursor().execute("UPDATE Version SET version = :version;", {"version" : version})
+            self.commit()
+            
+            logging.info("Version updated: %s", version)
         except sqlite3.Error as e:
             logging.exception(e)
             
-            self._connection.rollback()
+            self.rollback()
             raise e
     
     def insertDefaultIcons(self):
@@ -253,9 +750,9 @@ class DbController:
         grp_ctrl.insertGroup("Bank account", "Bank account credentials.", icon_ctrl.selectByName("bank")._id)
     
     def getTables(self):
-        self._cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        self.cursor().execute("SELECT name FROM sqlite_master WHERE type='table'")
         
-        return self._cursor.fetchall()
+        return self.cursor().fetchall()
     
     def enForeignKey(self, b = True):
         """
@@ -267,16 +764,16 @@ class DbController:
             if (b):
                 logging.info("Enabling foreign keys.")
                 
-                self._cursor.execute("PRAGMA foreign_keys = ON;")
+                self.cursor().execute("PRAGMA foreign_keys = ON;")
             else:
                 logging.info("Disabling foreign keys.")
                 
-                self._cursor.execute("PRAGMA foreign_keys = OFF;")
-            self._connection.commit()
+                self.cursor().execute("PRAGMA foreign_keys = OFF;")
+            self.commit()
         except sqlite3.Error as e:
             logging.exception(e)
             
             # rollback changes
-            self._connection.rollback()
+            self.rollback()
             raise e
         
\ No newline at end of file
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    MIT License
+
+    Copyright (c) 2013-2016 Frantisek Uhrecky
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+from PyQt4 import QtCore
+import logging
+import AppSettings
+from PasswdController import PasswdController
+from GroupController import GroupController
+from ChangeEvent import ChangeEvent
+
+class DbWatcher(QtCore.QObject):
+    """
+        Watches database changes. Changes commited by controllers are recorded by DB controller.
+        Changes commited by other app instances are detected by polling cheap PRAGMA data_version,
+        and just when it changes, IDs and encrypted modification dates of passwords are compared
+        with last snapshot, so only changed passwords have to be decrypted and displayed again.
+    """
+    # public signals:
+    # database changed, param: list of ChangeEvent objects
+    signalChanged = QtCore.pyqtSignal(list)
+    
+    def __init__(self, db_ctrl, parent = None):
+        """
+            @param db_ctrl: database controller
+        """
+        super(DbWatcher, self).__init__(parent)
+        
+        self._db_ctrl = db_ctrl
+        self._user = None
+        
+        # last seen data version and snapshots
+        self._data_version = None
+        self._passwords = {}
+        self._groups = {}
+        
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(AppSettings.DB_WATCH_MSEC)
+        self._timer.timeout.connect(self.check)
+        
+        self._db_ctrl.addChangeListener(self.changesCommited)
+        
+    def start(self, user):
+        """
+            Take snapshot of user passwords and start watching.
+            
+            @param user: logged user, UserModel
+        """
+        self._user = user
+        
+        self.snapshot()
+        
+        self._timer.start()
+        
+    def stop(self):
+        """
+            Stop watching.
+        """
+        self._timer.stop()
+        
+    def resume(self):
+        """
+            Start watching again after stop(), with older snapshot, so changes made meanwhile are detected.
+        """
+        self._timer.start()
+        
+    def snapshot(self):
+        """
+            Remember current data version, passwords and groups, changes are detected against them.
+        """
+        self._data_version = self._db_ctrl.dataVersion()
+        self._passwords = PasswdController(self._db_ctrl, self._user._master).selectVersions(self._user._id)
+        self._groups = GroupController(self._db_ctrl).selectVersions()
+        
+    def changesCommited(self, changes):
+        """
+            DB controller listener, emit changes commited by this app instance, can be called from other thread.
+            
+            @param changes: list of ChangeEvent objects
+        """
+        if (self._user):
+            self.signalChanged.emit(changes)
+        
+    def check(self):
+        """
+            Timer slot, if data version changed, find changed passwords and groups and emit them.
+        """
+        # own transaction is in progress, check later
+        if (self._db_ctrl.transactions()):
+            return
+        
+        try:
+            if (self._db_ctrl.dataVersion() == self._data_version):
+                return
+            
+            old_passwords = self._passwords
+            old_groups = self._groups
+            
+            self.snapshot()
+        except Exception as e:
+            # i.e. database is locked by other instance, try next time
+            logging.exception(e)
+            
+            return
+        
+        logging.info("database changed by other connection, data version: %d", self._data_version)
+        
+        # rows loaded to identity map can be changed
+        self._db_ctrl.invalidateModel()
+        
+        changes = self.diff("Groups", old_groups, self._groups) + self.diff("Passwords", old_passwords, self._passwords)
+        
+        if (changes):
+            self.signalChanged.emit(changes)
+        
+    def diff(self, table, old, new):
+        """
+            Compare snapshots of table.
+            
+            @param table: table name
+            @param old: old snapshot, dictionary ID: row version
+            @param new: new snapshot
+            
+            @return: list of ChangeEvent objects, inserted, updated and deleted rows
+        """
+        inserted = [m_id for m_id in new if m_id not in old]
+        updated = [m_id for m_id in new if m_id in old and old[m_id] != new[m_id]]
+        deleted = [m_id for m_id in old if m_id not in new]
+        
+        logging.info("%s changed, inserted: %d, updated: %d, deleted: %d", table, len(inserted), len(updated), len(deleted))
+        
+        return [ChangeEvent(table, change, ids) for change, ids in 
+                ((ChangeEvent.INSERTED, inserted), (ChangeEvent.UPDATED, updated), (ChangeEvent.DELETED, deleted)) if ids]
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    MIT License
+
+    Copyright (c) 2013-2016 Frantisek Uhrecky
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import logging
+import threading
+import multiprocessing
+
+# worker process pool, created on first use
+_pool = None
+
+# worker count of current pool
+_workers = 0
+
+# pool is shared by all threads
+_lock = threading.Lock()
+
+def mapOrdered(func, tasks, workers):
+    """
+        Run function for every task in worker processes. Results are in order of tasks, so it is deterministic.
+        Pool is created on first use, or again, if worker count is changed.
+        
+        @param func: module level function, it has to be picklable
+        @param tasks: list of picklable tasks
+        @param workers: worker processes count
+        @return: list of results
+    """
+    global _pool, _workers
+    
+    with _lock:
+        if (_pool is None or _workers != workers):
+            closePool()
+            
+            logging.info("starting decrypt pool, workers: %d", workers)
+            
+            _pool = multiprocessing.Pool(workers)
+            _workers = workers
+        pool = _pool
+    
+    # few chunks for every worker, to balance load
+    chunksize = max(1, len(tasks) // (workers * 4))
+    
+    return pool.map(func, tasks, chunksize)
+
+def closePool():
+    """
+        Terminate worker processes, i.e. on close.
+    """
+    global _pool, _workers
+    
+    if (_pool is not None):
+        logging.info("closing decrypt pool, workers: %d", _workers)
+        
+        _pool.terminate()
+        _pool.join()
+    _pool = None
+    _workers = 0
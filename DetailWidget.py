@@ -34,6 +34,10 @@ class DetailWidget(QtGui.QWidget):
     def __init__(self, parent = None, show_pass = False):
         self.__parent = parent
         self._show_pass = show_pass
+        
+        # displayed password ID
+        self._p_id = None
+        
         super(DetailWidget, self).__init__(parent)
         
         self.initUI()
@@ -105,11 +109,17 @@ class DetailWidget(QtGui.QWidget):
         
         passwd_ctrl = PasswdController(self.__parent._db_ctrl, self.__parent._user._master)
         
-        # select password
-        passwd = passwd_ctrl.selectById(p_id)[0]
+        # select password, attachment is not displayed
+        passwd = passwd_ctrl.selectById(p_id, ["title", "username", "passwd", "url", "comment", 
+                                               "c_date", "m_date", "e_date", "att_name", "expire"])[0]
         
+        # i.e. deleted
         if (not passwd):
+            self.clearDetails()
+            self.setHidden(True)
+            
             return
+        self._p_id = p_id
         
         self.__title.setText(QtCore.QString.fromUtf8(passwd._title))
         
@@ -137,6 +147,8 @@ class DetailWidget(QtGui.QWidget):
         """
             CLear displayed details.
         """
+        self._p_id = None
+        
         self.__title.setText("")
         self.__username.setText("")
         self.__passwd.setText("")
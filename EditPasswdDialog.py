@@ -29,6 +29,7 @@ from PasswdController import PasswdController
 import datetime
 from GroupController import GroupController
 from PasswdDialog import PasswdDialog
+from AttachmentController import AttachmentController
 import InfoMsgBoxes
 
 class EditPasswdDialog(PasswdDialog):
@@ -48,8 +49,9 @@ class EditPasswdDialog(PasswdDialog):
         
         passwd_ctrl = PasswdController(self.__parent._db_ctrl, self.__parent._user._master)
         
-        # select password
-        self.__password = passwd_ctrl.selectById(p_id)[0]
+        # select password, attachment is not loaded
+        self.__password = passwd_ctrl.selectById(p_id, ["title", "username", "passwd", "url", "comment", 
+                                                        "c_date", "m_date", "e_date", "att_name", "expire"])[0]
         
         # set window title
         self.setWindowTitle(QtCore.QString.fromUtf8(self.__password._title))
@@ -67,8 +69,12 @@ class EditPasswdDialog(PasswdDialog):
         self._comment.setText(QtCore.QString.fromUtf8(self.__password._comment))
         self._att_name.setText(QtCore.QString.fromUtf8(self.__password._att_name))
         
-        # set attachment data
-        self._attachment_data = self.__password._attachment
+        # attachment is written to file chunk by chunk, when needed
+        att_ctrl = AttachmentController(self.__parent._db_ctrl, self.__parent._user._master)
+        passwd_ctrl = PasswdController(self.__parent._db_ctrl, self.__parent._user._master)
+        
+        self._attachment_writer = lambda f: att_ctrl.writeAttachment(self.__password._id, passwd_ctrl.rowKey(self.__password), 
+                                                                     self.__password._iv, f)
         
         # set expiration button
         if (self.__password._expire == "false"):
@@ -86,6 +92,7 @@ class EditPasswdDialog(PasswdDialog):
             Save changes to database, read all iinputs and update DB entry.
         """
         logging.debug("save button clicked.")
+        attachment = None
         
         try:
             self.__password._title = str(self._title.text().toUtf8())
@@ -108,17 +115,20 @@ class EditPasswdDialog(PasswdDialog):
             # set expiration date
             self.__password._e_date = self._e_date_edit.dateTime().toTime_t()
             
-            # set attachment data
-            self.__password._attachment = self._attachment_data
+            # new attachment file, deleted attachment or None if not changed
+            attachment = self.openAttachmentSrc()
     
             # update password
             passwd_ctrl = PasswdController(self.__parent._db_ctrl, self.__parent._user._master)
             
             passwd_ctrl.updatePasswd(self.__password._id, self.__password._title, self.__password._username, self.__password._passwd, 
                                      self.__password._url, self.__password._comment, self.__password._e_date, 
-                                     self.__password._grp._id, self.__password._user._id, self.__password._attachment, 
+                                     self.__password._grp._id, self.__password._user._id, attachment, 
                                      self.__password._att_name, self.__password._expire)
             self.signalPasswdSaved.emit(self.__password._id)
             self.accept()
         except Exception as e:
-            InfoMsgBoxes.showErrorMsg(e)
\ No newline at end of file
+            InfoMsgBoxes.showErrorMsg(e)
+        finally:
+            if (attachment):
+                attachment.close()
\ No newline at end of file
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    MIT License
+
+    Copyright (c) 2013-2016 Frantisek Uhrecky
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+from PyQt4 import QtGui, QtCore
+from TransController import tr
+import datetime
+import time
+
+class ExpiringDialog(QtGui.QDialog):
+    """
+        Expiring soon dialog window, shows passwords expiring in AppSettings.EXPIRY_SOON_DAYS and expired passwords.
+        Data are from expiry controller, nothing is decrypted.
+    """
+    # public signals:
+    # edit password, password ID
+    signalEditPasswd = QtCore.pyqtSignal(int)
+    
+    def __init__(self, expiry_ctrl):
+        """
+            @param expiry_ctrl: expiry controller, ExpiryController
+        """
+        self.__expiry_ctrl = expiry_ctrl
+        
+        super(ExpiringDialog, self).__init__()
+        
+        self.initUI()
+        self.center()
+        self.initConnections()
+        self.loadPasswords()
+        
+    def initUI(self):
+        """
+            Initialize UI components.
+        """
+        self.setWindowTitle(tr("Expiring soon"))
+        self.resize(500, 300)
+        
+        # create main grid layout
+        layout_gl = QtGui.QGridLayout()
+        self.setLayout(layout_gl)
+        
+        # passwords list
+        self._passwords_tw = QtGui.QTreeWidget()
+        self._passwords_tw.setHeaderLabels([tr("Title"), tr("Expiration date:")])
+        self._passwords_tw.setRootIsDecorated(False)
+        
+        layout_gl.addWidget(self._passwords_tw, 0, 0)
+        
+        # create buttons
+        self._button_box = QtGui.QDialogButtonBox()
+        
+        self.__close_button = QtGui.QPushButton(tr("&Close"))
+        
+        self._button_box.addButton(self.__close_button, QtGui.QDialogButtonBox.RejectRole)
+        
+        layout_gl.addWidget(self._button_box, 1, 0)
+        
+    def initConnections(self):
+        """
+            Init connections, reaction on signals.
+        """
+        self._button_box.rejected.connect(self.close)
+        
+        self._passwords_tw.itemDoubleClicked.connect(self.editPasswd)
+        
+    def loadPasswords(self):
+        """
+            Load expiring passwords to list, nearest first. Expired passwords are red.
+        """
+        self._passwords_tw.clear()
+        
+        now = time.time()
+        
+        for e_date, p_id, title in self.__expiry_ctrl.expiringSoon():
+            item = QtGui.QTreeWidgetItem([QtCore.QString.fromUtf8(title), 
+                                          str(datetime.datetime.fromtimestamp(e_date).strftime("%Y-%m-%d %H:%M:%S"))])
+            item.setData(0, QtCore.Qt.UserRole, p_id)
+            
+            if (e_date <= now):
+                item.setForeground(1, QtGui.QBrush(QtCore.Qt.red))
+            
+            self._passwords_tw.addTopLevelItem(item)
+            
+    def editPasswd(self, item, column):
+        """
+            Emit signal to edit password.
+        """
+        self.signalEditPasswd.emit(item.data(0, QtCore.Qt.UserRole).toInt()[0])
+        
+        # edit dialog is modal, password is saved now
+        self.loadPasswords()
+        
+    def center(self):
+        """
+            Center window.
+        """
+        # get frame geometry
+        wg = self.frameGeometry()
+        
+        # get screen center
+        cs = QtGui.QDesktopWidget().availableGeometry().center()
+        wg.moveCenter(cs)
+        
+        self.move(wg.topLeft())
@@ -0,0 +1,232 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    MIT License
+
+    Copyright (c) 2013-2016 Frantisek Uhrecky
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+from PyQt4 import QtCore
+import heapq
+import logging
+import sqlite3
+import time
+import AppSettings
+from PasswdController import PasswdController
+
+class ExpiryController(QtCore.QObject):
+    """
+        Schedules expiration of user passwords. Expiration dates are encrypted, so they are decrypted once at login
+        to min heap, then heap is updated on password save and delete. One timer is set to nearest expiration.
+        Changed and deleted passwords are removed from heap lazily, when they get on top.
+    """
+    # public signals:
+    # passwords expired, list of password IDs
+    signalExpired = QtCore.pyqtSignal(list)
+    
+    # max timer interval in msec, nearer expiration is scheduled again
+    __MAX_INTERVAL = 2 ** 31 - 1
+    
+    def __init__(self, db_ctrl, parent = None):
+        """
+            @param db_ctrl: database controller
+        """
+        super(ExpiryController, self).__init__(parent)
+        
+        self._db_ctrl = db_ctrl
+        self._user = None
+        
+        # heap of touples (expiration date, password ID)
+        self._heap = []
+        
+        # expiring passwords, password ID: (expiration date, title)
+        self._entries = {}
+        
+        # IDs of expired passwords already emitted, they are emitted again just after expiration date is moved to future
+        self._reported = set()
+        
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.expire)
+        
+    def load(self, user):
+        """
+            Load expiring passwords of user and schedule nearest expiration.
+            
+            @param user: logged user, UserModel
+        """
+        self._user = user
+        self._entries = {}
+        self._reported = set()
+        
+        passwd_ctrl = PasswdController(self._db_ctrl, user._master)
+        
+        for passwd in passwd_ctrl.selectByUserId(user._id, ["title", "e_date", "expire"]):
+            if (passwd._expire == "true"):
+                self._entries[passwd._id] = (passwd._e_date, passwd._title)
+        
+        self._heap = [(entry[0], p_id) for p_id, entry in self._entries.items()]
+        heapq.heapify(self._heap)
+        
+        logging.info("expiring passwords: %d", len(self._heap))
+        
+        self.schedule()
+        
+    def updatePassword(self, p_id):
+        """
+            Update saved password, just this password is decrypted.
+            
+            @param p_id: password ID
+        """
+        self.updatePasswords([p_id])
+        
+    def updatePasswords(self, p_ids):
+        """
+            Update changed passwords, i.e. by other app instance, just these passwords are decrypted.
+            Passwords not found are removed.
+            
+            @param p_ids: list of password IDs
+        """
+        passwords = PasswdController(self._db_ctrl, self._user._master).selectByIds(p_ids, ["title", "e_date", "expire"])
+        found = set()
+        
+        for passwd in passwords:
+            found.add(passwd._id)
+            
+            if (passwd._expire == "true"):
+                entry = self._entries.get(passwd._id)
+                self._entries[passwd._id] = (passwd._e_date, passwd._title)
+                
+                if (passwd._e_date > time.time()):
+                    self._reported.discard(passwd._id)
+                
+                # heap item of same date is still valid, already reported password is not scheduled again
+                if ((not entry or entry[0] != passwd._e_date) and passwd._id not in self._reported):
+                    heapq.heappush(self._heap, (passwd._e_date, passwd._id))
+            else:
+                self._entries.pop(passwd._id, None)
+                self._reported.discard(passwd._id)
+        
+        for p_id in p_ids:
+            if (p_id not in found):
+                self._entries.pop(p_id, None)
+                self._reported.discard(p_id)
+        
+        self.schedule()
+        
+    def removePassword(self, p_id):
+        """
+            Remove deleted password.
+            
+            @param p_id: password ID
+        """
+        self._entries.pop(p_id, None)
+        self._reported.discard(p_id)
+        
+        self.schedule()
+        
+    def removeDeleted(self):
+        """
+            Remove deleted passwords, i.e. after group delete. Just password IDs are selected, nothing is decrypted.
+        """
+        try:
+            cursor = self._db_ctrl.cursor()
+            
+            cursor.execute("SELECT id FROM Passwords WHERE user_id = :user_id;", {"user_id" : self._user._id})
+            existing = set(row["id"] for row in cursor.fetchall())
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+        
+        for p_id in [p_id for p_id in self._entries if p_id not in existing]:
+            del self._entries[p_id]
+        
+        self.schedule()
+        
+    def schedule(self):
+        """
+            Set timer to nearest expiration.
+        """
+        # remove changed and deleted passwords from top
+        while (self._heap and self._entries.get(self._heap[0][1], (None, ))[0] != self._heap[0][0]):
+            heapq.heappop(self._heap)
+        
+        if (not self._heap):
+            self._timer.stop()
+            
+            return
+        
+        interval = max(0, int((self._heap[0][0] - time.time()) * 1000))
+        
+        logging.debug("next expiration in msec: %d", interval)
+        
+        self._timer.start(min(interval, self.__MAX_INTERVAL))
+        
+    def stop(self):
+        """
+            Stop timer, expired passwords are not emitted until schedule() or load().
+        """
+        self._timer.stop()
+        
+    def expire(self):
+        """
+            Timer slot, emit expired passwords and schedule next expiration.
+        """
+        now = time.time()
+        expired = []
+        
+        while (self._heap and self._heap[0][0] <= now):
+            e_date, p_id = heapq.heappop(self._heap)
+            
+            # password with expiration disabled and enabled again can be twice in heap
+            if (self._entries.get(p_id, (None, ))[0] == e_date and p_id not in expired and p_id not in self._reported):
+                expired.append(p_id)
+        
+        self._reported.update(expired)
+        
+        self.schedule()
+        
+        if (expired):
+            logging.info("passwords expired: %d", len(expired))
+            
+            self.signalExpired.emit(expired)
+        
+    def expiringSoon(self, days = None):
+        """
+            Return passwords expiring in days, also already expired, nearest first.
+            
+            @param days: count of days, default AppSettings.EXPIRY_SOON_DAYS
+            
+            @return: list of touples (expiration date, password ID, title)
+        """
+        if (days is None):
+            days = AppSettings.EXPIRY_SOON_DAYS
+        limit = time.time() + days * 24 * 60 * 60
+        
+        return sorted((entry[0], p_id, entry[1]) for p_id, entry in self._entries.items() if entry[0] <= limit)
+    
+    def title(self, p_id):
+        """
+            Return title of expiring password.
+            
+            @param p_id: password ID
+        """
+        return self._entries[p_id][1]
@@ -26,6 +26,7 @@
 import sqlite3
 import logging
 from GroupModel import GroupModel
+from ChangeEvent import ChangeEvent
 
 class GroupController:
     """
@@ -33,8 +34,20 @@ class GroupController:
     """
     def __init__(self, db_controller):
         self._db_ctrl = db_controller
-        self._connection = db_controller._connection
-        self._cursor = db_controller._cursor
+    
+    @property
+    def _connection(self):
+        """
+            Connection of current thread from DB controller pool.
+        """
+        return self._db_ctrl.connection()
+    
+    @property
+    def _cursor(self):
+        """
+            Cursor of current thread connection from DB controller pool.
+        """
+        return self._db_ctrl.cursor()
     
     def selectAll(self):
         """
@@ -57,12 +70,32 @@ class GroupController:
                 groups.append(self.createGroupObj(row))
             return groups
         
+    def selectVersions(self):
+        """
+            Select displayed group columns, to detect changed groups.
+            
+            @return: dictionary group ID: (name, description, icon ID)
+        """
+        try:
+            self._cursor.execute("SELECT id, name, description, icon_id FROM Groups;")
+            
+            return dict((row["id"], (row["name"], row["description"], row["icon_id"])) for row in self._cursor.fetchall())
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+        
     def selectById(self, g_id):
         """
             Search group by id.
             @param id: group id
             @return: row, group model object
         """
+        # already loaded group
+        group = self._db_ctrl.selectModel("Groups", g_id)
+        
+        if (group):
+            return group
         try:
             self._cursor.execute("SELECT * FROM Groups WHERE id = :id;", {"id" : g_id})
             row = self._cursor.fetchone()
@@ -116,17 +149,20 @@ class GroupController:
         try:
             self._cursor.execute("INSERT INTO Groups(name, description, icon_id) VALUES(:name, :description, :icon_id)",
                                   {"name" : name, "description" : description, "icon_id" : icon_id})
-            self._connection.commit()
+            self._db_ctrl.recordChange("Groups", ChangeEvent.INSERTED, [self._cursor.lastrowid])
+            self._db_ctrl.commit()
             
             logging.info("groups with ID: %d, inserted: %d", self._cursor.lastrowid, self._cursor.rowcount)
+            
+            self._db_ctrl.invalidateModel("Groups", self._cursor.lastrowid)
         except sqlite3.IntegrityError as e:
             logging.warning(e)
             
-            self._connection.rollback()
+            self._db_ctrl.rollback()
         except sqlite3.Error as e:
             logging.exception(e)
             
-            self._connection.rollback()
+            self._db_ctrl.rollback()
             raise e
            
     def updateGroup(self, g_id, name, description, icon_id):
@@ -140,30 +176,41 @@ class GroupController:
         name = name.decode("utf-8")
         description = description.decode("utf-8")
         
+        # loaded group is changed
+        self._db_ctrl.invalidateModel("Groups", g_id)
+        
         try:
             self._cursor.execute("UPDATE Groups SET name = :name, description = :description, icon_id = :icon_id WHERE id = :id;",
                                 {"id" : g_id, "name" : name, "description" : description, "icon_id" : icon_id})
-            self._connection.commit()
+            self._db_ctrl.recordChange("Groups", ChangeEvent.UPDATED, [g_id])
+            self._db_ctrl.commit()
             
             logging.info("groups updated: %d, with ID: %d", self._cursor.rowcount, g_id)
         except sqlite3.IntegrityError as e:
             logging.warning(e)
             
-            self._connection.rollback()
+            self._db_ctrl.rollback()
         except sqlite3.Error as e:
             logging.exception(e)
             
-            self._connection.rollback()
+            self._db_ctrl.rollback()
             raise e
             
     def deleteGroup(self, g_id):
         """
-            Delete group with ID.
+            Delete group with ID. Its passwords are deleted by foreign key cascade, they are recorded as deleted too.
             @param g_id: group ID
         """
+        self._db_ctrl.invalidateModel("Groups", g_id)
+        
         try:
+            self._cursor.execute("SELECT id FROM Passwords WHERE grp_id = :g_id;", {"g_id" : g_id})
+            p_ids = [row["id"] for row in self._cursor.fetchall()]
+            
             self._cursor.execute("DELETE FROM Groups WHERE id = :g_id", {"g_id" : g_id})
-            self._connection.commit()
+            self._db_ctrl.recordChange("Groups", ChangeEvent.DELETED, [g_id])
+            self._db_ctrl.recordChange("Passwords", ChangeEvent.DELETED, p_ids)
+            self._db_ctrl.commit()
             
             count = self._cursor.rowcount
             
@@ -174,7 +221,7 @@ class GroupController:
         except sqlite3.Error as e:
             logging.exception(e)
             
-            self._connection.rollback()
+            self._db_ctrl.rollback()
             raise e
         
     def createGroupObj(self, dic):
@@ -183,6 +230,12 @@ class GroupController:
             
             @param dic: group returned from db
             
-            @return: GroupModel object
+            @return: GroupModel object, shared by identity map
         """
-        return GroupModel(dic["id"], dic["name"], dic["description"], dic["icon_id"], self._db_ctrl)
\ No newline at end of file
+        group = self._db_ctrl.selectModel("Groups", dic["id"])
+        
+        if (not group):
+            group = GroupModel(dic["id"], dic["name"], dic["description"], dic["icon_id"], self._db_ctrl)
+            
+            self._db_ctrl.storeModel("Groups", dic["id"], group)
+        return group
\ No newline at end of file
@@ -31,7 +31,7 @@ class GroupModel:
     """
         Holds Group data.
     """
-    def __init__(self, g_id = None, name = None, description = None, icon_id = None, db_ctrl = None):
+    def __init__(self, g_id = None, name = None, description = None, icon_id = None, db_ctrl = None, icon = None):
         """
             Initialize GroupModel.
             
@@ -40,15 +40,17 @@ class GroupModel:
             @param description: group description
             @param icon_id: icon_id
             @param db_ctrl: DB controller
+            @param icon: already loaded IconModel, if set icon is not selected from DB
             
         """
         self._id = g_id
         self._name = name
         self._description = description
-        self._icon = None
+        self._icon = icon
         
         # now load icon
-        self.selectIcon(icon_id, db_ctrl)
+        if (not icon):
+            self.selectIcon(icon_id, db_ctrl)
         
     def selectIcon(self, icon_id, db_ctrl):
         """
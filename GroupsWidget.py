@@ -29,6 +29,7 @@ from TransController import tr
 from GroupController import GroupController
 from IconController import IconController
 from PasswdController import PasswdController
+from ChangeEvent import ChangeEvent
 
 class GroupsWidget(QtGui.QTreeWidget):
     # public static attr:
@@ -37,6 +38,9 @@ class GroupsWidget(QtGui.QTreeWidget):
     _TYPE_GROUP = 2
     _TYPE_PASS = 3
     
+    # password columns displayed in tree, title and comment as tooltip
+    _PASSWD_COLUMNS = ["title", "comment"]
+    
     # public signals:
     # first param: type, second: id
     # when on a group or password in group widget is clicked
@@ -54,6 +58,13 @@ class GroupsWidget(QtGui.QTreeWidget):
         self.__COL_TYPE = 3
         self.__COL_GRP_ID = 4
         
+        # displayed items, to apply changes, see applyChanges()
+        self._all_item = None
+        self._group_items = {}
+        
+        # password ID: items in group all and in password group
+        self._passwd_items = {}
+        
         super(GroupsWidget, self).__init__(parent)
         
         self.initUI()
@@ -125,32 +136,44 @@ class GroupsWidget(QtGui.QTreeWidget):
         groups = group_ctrl.selectAll()
         
         # group, that contains all passwords
-        all_group = self.initItemData(icon_ctrl.selectByName("userpass")._icon, 
-                                      tr("All"), -1, tr("All passwords group."), self._TYPE_ALL, -1)
-        self.addTopLevelItem(all_group)
+        self._all_item = self.initItemData(icon_ctrl.selectByName("userpass")._icon, 
+                                           tr("All"), -1, tr("All passwords group."), self._TYPE_ALL, -1)
+        self.addTopLevelItem(self._all_item)
         
-        # add cildren, all passwords to group all
-        passwords = passwd_ctrl.selectByUserId(self.__parent._user._id)
+        # insert groups to tree
+        for group in groups:
+            self.addGroupItem(group)
+        
+        # passwords are decrypted once, added to group all and to own group
+        passwords = passwd_ctrl.selectByUserId(self.__parent._user._id, self._PASSWD_COLUMNS)
         
         for passwd in passwords:
-            child = self.initItemData(passwd._grp._icon._icon, passwd._title, passwd._id, passwd._comment, self._TYPE_PASS, passwd._grp._id)
+            self.addPasswdItems(passwd)
+          
+    def addGroupItem(self, group):
+        """
+            Add group item to tree.
             
-            all_group.addChild(child)
+            @param group: GroupModel object
+        """
+        item = self.initItemData(group._icon._icon, tr(group._name), group._id, group._description, self._TYPE_GROUP, group._id)
         
-        # insert groups to tree
-        for group in groups:
-            item = self.initItemData(group._icon._icon, tr(group._name), group._id, group._description, self._TYPE_GROUP, group._id)
-            
-            self.addTopLevelItem(item)
-            
-            # add cildren, all passwords to group all
-            passwords = passwd_ctrl.selectByUserGrpId(self.__parent._user._id, group._id)
+        self.addTopLevelItem(item)
+        self._group_items[group._id] = item
+        
+    def addPasswdItems(self, passwd):
+        """
+            Add password items to group all and to password group.
             
-            for passwd in passwords:
+            @param passwd: PasswdModel object
+        """
+        for parent in (self._all_item, self._group_items.get(passwd._grp._id)):
+            if (parent):
                 child = self.initItemData(passwd._grp._icon._icon, passwd._title, passwd._id, passwd._comment, self._TYPE_PASS, passwd._grp._id)
-            
-                item.addChild(child)
-          
+                
+                parent.addChild(child)
+                self._passwd_items.setdefault(passwd._id, []).append(child)
+        
     def initItemData(self, icon, name, item_id, tooltip, item_type, item_grp_id):
         """
             Initialize item data.
@@ -165,6 +188,16 @@ class GroupsWidget(QtGui.QTreeWidget):
         """
         item = QtGui.QTreeWidgetItem()
         
+        self.setItemData(item, icon, name, item_id, tooltip, item_type, item_grp_id)
+        
+        return item
+    
+    def setItemData(self, item, icon, name, item_id, tooltip, item_type, item_grp_id):
+        """
+            Set data of existing item, see initItemData().
+            
+            @param item: QTreeWidgetItem object
+        """
         # load image to display mode
         pix = QtGui.QPixmap()
         pix.loadFromData(icon)
@@ -176,7 +209,117 @@ class GroupsWidget(QtGui.QTreeWidget):
         item.setData(self.__COL_TYPE, QtCore.Qt.DisplayRole, item_type)
         item.setData(self.__COL_GRP_ID, QtCore.Qt.DisplayRole, item_grp_id)
         
-        return item
+    def applyChanges(self, changes):
+        """
+            Apply commited changes to tree items, instead of reloading whole tree. Only changed passwords are decrypted,
+            password moved to other group is moved in tree. Current item and scroll position are kept.
+            
+            @param changes: list of ChangeEvent objects
+        """
+        changed = set()
+        deleted = set()
+        
+        # top item, to keep scroll position
+        current = self.currentItem()
+        anchor = self.itemAt(0, 0)
+        
+        for change in changes:
+            if (change._table == "Groups"):
+                self.applyGroupChange(change)
+            elif (change._table == "Passwords"):
+                if (change._change == ChangeEvent.DELETED):
+                    deleted.update(change._ids)
+                    changed.difference_update(change._ids)
+                else:
+                    changed.update(change._ids)
+                    deleted.difference_update(change._ids)
+        
+        passwords = []
+        
+        if (changed):
+            passwd_ctrl = PasswdController(self.__parent._db_ctrl, self.__parent._user._master)
+            passwords = passwd_ctrl.selectByIds(sorted(changed), self._PASSWD_COLUMNS)
+        
+        # not found passwords, i.e. of other user
+        removed = deleted | changed
+        removed.difference_update(passwd._id for passwd in passwords)
+        
+        logging.info("applying changes, updated passwords: %d, removed passwords: %d", len(passwords), len(removed))
+        
+        for p_id in removed:
+            for child in self._passwd_items.pop(p_id, []):
+                if (child.parent()):
+                    child.parent().removeChild(child)
+        
+        for passwd in passwords:
+            items = self._passwd_items.get(passwd._id)
+            
+            if (not items):
+                # new password
+                self.addPasswdItems(passwd)
+                
+                continue
+            group = self._group_items.get(passwd._grp._id)
+            
+            for child in items[:]:
+                self.setItemData(child, passwd._grp._icon._icon, passwd._title, passwd._id, passwd._comment, self._TYPE_PASS, passwd._grp._id)
+                
+                parent = child.parent()
+                
+                # moved to other group
+                if (parent is not self._all_item and parent is not group):
+                    parent.removeChild(child)
+                    
+                    if (group):
+                        group.addChild(child)
+                    else:
+                        items.remove(child)
+        
+        # moved or removed items change current item
+        if (current and current.treeWidget() is self and self.currentItem() is not current):
+            self.setCurrentItem(current)
+        
+        if (anchor and anchor.treeWidget() is self):
+            self.scrollToItem(anchor, QtGui.QAbstractItemView.PositionAtTop)
+        
+    def applyGroupChange(self, change):
+        """
+            Apply commited change of groups to tree items.
+            
+            @param change: ChangeEvent object of Groups table
+        """
+        group_ctrl = GroupController(self.__parent._db_ctrl)
+        
+        # group can be deleted, before change is applied
+        existing = group_ctrl.selectVersions()
+        
+        for g_id in change._ids:
+            item = self._group_items.get(g_id)
+            
+            if (change._change == ChangeEvent.DELETED or g_id not in existing):
+                # password items are removed by passwords change
+                if (item):
+                    self.takeTopLevelItem(self.indexOfTopLevelItem(item))
+                    
+                    del self._group_items[g_id]
+                continue
+            group = group_ctrl.selectById(g_id)
+            
+            if (not item):
+                self.addGroupItem(group)
+                
+                continue
+            self.setItemData(item, group._icon._icon, tr(group._name), group._id, group._description, self._TYPE_GROUP, group._id)
+            
+            # passwords in group have group icon
+            pix = QtGui.QPixmap()
+            pix.loadFromData(group._icon._icon)
+            
+            for i in range(item.childCount()):
+                p_id = item.child(i).data(self.__COL_ID, QtCore.Qt.DisplayRole).toInt()[0]
+                
+                for child in self._passwd_items.get(p_id, []):
+                    child.setIcon(self.__COL_ICON, QtGui.QIcon(pix))
       
     def showPasswords(self):
         """
@@ -310,4 +453,7 @@ class GroupsWidget(QtGui.QTreeWidget):
         """
         self.clear()
         
+        self._group_items = {}
+        self._passwd_items = {}
+        
         self.initItems()
\ No newline at end of file
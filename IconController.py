@@ -34,8 +34,20 @@ class IconController:
     """
     def __init__(self, db_controller):
         self._db_ctrl = db_controller
-        self._connection = db_controller._connection
-        self._cursor = db_controller._cursor
+    
+    @property
+    def _connection(self):
+        """
+            Connection of current thread from DB controller pool.
+        """
+        return self._db_ctrl.connection()
+    
+    @property
+    def _cursor(self):
+        """
+            Cursor of current thread connection from DB controller pool.
+        """
+        return self._db_ctrl.cursor()
     
     def selectAll(self):
         """
@@ -64,6 +76,11 @@ class IconController:
             @param i_id: icon id
             @return: row
         """
+        # already loaded icon
+        icon = self._db_ctrl.selectModel("Icons", i_id)
+        
+        if (icon):
+            return icon
         try:
             self._cursor.execute("SELECT * FROM Icons WHERE id = :id;", {"id" : i_id})
             row = self._cursor.fetchone()
@@ -117,17 +134,19 @@ class IconController:
         try:
             self._cursor.execute("INSERT INTO Icons(name, icon) VALUES(:name, :icon)",
                                   {"name" : name, "icon" : icon})
-            self._connection.commit()
+            self._db_ctrl.commit()
             
             logging.info("icons with ID: %i, inserted: %i, path to icon: %s", self._cursor.lastrowid, self._cursor.rowcount, icon_path)
+            
+            self.invalidateIcon(self._cursor.lastrowid)
         except sqlite3.IntegrityError as e:
             logging.warning(e)
             
-            self._connection.rollback()
+            self._db_ctrl.rollback()
         except sqlite3.Error as e:
             logging.exception(e)
             
-            self._connection.rollback()
+            self._db_ctrl.rollback()
             raise e
            
     def updateIcon(self, i_id, name, icon_path):
@@ -140,20 +159,23 @@ class IconController:
         # open and read icon
         icon = self.readImage(icon_path)
         
+        # loaded icon is changed
+        self.invalidateIcon(i_id)
+        
         try:
             self._cursor.execute("UPDATE Icons SET name = :name, icon = :icon WHERE id = :id;",
                                 {"icon" : icon, "name" : name, "id" : i_id})
-            self._connection.commit()
+            self._db_ctrl.commit()
             
             logging.info("icons updated: %i, with ID: %i, new icon image: %s", self._cursor.rowcount, i_id, icon_path)
         except sqlite3.IntegrityError as e:
             logging.warning(e)
             
-            self._connection.rollback()
+            self._db_ctrl.rollback()
         except sqlite3.Error as e:
             logging.exception(e)
             
-            self._connection.rollback()
+            self._db_ctrl.rollback()
             raise e
             
     def deleteIcon(self, i_id):
@@ -161,9 +183,11 @@ class IconController:
             Delete icon with ID.
             @param g_id: group ID
         """
+        self.invalidateIcon(i_id)
+        
         try:
             self._cursor.execute("DELETE FROM Icons WHERE id = :id;", {"id" : i_id})
-            self._connection.commit()
+            self._db_ctrl.commit()
             
             count = self._cursor.rowcount
             
@@ -174,9 +198,21 @@ class IconController:
         except sqlite3.Error as e:
             logging.exception(e)
             
-            self._connection.rollback()
+            self._db_ctrl.rollback()
             raise e
             
+    def invalidateIcon(self, i_id):
+        """
+            Remove icon and groups holding this icon from identity map.
+            
+            @param i_id: icon ID
+        """
+        self._db_ctrl.invalidateModel("Icons", i_id)
+        
+        for group in self._db_ctrl.selectModels("Groups"):
+            if (group._icon and group._icon._id == i_id):
+                self._db_ctrl.invalidateModel("Groups", group._id)
+            
     def readImage(self, path):
         """
             Reads image and prepare it for SQLite db.
@@ -209,6 +245,12 @@ class IconController:
             
             @param dic: icon returned from db
             
-            @return: IconModel object
+            @return: IconModel object, shared by identity map
         """
-        return IconModel(dic["id"], dic["name"], dic["icon"])
\ No newline at end of file
+        icon = self._db_ctrl.selectModel("Icons", dic["id"])
+        
+        if (not icon):
+            icon = IconModel(dic["id"], dic["name"], dic["icon"])
+            
+            self._db_ctrl.storeModel("Icons", dic["id"], icon)
+        return icon
\ No newline at end of file
@@ -24,7 +24,10 @@
     SOFTWARE.
 """
 import logging
+import time
+import CryptoBasics
 from UserController import UserController
+from PasswdController import PasswdController
 
 class LoginController:
     """
@@ -56,4 +59,42 @@ class LoginController:
         else:
             logging.debug("user NOT logged in")
             
-            return False
\ No newline at end of file
+            return False
+        
+    def changeMaster(self, user, old_master, new_master, progress = None):
+        """
+            Change master password of user. User gets new vault key, so all passwords and attachments are re-encrypted
+            and search index is rebuilt, see PasswdController.rekeyPasswords(). Everything is done in one transaction,
+            if it fails, old master password stays valid. Session keys are replaced after commit.
+            
+            @param user: logged user, UserModel
+            @param old_master: current master password, verified again
+            @param new_master: new master password
+            @param progress: function called with count of done and all passwords, or None
+            
+            @return: on succes new user object, other False
+        """
+        user_ctrl = UserController(self.__db_ctrl)
+        
+        if (not user_ctrl.selectByNameMaster(user._name.encode("utf-8"), old_master)):
+            logging.debug("master password NOT changed, wrong old password")
+            
+            return False
+        
+        start = time.time()
+        vault_key = CryptoBasics.genVaultKey()
+        
+        # passwords are decrypted by session keys of old master password
+        passwd_ctrl = PasswdController(self.__db_ctrl, old_master.decode("utf-8"))
+        
+        with self.__db_ctrl.transaction():
+            user_ctrl.updateVaultKey(user._id, new_master.decode("utf-8"), vault_key)
+            count = passwd_ctrl.rekeyPasswords(user._id, vault_key, progress)
+        
+        # keys of old master password are not needed anymore
+        CryptoBasics.clearSessionKeys()
+        CryptoBasics.openSession(user._id, new_master.decode("utf-8"), vault_key)
+        
+        logging.info("master password changed, passwords re-encrypted: %d, time: %.3f s", count, time.time() - start)
+        
+        return user_ctrl.selectByNameMaster(user._name.encode("utf-8"), new_master)
\ No newline at end of file
@@ -33,8 +33,7 @@ import os
 from LoginDialog import LoginDialog
 import AppSettings
 import TransController
-import shutil
-import time
+from BackupController import BackupThread
     
 def ifNotExCreate(directory):
     """
@@ -84,17 +83,8 @@ def main():
         # if default DB file doesnt exists, run create DB dialog
         login_dialog.enLogIn(False)
     else:
-        # leave only last 10 backups
-        backups = sorted(os.listdir(AppSettings.BACKUP_PATH), reverse=True)
-
-        if len(backups) >= 10:
-            for i in range(9, len(backups)):
-                os.remove(AppSettings.BACKUP_PATH + backups[i])
-        # first backup database
-        backup_file = AppSettings.BACKUP_PATH + time.strftime("%Y-%m-%dT%H:%M:%S_", time.localtime()) + os.path.basename(db_path)
-        logging.info("backup file: '%s'", backup_file)
-        
-        shutil.copyfile(AppSettings.decodePath(db_path), AppSettings.decodePath(backup_file))
+        # backup database in background, and leave only last backups
+        BackupThread(db_path).start()
 
     login_dialog.show()
     w = MainWindow(db_con)
@@ -33,10 +33,18 @@ from NewPasswdDialog import NewPasswdDialog
 from NewGroupDialog import NewGroupDialog
 import logging
 from UserController import UserController
+from PasswdController import PasswdController
 import AppSettings
 from EditGroupDialog import EditGroupDialog
+from BackupsDialog import BackupsDialog
+from ChangeMasterDialog import ChangeMasterDialog
+from ExpiryController import ExpiryController
+from ExpiringDialog import ExpiringDialog
+from DbWatcher import DbWatcher
 import shutil
 import InfoMsgBoxes
+import CryptoBasics
+import DecryptPool
 
 class MainWindow(QtGui.QMainWindow):
     """
@@ -53,6 +61,12 @@ class MainWindow(QtGui.QMainWindow):
         
         self._close_act = None
         
+        # expiration of passwords, loaded after login
+        self._expiry_ctrl = ExpiryController(db_ctrl, self)
+        
+        # database changes, started after login
+        self._db_watcher = DbWatcher(db_ctrl, self)
+        
         self.initUI()
         self.createActions()
         self.createMenu()
@@ -65,6 +79,12 @@ class MainWindow(QtGui.QMainWindow):
         logging.debug("deleting clipboard")
         QtGui.QApplication.clipboard().clear()
         
+        self._db_watcher.stop()
+        
+        # derived secret keys are not needed anymore
+        CryptoBasics.clearSessionKeys()
+        DecryptPool.closePool()
+        
         try:
             logging.info("removing tmp dir: '%s'", AppSettings.TMP_PATH)
             
@@ -149,7 +169,22 @@ class MainWindow(QtGui.QMainWindow):
         self._user = user_ctrl.selectByNameMaster(username, master)
         
         if (self._user):
+            passwd_ctrl = PasswdController(self._db_ctrl, self._user._master)
+            
+            # repack and index passwords from older database version, passwords stay usable if it fails
+            try:
+                # repacked passwords are indexed by upgrade
+                if (not passwd_ctrl.upgradeRecords(self._user._id)):
+                    passwd_ctrl.rebuildSearchIndex(self._user._id, True)
+            except Exception as e:
+                logging.exception(e)
+                
+                InfoMsgBoxes.showErrorMsg(e)
+            
+            self._expiry_ctrl.load(self._user)
             self.reloadItems()
+            
+            self._db_watcher.start(self._user)
         else:
             logging.error("something wrong, can't log in user.")
         self.show()
@@ -175,6 +210,12 @@ class MainWindow(QtGui.QMainWindow):
         # enable/disable delete action with selection password talbe
         self._passwords_table.signalSelChangedTypeId.connect(self.enDisPassGrpActions)
         
+        # notify expired passwords
+        self._expiry_ctrl.signalExpired.connect(self.showExpired)
+        
+        # changes commited by controllers and by other app instances, applied after controller finishes
+        self._db_watcher.signalChanged.connect(self.applyChanges, QtCore.Qt.QueuedConnection)
+        
     def createActions(self):
         """
             Initialize all actions, i.e. Close, Save etc.
@@ -187,6 +228,30 @@ class MainWindow(QtGui.QMainWindow):
         # connect to slot
         self._close_act.triggered.connect(QtCore.QCoreApplication.instance().quit)
         
+        # init backups action
+        self._backups_act = QtGui.QAction(tr("Backups"), self)
+        self._backups_act.setToolTip(tr("Restore, delete and prune database backups"))
+        
+        self._backups_act.triggered.connect(self.showBackupsDialog)
+        
+        # init change master password action
+        self._change_master_act = QtGui.QAction(tr("Change master password"), self)
+        self._change_master_act.setToolTip(tr("Change master password, all passwords are re-encrypted"))
+        
+        self._change_master_act.triggered.connect(self.showChangeMasterDialog)
+        
+        # init check search index action
+        self._check_index_act = QtGui.QAction(tr("Check search index"), self)
+        self._check_index_act.setToolTip(tr("Check search index of passwords, rebuild it if it is wrong"))
+        
+        self._check_index_act.triggered.connect(self.checkSearchIndex)
+        
+        # init expiring soon action
+        self._expiring_act = QtGui.QAction(tr("Expiring soon"), self)
+        self._expiring_act.setToolTip(tr("Show expired and soon expiring passwords"))
+        
+        self._expiring_act.triggered.connect(self.showExpiringDialog)
+        
         # init about action
         self._about_act = QtGui.QAction(tr("About"), self)
         self._about_act.setToolTip(tr("About UserPass Manager"))
@@ -304,11 +369,13 @@ class MainWindow(QtGui.QMainWindow):
         
         # create menu options and add actions
         file_menu = self.menuBar().addMenu(tr("&File"))
+        file_menu.addAction(self._backups_act)
         file_menu.addAction(self._close_act)
         
         password_menu = self.menuBar().addMenu(tr("Password"))
         password_menu.addAction(self._new_passwd)
         password_menu.addAction(self._del_passwd)
+        password_menu.addAction(self._expiring_act)
         
         group_menu = self.menuBar().addMenu(tr("Group"))
         group_menu.addAction(self._new_group)
@@ -316,6 +383,8 @@ class MainWindow(QtGui.QMainWindow):
         group_menu.addAction(self._del_group)
         
         settings_menu = self.menuBar().addMenu(tr("Settings"))
+        settings_menu.addAction(self._change_master_act)
+        settings_menu.addAction(self._check_index_act)
         
         about_menu = self.menuBar().addMenu(tr("About"))
         about_menu.addAction(self._about_act)
@@ -353,28 +422,103 @@ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLI
             @param p_id: password id to edit
         """
         edit_dialog = EditPasswdDialog(self, p_id, self._passwords_table._show_pass)
-        edit_dialog.signalPasswdSaved.connect(self.reloadItems)
+        edit_dialog.signalPasswdSaved.connect(self._detail_w.setPassword)
         
         edit_dialog.exec_()
         
+    def showBackupsDialog(self):
+        """
+            Show database backups dialog.
+        """
+        backups_dialog = BackupsDialog(AppSettings.readDbFilePath())
+        
+        backups_dialog.exec_()
+        
+    def showChangeMasterDialog(self):
+        """
+            Show change master password dialog.
+        """
+        change_dialog = ChangeMasterDialog(self)
+        change_dialog.signalMasterChanged.connect(self.setUserReload)
+        
+        change_dialog.exec_()
+        
+    def checkSearchIndex(self):
+        """
+            Check search index of user passwords, offer its rebuild, if some passwords have wrong tokens.
+        """
+        passwd_ctrl = PasswdController(self._db_ctrl, self._user._master)
+        
+        try:
+            wrong = passwd_ctrl.checkSearchIndex(self._user._id)
+            
+            if (not wrong):
+                InfoMsgBoxes.showInfoMsg(tr("Search index is correct.").encode("utf8"))
+                
+                return
+            msg = QtGui.QMessageBox(QtGui.QMessageBox.Question, tr("Check search index"), 
+                                    tr("Passwords with wrong search index:") + " %d\n\n" % len(wrong) 
+                                    + tr("Do you want rebuild search index?"))
+            msg.addButton(QtGui.QMessageBox.Yes)
+            msg.addButton(QtGui.QMessageBox.No)
+            
+            if (msg.exec_() == QtGui.QMessageBox.Yes):
+                indexed = passwd_ctrl.rebuildSearchIndex(self._user._id)
+                
+                InfoMsgBoxes.showInfoMsg(tr("Search index rebuilt, indexed passwords:").encode("utf8") + " %d" % indexed)
+        except Exception as e:
+            logging.exception(e)
+            
+            InfoMsgBoxes.showErrorMsg(e)
+        
+    def setUserReload(self, user):
+        """
+            Set user with new master password and reload items, all passwords were re-encrypted.
+            
+            @param user: UserModel object
+        """
+        self._user = user
+        
+        # loaded passwords have old keys
+        self._db_ctrl.invalidateModel()
+        
+        self._expiry_ctrl.load(self._user)
+        self.reloadItems()
+        
+        self._db_watcher.start(self._user)
+        
+    def showExpiringDialog(self):
+        """
+            Show expired and soon expiring passwords.
+        """
+        expiring_dialog = ExpiringDialog(self._expiry_ctrl)
+        expiring_dialog.signalEditPasswd.connect(self.showEditPasswdDialog)
+        
+        expiring_dialog.exec_()
+        
+    def showExpired(self, p_ids):
+        """
+            Notify user about expired passwords.
+            
+            @param p_ids: list of expired password IDs
+        """
+        titles = [self._expiry_ctrl.title(p_id) for p_id in p_ids]
+        
+        InfoMsgBoxes.showInfoMsg(tr("Passwords expired:").encode("utf8") + "\n\n" + "\n".join(titles))
+        
     def showNewPasswdDialog(self):
         """
             Password dialog to add new password.
         """
         new_pass_dialog = NewPasswdDialog(self, self._groups_tw.currentItemGroupID(), self._passwords_table._show_pass)
-        
-        if (new_pass_dialog.exec_() == QtGui.QDialog.Accepted):
-            # all done
-            self.reloadItems()
+        new_pass_dialog.exec_()
         
     def showNewGroupDialog(self):
         """
             Group dialog to add new password.
         """
         new_group_dialog = NewGroupDialog(self)
-        if (new_group_dialog.exec_() == QtGui.QDialog.Accepted):
-            # all done
-            self.reloadItems()
+        new_group_dialog.exec_()
         
     def deletePassword(self):
         """
@@ -402,7 +546,6 @@ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLI
             if (ret == QtGui.QMessageBox.Yes):
                 # delete password
                 self._passwords_table.deletePassword(p_id)
-                self.reloadItems()
         logging.debug("Not password selected title: %s", title)
         
     def deleteGroup(self):
@@ -426,7 +569,6 @@ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLI
             if (ret == QtGui.QMessageBox.Yes):
                 # delete password
                 self._groups_tw.deleteGroup(g_id)
-                self.reloadItems()
         logging.debug("Not group selected title: %s", title)
         
     def showEditGroupDialog(self):
@@ -438,10 +580,7 @@ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLI
         if (g_id):
             # is group selected
             edit_group_dialog = EditGroupDialog(self, g_id)
-            
-            if (edit_group_dialog.exec_() == QtGui.QDialog.Accepted):
-                # all done
-                self.reloadItems()
+            edit_group_dialog.exec_()
             
     def reloadItems(self, p_id = -1):
         """
@@ -460,4 +599,33 @@ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLI
         except Exception as e:
             logging.exception(e)
             
+            InfoMsgBoxes.showErrorMsg(e)
+            
+    def applyChanges(self, changes):
+        """
+            Display database changes, commited by this or other app instance, just changed rows are updated.
+            
+            @param changes: list of ChangeEvent objects
+        """
+        if (not self._user):
+            return
+        
+        try:
+            self._groups_tw.applyChanges(changes)
+            self._passwords_table.applyChanges(changes)
+            
+            p_ids = []
+            
+            for change in changes:
+                if (change._table == "Passwords"):
+                    p_ids += change._ids
+            
+            if (p_ids):
+                self._expiry_ctrl.updatePasswords(p_ids)
+            
+            if (not self._detail_w.isHidden() and self._detail_w._p_id in p_ids):
+                self._detail_w.setPassword(self._detail_w._p_id)
+        except Exception as e:
+            logging.exception(e)
+            
             InfoMsgBoxes.showErrorMsg(e)
\ No newline at end of file
@@ -41,6 +41,7 @@ class NewPasswdDialog(PasswdDialog):
             Save changes to database, read all iinputs and insert DB entry.
         """
         logging.debug("save button clicked.")
+        attachment = None
         
         try:
             title = str(self._title.text().toUtf8())
@@ -49,7 +50,8 @@ class NewPasswdDialog(PasswdDialog):
             url = str(self._url.text().toUtf8())
             comment = str(self._comment.toPlainText().toUtf8())
             att_name = str(self._att_name.text().toUtf8())
-            attachment = self._attachment_data
+            # opened new attachment file, stored chunk by chunk
+            attachment = self.openAttachmentSrc()
              
             # get group
             grp_id = self.getGroupId()
@@ -69,12 +71,18 @@ class NewPasswdDialog(PasswdDialog):
             # update password
             passwd_ctrl = PasswdController(self.__parent._db_ctrl, self.__parent._user._master)
             
-            passwd_ctrl.insertPassword(title, username, passwd, 
+            p_id = passwd_ctrl.insertPassword(title, username, passwd, 
                                      url, comment, c_date, e_date, 
                                      grp_id, self.__parent._user._id, attachment, 
                                      att_name, expire)
+            
+            if (p_id is not None):
+                self.signalPasswdSaved.emit(p_id)
             self.accept()
         except Exception as e:
             logging.exception(e)
             
-            InfoMsgBoxes.showErrorMsg(e)
\ No newline at end of file
+            InfoMsgBoxes.showErrorMsg(e)
+        finally:
+            if (attachment):
+                attachment.close()
\ No newline at end of file
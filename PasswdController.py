@@ -28,158 +28,550 @@ import sqlite3
 import CryptoBasics
 import time
 import struct
+import AppSettings
+import DecryptPool
 from PasswdModel import PasswdModel
+from GroupModel import GroupModel
+from IconModel import IconModel
+from UserModel import UserModel
+from AttachmentController import AttachmentController
+from SearchController import SearchController
+from ChangeEvent import ChangeEvent
 from TransController import tr
 
 class PasswdController:
     """
         Provides manipulating passwords in database. Encrypts and decrypts data.
     """
+    # encrypted columns, which can be selected by projection
+    _SECRET_COLUMNS = ["title", "username", "passwd", "url", "comment", "c_date", "m_date", "e_date", 
+                       "attachment", "att_name", "expire"]
+    
+    # columns stored in Passwords table, attachment is stored in Attachments table
+    _ROW_COLUMNS = [col for col in _SECRET_COLUMNS if col != "attachment"]
+    
+    # date columns, packed timestamps
+    _DATE_COLUMNS = ["c_date", "m_date", "e_date"]
+    
+    # record formats, stored in format column of every row
+    # every column encrypted separately
+    _FORMAT_COLUMNS = 1
+    # all columns packed to one record and encrypted at once, see packRecord()
+    _FORMAT_PACKED = 2
+    # packed record encrypted and authenticated by ChaCha20-Poly1305, see encryptRecord()
+    _FORMAT_AEAD = 3
+    # authenticated record, secret key is derived from user vault key, not from master password, see cipherKey()
+    _FORMAT_VAULT = 4
+    
+    # format of new and updated rows
+    _FORMAT_CURRENT = _FORMAT_VAULT
+    
+    # columns packed in record in this order, can't be changed
+    _RECORD_COLUMNS = ["title", "username", "passwd", "url", "comment", "c_date", "m_date", "e_date", "att_name", "expire"]
+    
+    # packed column length, little endian unsigned int
+    _RECORD_LEN = "<I"
+    
+    # record is decrypted by chunks, just to the end of accessed column
+    _RECORD_CHUNK = 64
+    
+    # passwords re-encrypted in one batch, when master password is changed
+    _REKEY_BATCH = 500
+    
+    # select password with its group, group icon and user, %s are selected password columns
+    _HYDRATE_SELECT = """SELECT Passwords.id, Passwords.grp_id, Passwords.user_id, Passwords.salt, Passwords.iv, 
+            Passwords.format, Passwords.record%s, 
+            Groups.name AS grp_name, Groups.description AS grp_description,
+            Icons.id AS icon_id, Icons.name AS icon_name, Icons.icon AS icon_icon,
+            Users.name AS user_name, Users.passwd AS user_passwd, Users.salt_p AS user_salt_p,
+            Users.kdf_salt AS user_kdf_salt, Users.kdf_iter AS user_kdf_iter, Users.vault_key AS user_vault_key
+        FROM Passwords 
+            LEFT JOIN Groups ON Groups.id = Passwords.grp_id
+            LEFT JOIN Icons ON Icons.id = Groups.icon_id
+            LEFT JOIN Users ON Users.id = Passwords.user_id"""
+    
+    # insert encrypted row
+    _INSERT_SQL = """INSERT INTO 
+        Passwords(title, username, passwd, url, comment, c_date, m_date, e_date, grp_id, user_id, attachment, att_name, salt, iv, expire,
+        format, record)
+        VALUES(:title, :username, :passwd, :url, :comment, :c_date, :m_date, :e_date, :grp_id, :user_id, :attachment, :att_name, 
+        :salt, :iv, :expire, :format, :record)"""
+    
+    # update encrypted row, salt and iv are not changed, separate columns are cleared, when row is packed
+    _UPDATE_SQL = """UPDATE Passwords SET title = :title, username = :username, passwd = :passwd, url = :url, 
+        comment = :comment, c_date = :c_date, m_date = :m_date, e_date = :e_date, grp_id = :grp_id,
+        attachment = :attachment, att_name = :att_name, expire = :expire, format = :format, record = :record WHERE id = :id;"""
+    
+    # update re-encrypted record, separate columns of older format are cleared, modification date is kept
+    _REKEY_SQL = """UPDATE Passwords SET title = NULL, username = NULL, passwd = NULL, url = NULL, comment = NULL, 
+        c_date = NULL, m_date = NULL, e_date = NULL, att_name = NULL, expire = NULL, format = :format, record = :record 
+        WHERE id = :id;"""
+    
     def __init__(self, db_controller, master):
         self._db_ctrl = db_controller
-        self._connection = db_controller._connection
-        self._cursor = db_controller._cursor
         self._master = master
+        self._search_ctrl = SearchController(db_controller)
         
         # timestamp encoding little endian and double precision
         self._TIME_PRECISION = "<d"
     
-    def selectAll(self):
+    @property
+    def _connection(self):
+        """
+            Connection of current thread from DB controller pool.
+        """
+        return self._db_ctrl.connection()
+    
+    @property
+    def _cursor(self):
+        """
+            Cursor of current thread connection from DB controller pool.
+        """
+        return self._db_ctrl.cursor()
+    
+    def selectAll(self, columns = None):
         """
             Select all password from table Passwords and decrypt.
+            @param columns: encrypted columns to select, decrypted on first access, other are loaded from DB, None all
             @return: rows touple of dictionaries, decrypted data
         """
+        return self.selectHydrated("", {}, columns)
+        
+    def selectById(self, p_id, columns = None):
+        """
+            Search password by id.
+            @paramp_id: password id
+            @param columns: encrypted columns to select, decrypted on first access, other are loaded from DB, None all
+            @return: row
+        """
+        passwords = self.selectHydrated("WHERE Passwords.id = :id", {"id" : p_id}, columns)
+        
+        if (passwords):
+            return passwords
+        return [None]
+        
+    def selectByGroupId(self, g_id, columns = None):
+        """
+            Search password by group id.
+            @param g_id: group id
+            @param columns: encrypted columns to select, decrypted on first access, other are loaded from DB, None all
+            @return: rows
+        """
+        return self.selectHydrated("WHERE Passwords.grp_id = :id", {"id" : g_id}, columns)
+        
+    def selectByUserId(self, u_id, columns = None):
+        """
+            Search password by user id.
+            @param u_id: group id
+            @param columns: encrypted columns to select, decrypted on first access, other are loaded from DB, None all
+            @return: rows
+        """
+        return self.selectHydrated("WHERE Passwords.user_id = :id", {"id" : u_id}, columns)
+        
+    def selectByUserGrpId(self, u_id, g_id, columns = None):
+        """
+            Search password by user and group id.
+            
+            @param u_id: user id
+            @param g_id: group id
+            @param columns: encrypted columns to select, decrypted on first access, other are loaded from DB, None all
+            @return: rows
+        """
+        return self.selectHydrated("WHERE Passwords.user_id = :id AND Passwords.grp_id = :g_id", {"id" : u_id, "g_id" : g_id}, columns)
+    
+    def selectHydrated(self, condition = "", params = None, columns = None):
+        """
+            Select passwords together with their group, group icon and user in one statement,
+            decrypt them and build model objects. Replaces separate group, icon and user selects for every password.
+            
+            @param condition: SQL condition appended to select, i.e. "WHERE Passwords.id = :id"
+            @param params: condition parameters, or None
+            @param columns: encrypted columns to select, decrypted on first access, other are loaded from DB, None all,
+                many passwords are decrypted at once in parallel, if enabled, see decryptParallel()
+            @return: list of PasswdModel objects
+        """
+        if (params is None):
+            params = {}
+        
+        # attachment is never selected with rows, it is loaded on first access
+        columns = [col for col in self.checkColumns(columns) if col in self._ROW_COLUMNS]
+        rows = []
+        
         try:
-            self._cursor.execute("SELECT * FROM Passwords;")
+            self._cursor.execute(self._HYDRATE_SELECT % "".join(", Passwords." + col for col in columns) + " " + condition + ";", params)
             rows = self._cursor.fetchall()
             
-            # decrypt selected data
-            for i in range(0, len(rows)):
-                rows[i] = self.decryptRowDic(rows[i])                      
-            
-            logging.info("passwords selected: %d", len(rows))
+            logging.info("passwords selected: %d, columns: %s", len(rows), columns)
         except sqlite3.Error as e:
             logging.exception(e)
             
             raise e
-        finally:
-            passwords = []
-            
-            for row in rows:
-                passwords.append(self.createPasswdObj(row))
-            return passwords
         
-    def selectById(self, p_id):
+        passwords = self.hydrateRows(rows, columns)
+        
+        if (columns and len(passwords) >= AppSettings.DECRYPT_PARALLEL_MIN):
+            self.decryptParallel(passwords)
+        return passwords
+    
+    def decryptParallel(self, passwords, workers = None):
         """
-            Search password by id.
-            @paramp_id: password id
-            @return: row
+            Decrypt selected columns of passwords in worker processes, opt-in by decrypt workers setting.
+            Secret keys are taken from session here, workers get just ciphertext and key. Results are in order 
+            of passwords, so it is deterministic. If decryption fails, passwords are decrypted on access.
+            
+            @param passwords: hydrated PasswdModel objects
+            @param workers: worker processes count, None from settings, see AppSettings.readDecryptWorkers()
+            @return: count of decrypted passwords, 0 if disabled
         """
+        if (workers is None):
+            workers = AppSettings.readDecryptWorkers()
+        
+        if (workers < 2):
+            return 0
+        
+        start = time.time()
+        tasks = []
+        
+        for passwd in passwords:
+            encrypted = passwd._encrypted
+            columns = [col for col in encrypted.get("columns", []) if col in passwd._lazy and col != "attachment"]
+            
+            # buffers are not picklable
+            data = dict((col, str(encrypted[col])) for col in columns if col in encrypted)
+            
+            if (encrypted["record"] is not None):
+                data["record"] = str(encrypted["record"])
+            data["format"] = encrypted["format"]
+            
+            tasks.append((data, str(self.rowKey(passwd)), str(passwd._iv), passwd._salt, columns))
+        
         try:
-            # select from table
-            self._cursor.execute("SELECT * FROM Passwords WHERE id = :id;", {"id" : p_id})
-            row = self._cursor.fetchone()
+            results = DecryptPool.mapOrdered(decryptTask, tasks, workers)
+        except Exception as e:
+            logging.warning("parallel decryption failed, passwords are decrypted on access, %s", e)
+            
+            return 0
+        
+        for passwd, decrypted in zip(passwords, results):
+            passwd.setDecrypted(decrypted)
+            
+            # ciphertext is not needed anymore
+            for col in decrypted:
+                passwd._encrypted.pop(col, None)
+        
+        logging.info("passwords decrypted in parallel: %d, workers: %d, time: %.3f s", len(passwords), workers, time.time() - start)
+        
+        return len(passwords)
+    
+    def hydrateRows(self, rows, columns):
+        """
+            Build PasswdModel objects from joined rows. Every group, icon and user is taken from DB controller
+            identity map, or created just once and shared by all passwords referencing it.
+            Nothing is decrypted, models keep ciphertext and decrypt columns on first access, see loadColumn().
+            
+            @param rows: rows selected with _HYDRATE_SELECT
+            @param columns: selected encrypted columns, other are loaded by PasswdModel on first access
+            @return: list of PasswdModel objects
+        """
+        passwords = []
+        
+        for row in rows:
+            # shared icon
+            icon = self._db_ctrl.selectModel("Icons", row["icon_id"])
             
-            # if exists ID
-            if (row):
-                count = 1
+            if (not icon):
+                icon = IconModel(row["icon_id"], row["icon_name"], row["icon_icon"])
                 
-                # now decrypt data
-                row = self.decryptRowDic(row)
-            else:
-                count = 0
+                self._db_ctrl.storeModel("Icons", row["icon_id"], icon)
             
-            logging.info("passwords selected: %d", count)
-        except sqlite3.Error as e:
-            logging.exception(e)
+            # shared group
+            grp = self._db_ctrl.selectModel("Groups", row["grp_id"])
             
-            raise e
-        finally:
-            return [self.createPasswdObj(row)]
+            if (not grp):
+                grp = GroupModel(row["grp_id"], row["grp_name"], row["grp_description"], icon = icon)
+                
+                self._db_ctrl.storeModel("Groups", row["grp_id"], grp)
+            
+            # shared user
+            user = self._db_ctrl.selectModel("Users", row["user_id"])
+            
+            if (not user):
+                user = UserModel(row["user_id"], row["user_name"], row["user_passwd"], row["user_salt_p"], None, 
+                                 row["user_kdf_salt"], row["user_kdf_iter"], row["user_vault_key"])
+                
+                self._db_ctrl.storeModel("Users", row["user_id"], user)
+            
+            # packed record contains all columns, selected columns are decrypted together
+            encrypted = {"format" : row["format"], "record" : row["record"], "columns" : columns}
+            
+            if (row["format"] == self._FORMAT_COLUMNS):
+                for col in columns:
+                    encrypted[col] = row[col]
+            
+            # sqlite3 returns BLOB as buffer, ciphers accept str
+            passwd = PasswdModel(row["id"], salt = row["salt"], iv = str(row["iv"]), grp = grp, user = user)
+            passwd.setLoader(self.loadColumn, self._SECRET_COLUMNS, encrypted)
+            
+            passwords.append(passwd)
+        return passwords
+    
+    def checkColumns(self, columns):
+        """
+            Check projected columns, just encrypted password columns are allowed.
+            
+            @param columns: columns list, None means all encrypted columns
+            @return: columns list
+        """
+        if (columns is None):
+            return list(self._SECRET_COLUMNS)
         
-    def selectByGroupId(self, g_id):
+        for col in columns:
+            if (col not in self._SECRET_COLUMNS):
+                raise ValueError("unknown password column: '%s'" % col)
+        return list(columns)
+    
+    def loadColumn(self, passwd, column):
         """
-            Search password by group id.
-            @param g_id: group id
-            @return: rows
+            Decrypt column of password, from ciphertext kept by model, or selected from DB, if it was not selected.
+            Used by PasswdModel to decrypt column on first access. Selected columns are decrypted together,
+            other columns one by one.
+            
+            @param passwd: PasswdModel object
+            @param column: encrypted column name
+            @return: dictionary of decrypted columns, contains column
         """
-        try:
-            # select from table
-            self._cursor.execute("SELECT * FROM Passwords WHERE grp_id = :id;", {"id" : g_id})
-            rows = self._cursor.fetchall()
+        column = self.checkColumns([column])[0]
+        
+        if (column == "attachment"):
+            return {column : AttachmentController(self._db_ctrl, self._master).selectAttachment(passwd._id, self.rowKey(passwd), passwd._iv)}
+        
+        encrypted = passwd._encrypted
+        columns = [col for col in encrypted.get("columns", []) if col in passwd._lazy and col != "attachment"]
+        
+        if (column not in columns):
+            columns = [column]
+        
+        if (encrypted.get("format", self._FORMAT_COLUMNS) == self._FORMAT_COLUMNS and column not in encrypted):
+            try:
+                self._cursor.execute("SELECT format, record, " + column + " FROM Passwords WHERE id = :id;", {"id" : passwd._id})
+                row = self._cursor.fetchone()
+                
+                logging.debug("password ID: %d, column loaded: %s", passwd._id, column)
+            except sqlite3.Error as e:
+                logging.exception(e)
+                
+                raise e
             
-            # decrypt selected data
-            for i in range(0, len(rows)):
-                rows[i] = self.decryptRowDic(rows[i])                      
+            if (not row):
+                return {column : None}
+            encrypted = dict(zip(row.keys(), row))
+        
+        decrypted = self.decryptColumns(encrypted, self.cipherKey(passwd._salt, encrypted["format"]), passwd._iv, passwd._salt, columns)
+        
+        # ciphertext is not needed anymore
+        for col in columns:
+            encrypted.pop(col, None)
+        return decrypted
+    
+    def decryptColumns(self, encrypted, secret_key, iv, salt, columns):
+        """
+            Decrypt columns of one password, from packed record or separate encrypted columns.
             
-            logging.info("passwords selected: %d", len(rows))
-        except sqlite3.Error as e:
-            logging.exception(e)
+            @param encrypted: dictionary with format, record and encrypted columns of older format
+            @param secret_key: secret key of row
+            @param iv: cipher input vector of row
+            @param salt: secret key salt of row
+            @param columns: encrypted column names, attachment excluded
+            @return: dictionary of decrypted columns
+        """
+        if (encrypted["format"] != self._FORMAT_COLUMNS):
+            return self.decryptRecordColumns(encrypted["record"], secret_key, columns, encrypted["format"], salt)
+        
+        # separate columns of one row have same key, decrypted at once
+        values = CryptoBasics.decryptMany([(iv, encrypted[col]) for col in columns], secret_key)
+        
+        return dict((col, self.unpackColumn(col, value)) for col, value in zip(columns, values))
+    
+    def cipherKey(self, salt, record_format = _FORMAT_CURRENT):
+        """
+            Return secret key of salt from session key cache. Older formats use key derived from master password,
+            see CryptoBasics.getCipherKey(), newer per-row key derived from vault key, see CryptoBasics.getRowKey().
+            Password attachment is encrypted by same key.
             
-            raise e
-        finally:
-            passwords = []
+            @param salt: secret key salt
+            @param record_format: format of row
+            @return: secret key
+        """
+        if (record_format >= self._FORMAT_VAULT):
+            return CryptoBasics.getRowKey(salt)
+        return CryptoBasics.getCipherKey(self._master, salt)
+    
+    def rowKey(self, passwd):
+        """
+            Return secret key of selected password, depends on its record format.
             
-            for row in rows:
-                passwords.append(self.createPasswdObj(row))
-            return passwords
+            @param passwd: PasswdModel object
+            @return: secret key
+        """
+        return self.cipherKey(passwd._salt, passwd._encrypted.get("format", self._FORMAT_COLUMNS))
+    
+    def upgradeAttachment(self, passwd):
+        """
+            Re-encrypt attachment of password updated to current format, if its secret key was changed.
+            Have to run in transaction with row update.
+            
+            @param passwd: PasswdModel object, selected before update
+        """
+        old_key = self.rowKey(passwd)
+        new_key = self.cipherKey(passwd._salt)
         
-    def selectByUserId(self, u_id):
+        if (old_key != new_key):
+            AttachmentController(self._db_ctrl, self._master).reencryptAttachment(passwd._id, old_key, passwd._iv, new_key, passwd._iv)
+    
+    def unpackColumn(self, column, data):
         """
-            Search password by user id.
-            @param u_id: group id
-            @return: rows
+            Unpack decrypted column value, dates are unpacked to timestamp.
+            
+            @param column: column name
+            @param data: decrypted data
+            @return: column value
         """
-        try:
-            # select from table
-            self._cursor.execute("SELECT * FROM Passwords WHERE user_id = :id;", {"id" : u_id})
-            rows = self._cursor.fetchall()
+        if (column in self._DATE_COLUMNS):
+            # unpack returns a touple, but I need just one value
+            data = struct.unpack(self._TIME_PRECISION, data)[0]
+        return data
+    
+    def packRecord(self, dic):
+        """
+            Pack record columns to one buffer. Every column is prefixed by its length, dates are packed timestamps.
             
-            # decrypt selected data
-            for i in range(0, len(rows)):
-                rows[i] = self.decryptRowDic(rows[i])                      
+            @param dic: dictionary with _RECORD_COLUMNS
+            @return: packed record string
+        """
+        packed = []
+        
+        for col in self._RECORD_COLUMNS:
+            value = dic[col]
             
-            logging.info("passwords selected: %d", len(rows))
-        except sqlite3.Error as e:
-            logging.exception(e)
+            if (col in self._DATE_COLUMNS):
+                value = struct.pack(self._TIME_PRECISION, value)
+            elif (isinstance(value, unicode)):
+                value = value.encode("utf8")
             
-            raise e
-        finally:
-            passwords = []
+            packed.append(struct.pack(self._RECORD_LEN, len(value)))
+            packed.append(value)
+        return "".join(packed)
+    
+    def unpackRecord(self, data):
+        """
+            Unpack record packed by packRecord().
             
-            for row in rows:
-                passwords.append(self.createPasswdObj(row))
-            return passwords
+            @param data: packed record string
+            @return: dictionary with _RECORD_COLUMNS
+        """
+        dic = {}
+        offset = 0
+        len_size = struct.calcsize(self._RECORD_LEN)
         
-    def selectByUserGrpId(self, u_id, g_id):
+        for col in self._RECORD_COLUMNS:
+            size = struct.unpack_from(self._RECORD_LEN, data, offset)[0]
+            offset += len_size
+            
+            value = data[offset:offset + size]
+            offset += size
+            
+            if (col in self._DATE_COLUMNS):
+                # unpack returns a touple, but I need just one value
+                value = struct.unpack(self._TIME_PRECISION, value)[0]
+            dic[col] = value
+        return dic
+    
+    def encryptRecord(self, dic, secret_key, salt):
         """
-            Search password by user and group id.
+            Pack, encrypt and authenticate record at once, record is stored in _FORMAT_AEAD or _FORMAT_VAULT.
+            Every record has own nonce. Salt is authenticated too, so record can't be moved to other row.
             
-            @param u_id: user id
-            @param g_id: group id
-            @return: rows
+            @param dic: dictionary with _RECORD_COLUMNS
+            @param secret_key: secret key
+            @param salt: secret key salt of row
+            @return: encrypted record
         """
-        try:
-            # select from table
-            self._cursor.execute("SELECT * FROM Passwords WHERE user_id = :id AND grp_id = :g_id;", {"id" : u_id, "g_id" : g_id})
-            rows = self._cursor.fetchall()
+        return CryptoBasics.encryptDataAead(self.packRecord(dic), secret_key, str(salt))
+    
+    def decryptRecord(self, data, secret_key, record_format, salt):
+        """
+            Decrypt and unpack record encrypted by encryptRecord(), or older CBC record with IV before encrypted data.
             
-            # decrypt selected data
-            for i in range(0, len(rows)):
-                rows[i] = self.decryptRowDic(rows[i])                      
+            @param data: encrypted record
+            @param secret_key: secret key
+            @param record_format: _FORMAT_PACKED, _FORMAT_AEAD or _FORMAT_VAULT
+            @param salt: secret key salt of row
+            @return: dictionary with _RECORD_COLUMNS
+            @raise ValueError: authenticated record was modified
+        """
+        data = str(data)
+        
+        if (record_format >= self._FORMAT_AEAD):
+            try:
+                return self.unpackRecord(CryptoBasics.decryptDataAead(data, secret_key, str(salt)))
+            except ValueError as e:
+                logging.error("record authentication failed, salt: %s", salt)
+                
+                raise e
+        return self.unpackRecord(CryptoBasics.decryptDataAutoPad(data[CryptoBasics.IV_LEN:], secret_key, data[:CryptoBasics.IV_LEN]))
+    
+    def decryptRecordColumns(self, data, secret_key, columns, record_format = _FORMAT_PACKED, salt = None):
+        """
+            Decrypt columns of record encrypted by encryptRecord(). Authenticated record is decrypted and verified whole.
+            CBC mode allows to decrypt record prefix, so CBC record is decrypted just to the end of last column,
+            columns after it stay encrypted. Other decrypted columns are not returned.
             
-            logging.info("passwords selected: %d", len(rows))
-        except sqlite3.Error as e:
-            logging.exception(e)
+            @param data: encrypted record
+            @param secret_key: secret key
+            @param columns: column names from _RECORD_COLUMNS
+            @param record_format: _FORMAT_PACKED, _FORMAT_AEAD or _FORMAT_VAULT
+            @param salt: secret key salt of row, authenticated by _FORMAT_AEAD and _FORMAT_VAULT
+            @return: dictionary of decrypted columns
+        """
+        if (record_format >= self._FORMAT_AEAD):
+            dic = self.decryptRecord(data, secret_key, record_format, salt)
             
-            raise e
-        finally:
-            passwords = []
+            return dict((col, dic[col]) for col in columns)
+        
+        chunks = (data[i:i + self._RECORD_CHUNK] for i in range(CryptoBasics.IV_LEN, len(data), self._RECORD_CHUNK))
+        plain = CryptoBasics.decryptChunks(chunks, secret_key, data[:CryptoBasics.IV_LEN])
+        
+        dic = {}
+        buf = ""
+        offset = 0
+        len_size = struct.calcsize(self._RECORD_LEN)
+        
+        for col in self._RECORD_COLUMNS:
+            if (len(dic) == len(columns)):
+                break
             
-            for row in rows:
-                passwords.append(self.createPasswdObj(row))
-            return passwords
-
+            while (len(buf) < offset + len_size):
+                buf += next(plain)
+            
+            size = struct.unpack_from(self._RECORD_LEN, buf, offset)[0]
+            offset += len_size
+            
+            if (col in columns):
+                while (len(buf) < offset + size):
+                    buf += next(plain)
+                
+                value = buf[offset:offset + size]
+                
+                if (col in self._DATE_COLUMNS):
+                    # unpack returns a touple, but I need just one value
+                    value = struct.unpack(self._TIME_PRECISION, value)[0]
+                dic[col] = value
+            offset += size
+        
+        if (len(dic) != len(columns)):
+            raise ValueError("unknown record columns: %s" % [col for col in columns if col not in dic])
+        return dic
+    
     def insertPassword(self, title, username, passwd, url, comment, c_date, e_date, grp_id, user_id, attachment, att_name, expire):
         """
             Inserts password in table Passwords. Encrypts inserted data. Only grp_id, user_id salt and iv are not encrypted.
@@ -192,38 +584,45 @@ class PasswdController:
             @param e_date: date of expiration
             @param grp_id: password group ID, from Groups table
             @param user_id: user ID, from Users table
-            @param attachment: attachment of password
+            @param attachment: attachment of password, data string or opened binary file, stored chunked
             @param att_name: attachment name
             @param expire: if password expires, should be set to 'true' string
+            
+            @return: inserted password ID, None if not inserted
         """
+        p_id = None
         salt = CryptoBasics.genKeySalt().decode("utf8")
         iv = CryptoBasics.genIV()
         
         # encrypt data       
         encrypted_row = self.encryptAndPrepRow(title, username, passwd, url, 
                                                comment, c_date, e_date, 
-                                               grp_id, user_id, attachment,
+                                               grp_id, user_id, None,
                                                att_name, 
                                                salt, iv, expire)
         
         try:
-            self._cursor.execute("""INSERT INTO 
-                Passwords(title, username, passwd, url, comment, c_date, m_date, e_date, grp_id, user_id, attachment, att_name, salt, iv, expire)
-                VALUES(:title, :username, :passwd, :url, :comment, :c_date, :m_date, :e_date, :grp_id, :user_id, :attachment, :att_name, 
-                :salt, :iv, :expire)""",
-                                  encrypted_row)
-            self._connection.commit()
-            
-            logging.info("passwords with ID: %d, inserted: %d", self._cursor.lastrowid, self._cursor.rowcount)
+            # password with attachment at once
+            with self._db_ctrl.transaction():
+                self._cursor.execute(self._INSERT_SQL, encrypted_row)
+                p_id = self._cursor.lastrowid
+                
+                logging.info("passwords with ID: %d, inserted: %d", p_id, self._cursor.rowcount)
+                
+                self._search_ctrl.indexPasswords([(p_id, user_id, [title, url])])
+                self._db_ctrl.recordChange("Passwords", ChangeEvent.INSERTED, [p_id])
+                
+                if (attachment):
+                    AttachmentController(self._db_ctrl, self._master).insertAttachment(p_id, self.cipherKey(salt), iv, attachment)
         except sqlite3.IntegrityError as e:
             logging.warning(e)
             
-            self._connection.rollback()
+            p_id = None
         except sqlite3.Error as e:
             logging.exception(e)
             
-            self._connection.rollback()
             raise e
+        return p_id
             
     def updatePasswd(self, p_id, title, username, passwd, url, comment, e_date, grp_id, user_id, attachment, att_name, expire):
         """
@@ -236,41 +635,44 @@ class PasswdController:
             @param e_date: date of expiration
             @param grp_id: password group ID, from Groups table
             @param user_id: user ID, from Users table
-            @param attachment: attachment of password
+            @param attachment: attachment of password, data string or opened binary file, stored chunked,
+                None keeps current attachment
             @param att_name: attachment name
             @param expire: if password expires, should be set to 'true' string
         """
         try:
-            # first select old row to get salt and iv
-            old = self.selectById(p_id)[0]
+            # first select old row to get salt and iv, just creation date is needed
+            old = self.selectById(p_id, ["c_date"])[0]
             
             # if old row exists
             if old:
                 # encrypt data and prepare for sqlite
                 # creation date doesnt matter, cant be changed
                 row = self.encryptAndPrepRow(title, username, passwd, url, comment, old._c_date, 
-                                             e_date, grp_id, user_id, attachment, att_name, old._salt, old._iv, expire)
+                                             e_date, grp_id, user_id, None, att_name, old._salt, old._iv, expire)
                 
                 # add password ID to row
                 row["id"] = p_id
                 
-                self._cursor.execute("""UPDATE Passwords SET title = :title, username = :username, passwd = :passwd, url = :url, 
-                                    comment = :comment, m_date = :m_date, e_date = :e_date, grp_id = :grp_id,
-                                    attachment = :attachment, att_name = :att_name, expire = :expire WHERE id = :id;""", row)
-                self._connection.commit()
+                # password with attachment at once
+                with self._db_ctrl.transaction():
+                    self._cursor.execute(self._UPDATE_SQL, row)
+                    
+                    self._search_ctrl.indexPasswords([(p_id, user_id, [title, url])])
+                    self._db_ctrl.recordChange("Passwords", ChangeEvent.UPDATED, [p_id])
+                    
+                    if (attachment is not None):
+                        AttachmentController(self._db_ctrl, self._master).insertAttachment(p_id, self.cipherKey(old._salt), old._iv, 
+                                                                                          attachment)
+                    else:
+                        self.upgradeAttachment(old)
                 
                 logging.debug("passwd with ID: %d updated.", p_id)
             else:
                 logging.warning("password with id: %d doesn't exists. Can't be updated.", p_id)
-        except sqlite3.IntegrityError as e:
-            logging.exception(e)
-            
-            self._connection.rollback()
-            raise e
         except sqlite3.Error as e:
             logging.exception(e)
             
-            self._connection.rollback()
             raise e
           
     def updatePasswdDic(self, row):
@@ -282,16 +684,499 @@ class PasswdController:
         self.updatePasswd(row["p_id"], row["title"], row["username"], row["passwd"], row["url"], row["comment"], 
                         row["e_date"], row["grp_id"], row["user_id"], row["attachment"], row["att_name"], row["expire"])
         
+    def insertPasswords(self, passwords):
+        """
+            Inserts many passwords at once, in one transaction. Rows are encrypted first and inserted by executemany,
+            passwords with attachment are inserted one by one, because their ID is needed.
+            Failed rows are skipped and reported, other are inserted.
+            
+            @param passwords: iterable of dictionaries with insertPassword() parameters as keys, i.e. title
+            
+            @return: list of failures, touples (index in passwords, exception)
+        """
+        failures = []
+        rows = []
+        att_rows = []
+        
+        # indexed values, by salt, IDs are selected after insert
+        indexed = {}
+        
+        # encrypt batch
+        for i, passwd in enumerate(passwords):
+            try:
+                salt = CryptoBasics.genKeySalt().decode("utf8")
+                iv = CryptoBasics.genIV()
+                
+                row = self.encryptAndPrepRow(passwd["title"], passwd["username"], passwd["passwd"], passwd["url"], 
+                                             passwd["comment"], passwd["c_date"], passwd["e_date"], passwd["grp_id"], 
+                                             passwd["user_id"], None, passwd["att_name"], salt, iv, passwd["expire"])
+                
+                indexed[salt] = (passwd["user_id"], [passwd["title"], passwd["url"]])
+                
+                if (passwd.get("attachment")):
+                    att_rows.append((i, row, passwd["attachment"]))
+                else:
+                    rows.append((i, row))
+            except Exception as e:
+                logging.warning("password at index: %d not encrypted, %s", i, e)
+                
+                failures.append((i, e))
+        
+        try:
+            with self._db_ctrl.transaction():
+                self._cursor.execute("SELECT MAX(id) FROM Passwords;")
+                max_id = self._cursor.fetchone()[0] or 0
+                
+                failures += self.executeBatch(self._INSERT_SQL, rows)
+                
+                # passwords with attachment, one by one
+                for i, row, attachment in att_rows:
+                    try:
+                        with self._db_ctrl.transaction():
+                            self._cursor.execute(self._INSERT_SQL, row)
+                            
+                            AttachmentController(self._db_ctrl, self._master).insertAttachment(self._cursor.lastrowid, 
+                                                                                              self.cipherKey(row["salt"]), str(row["iv"]), 
+                                                                                              attachment)
+                    except sqlite3.Error as e:
+                        logging.warning("password at index: %d not inserted, %s", i, e)
+                        
+                        failures.append((i, e))
+                
+                # inserted rows, salt is unique for every row
+                self._cursor.execute("SELECT id, salt FROM Passwords WHERE id > :id;", {"id" : max_id})
+                inserted = [row for row in self._cursor.fetchall() if row["salt"] in indexed]
+                
+                self._search_ctrl.indexPasswords([(row["id"], ) + indexed[row["salt"]] for row in inserted])
+                self._db_ctrl.recordChange("Passwords", ChangeEvent.INSERTED, [row["id"] for row in inserted])
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+        
+        logging.info("passwords inserted: %d, failed: %d", len(inserted), len(failures))
+        
+        return sorted(failures)
+    
+    def updatePasswords(self, passwords):
+        """
+            Updates many passwords at once, in one transaction. Rows are encrypted first and updated by executemany.
+            Failed rows are skipped and reported, other are updated.
+            
+            @param passwords: iterable of dictionaries with updatePasswd() parameters as keys, i.e. p_id, title
+            
+            @return: list of failures, touples (index in passwords, exception)
+        """
+        passwords = list(passwords)
+        failures = []
+        rows = []
+        att_rows = []
+        
+        # indexed values, by index in passwords
+        indexed = {}
+        
+        # creation dates, salts and IVs of old rows
+        old = {}
+        
+        for passwd in self.selectByIds([passwd["p_id"] for passwd in passwords], ["c_date"]):
+            old[passwd._id] = passwd
+        
+        # encrypt batch
+        for i, passwd in enumerate(passwords):
+            try:
+                if (passwd["p_id"] not in old):
+                    raise KeyError("password with id: %s doesn't exists" % passwd["p_id"])
+                o = old[passwd["p_id"]]
+                
+                row = self.encryptAndPrepRow(passwd["title"], passwd["username"], passwd["passwd"], passwd["url"], 
+                                             passwd["comment"], o._c_date, passwd["e_date"], passwd["grp_id"], 
+                                             passwd["user_id"], None, passwd["att_name"], o._salt, o._iv, passwd["expire"])
+                row["id"] = passwd["p_id"]
+                
+                indexed[i] = (passwd["p_id"], passwd["user_id"], [passwd["title"], passwd["url"]])
+                
+                # attachment of older row is re-encrypted with row
+                if (passwd.get("attachment") is not None or (self.rowKey(o) != self.cipherKey(o._salt) and 
+                                                             AttachmentController(self._db_ctrl, self._master).hasAttachment(o._id))):
+                    att_rows.append((i, row, passwd.get("attachment")))
+                else:
+                    rows.append((i, row))
+            except Exception as e:
+                logging.warning("password at index: %d not encrypted, %s", i, e)
+                
+                failures.append((i, e))
+        
+        try:
+            with self._db_ctrl.transaction():
+                failures += self.executeBatch(self._UPDATE_SQL, rows)
+                
+                # passwords with attachment, one by one
+                for i, row, attachment in att_rows:
+                    try:
+                        with self._db_ctrl.transaction():
+                            self._cursor.execute(self._UPDATE_SQL, row)
+                            
+                            if (attachment is not None):
+                                AttachmentController(self._db_ctrl, self._master).insertAttachment(row["id"], self.cipherKey(row["salt"]), 
+                                                                                                  str(row["iv"]), attachment)
+                            else:
+                                self.upgradeAttachment(old[row["id"]])
+                    except sqlite3.Error as e:
+                        logging.warning("password at index: %d not updated, %s", i, e)
+                        
+                        failures.append((i, e))
+                
+                failed = set(i for i, e in failures)
+                updated = [indexed[i] for i in sorted(indexed) if i not in failed]
+                
+                self._search_ctrl.indexPasswords(updated)
+                self._db_ctrl.recordChange("Passwords", ChangeEvent.UPDATED, [passwd[0] for passwd in updated])
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+        
+        logging.info("passwords updated: %d, failed: %d", len(passwords) - len(failures), len(failures))
+        
+        return sorted(failures)
+    
+    def executeBatch(self, sql, rows):
+        """
+            Execute statement for all rows by executemany in savepoint. If it fails, 
+            rows are executed one by one, to find failed rows.
+            
+            @param sql: SQL statement
+            @param rows: list of touples (index, row dictionary)
+            
+            @return: list of failures, touples (index, exception)
+        """
+        failures = []
+        
+        try:
+            with self._db_ctrl.transaction():
+                self._cursor.executemany(sql, [row for i, row in rows])
+        except sqlite3.Error as e:
+            logging.warning("batch failed, executing one by one, %s", e)
+            
+            for i, row in rows:
+                try:
+                    with self._db_ctrl.transaction():
+                        self._cursor.execute(sql, row)
+                except sqlite3.Error as e:
+                    logging.warning("row at index: %d failed, %s", i, e)
+                    
+                    failures.append((i, e))
+        return failures
+    
+    def searchPasswords(self, user_id, query, columns = None):
+        """
+            Search user passwords by title and URL in blind search index. Just candidates are decrypted.
+            
+            @param user_id: user ID
+            @param query: utf8 string, all words have to be in title or URL
+            @param columns: encrypted columns to select and decrypt, title and URL are always selected, None all
+            @return: rows
+        """
+        if (columns is not None):
+            columns = list(columns) + [col for col in ["title", "url"] if col not in columns]
+        passwords = self.selectByIds(self._search_ctrl.selectCandidates(user_id, query), columns)
+        
+        passwords = [passwd for passwd in passwords if self._search_ctrl.matches(query, [passwd._title, passwd._url])]
+        
+        logging.info("passwords found: %d", len(passwords))
+        
+        return passwords
+    
+    def rebuildSearchIndex(self, user_id, unindexed = False):
+        """
+            Rebuild blind search index of user passwords, in one transaction. Passwords, which can't be decrypted, are skipped.
+            
+            @param user_id: user ID
+            @param unindexed: index just passwords not marked as indexed, i.e. after database conversion
+            @return: count of indexed passwords
+        """
+        if (unindexed):
+            passwords = self.selectByIds(self._search_ctrl.selectUnindexed(user_id), ["title", "url"])
+        else:
+            passwords = self.selectByUserId(user_id, ["title", "url"])
+        
+        indexed = []
+        
+        for passwd in passwords:
+            # broken password is skipped, it is not found by search
+            try:
+                indexed.append((passwd._id, user_id, [passwd._title, passwd._url]))
+            except Exception as e:
+                logging.warning("password with ID: %d not indexed, %s", passwd._id, e)
+        
+        if (indexed):
+            with self._db_ctrl.transaction():
+                self._search_ctrl.indexPasswords(indexed)
+        
+        logging.info("passwords indexed: %d, failed: %d", len(indexed), len(passwords) - len(indexed))
+        
+        return len(indexed)
+    
+    def upgradeRecords(self, user_id):
+        """
+            Repack user passwords stored in older record format to current format, in one transaction.
+            Modification dates are kept. Attachments are re-encrypted, if secret key of row is changed.
+            Failed passwords are logged and skipped, they stay in older format. Search index is rebuilt after upgrade.
+            Called after login, because master password and vault key are needed.
+            
+            @param user_id: user ID
+            @return: count of upgraded passwords
+        """
+        try:
+            self._cursor.execute("SELECT id FROM Passwords WHERE user_id = :id AND format < :format;", 
+                                 {"id" : user_id, "format" : self._FORMAT_CURRENT})
+            p_ids = [row["id"] for row in self._cursor.fetchall()]
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+        
+        failures = []
+        
+        # attachments are re-encrypted, if secret key is changed
+        att_ids = AttachmentController(self._db_ctrl, self._master).selectPasswdIds()
+        
+        with self._db_ctrl.transaction():
+            # not whole vault decrypted at once
+            for i in range(0, len(p_ids), 1000):
+                rows = []
+                att_rows = []
+                
+                for passwd in self.selectByIds(p_ids[i:i + 1000], self._ROW_COLUMNS):
+                    # broken row is skipped, it stays in older format
+                    try:
+                        row = self.encryptAndPrepRow(passwd._title, passwd._username, passwd._passwd, passwd._url, passwd._comment, 
+                                                     passwd._c_date, passwd._e_date, passwd._grp._id, user_id, None, passwd._att_name, 
+                                                     passwd._salt, passwd._iv, passwd._expire, passwd._m_date)
+                    except Exception as e:
+                        logging.warning("password with ID: %d not upgraded, %s", passwd._id, e)
+                        
+                        failures.append((passwd._id, e))
+                        continue
+                    row["id"] = passwd._id
+                    
+                    if (passwd._id in att_ids):
+                        att_rows.append((passwd, row))
+                    else:
+                        rows.append((passwd._id, row))
+                
+                failures += self.executeBatch(self._UPDATE_SQL, rows)
+                
+                # passwords with attachment, one by one, in savepoint with its attachment
+                for passwd, row in att_rows:
+                    try:
+                        with self._db_ctrl.transaction():
+                            self._cursor.execute(self._UPDATE_SQL, row)
+                            
+                            self.upgradeAttachment(passwd)
+                    except Exception as e:
+                        logging.warning("password with ID: %d not upgraded, %s", passwd._id, e)
+                        
+                        failures.append((passwd._id, e))
+        
+        upgraded = len(p_ids) - len(failures)
+        
+        logging.info("passwords upgraded: %d, failed: %d", upgraded, len(failures))
+        
+        # index of older format could be built by older key
+        if (upgraded):
+            self.rebuildSearchIndex(user_id)
+        
+        return upgraded
+    
+    def rekeyPasswords(self, user_id, vault_key, progress = None, workers = None):
+        """
+            Re-encrypt all user passwords by row keys derived from new vault key, and rebuild their search index 
+            by new vault key. Passwords are streamed by batches ordered by ID, whole vault is never decrypted at once.
+            Records are re-encrypted in worker processes, if enabled, see decryptParallel(). Attachments are re-encrypted
+            by chunks. Old keys are taken from session, so it has to be called before session is opened with new vault key,
+            in one transaction with user vault key change, see LoginController.changeMaster().
+            
+            @param user_id: user ID
+            @param vault_key: new vault key
+            @param progress: function called after every batch with count of done and all passwords, or None
+            @param workers: worker processes count, None from settings, see AppSettings.readDecryptWorkers()
+            @return: count of re-encrypted passwords
+        """
+        if (workers is None):
+            workers = AppSettings.readDecryptWorkers()
+        
+        start = time.time()
+        vault_hmac = CryptoBasics.genVaultHmac(vault_key)
+        search_ctrl = SearchController(self._db_ctrl, vault_key)
+        att_ctrl = AttachmentController(self._db_ctrl, self._master)
+        att_ids = att_ctrl.selectPasswdIds()
+        
+        try:
+            self._cursor.execute("SELECT COUNT(*) AS count FROM Passwords WHERE user_id = :id;", {"id" : user_id})
+            total = self._cursor.fetchone()["count"]
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+        
+        done = 0
+        last_id = -1
+        
+        while (True):
+            try:
+                self._cursor.execute("SELECT id, salt, iv, format, record, " + ", ".join(self._RECORD_COLUMNS) + """ 
+                    FROM Passwords WHERE user_id = :user_id AND id > :last_id ORDER BY id LIMIT :limit;""", 
+                                     {"user_id" : user_id, "last_id" : last_id, "limit" : self._REKEY_BATCH})
+                rows = self._cursor.fetchall()
+            except sqlite3.Error as e:
+                logging.exception(e)
+                
+                raise e
+            
+            if (not rows):
+                break
+            last_id = rows[-1]["id"]
+            
+            tasks = []
+            keys = []
+            
+            for row in rows:
+                # buffers are not picklable
+                encrypted = {"format" : row["format"], "record" : None if row["record"] is None else str(row["record"])}
+                
+                if (row["format"] == self._FORMAT_COLUMNS):
+                    encrypted.update((col, str(row[col])) for col in self._RECORD_COLUMNS)
+                
+                old_key = str(self.cipherKey(row["salt"], row["format"]))
+                new_key = CryptoBasics.genRowKey(vault_hmac, row["salt"])
+                
+                keys.append((old_key, new_key))
+                tasks.append((encrypted, old_key, str(row["iv"]), row["salt"], new_key))
+            
+            results = None
+            
+            if (workers >= 2):
+                try:
+                    results = DecryptPool.mapOrdered(rekeyTask, tasks, workers)
+                except Exception as e:
+                    logging.warning("parallel re-encryption failed, passwords are re-encrypted here, %s", e)
+                    
+                    workers = 0
+            
+            if (results is None):
+                results = [self.rekeyRecord(*task) for task in tasks]
+            
+            try:
+                self._cursor.executemany(self._REKEY_SQL, [{"id" : row["id"], "format" : self._FORMAT_CURRENT, 
+                                                            "record" : sqlite3.Binary(record)} for row, (record, dic) in zip(rows, results)])
+                
+                for row, (old_key, new_key) in zip(rows, keys):
+                    if (row["id"] in att_ids):
+                        att_ctrl.reencryptAttachment(row["id"], old_key, str(row["iv"]), new_key, str(row["iv"]))
+                
+                # changes are not recorded, values are same, all passwords are reloaded after master password change
+                search_ctrl.indexPasswords([(row["id"], user_id, [dic["title"], dic["url"]]) for row, (record, dic) in zip(rows, results)])
+            except sqlite3.Error as e:
+                logging.exception(e)
+                
+                raise e
+            
+            done += len(rows)
+            
+            if (progress):
+                progress(done, total)
+        
+        logging.info("passwords re-encrypted: %d, workers: %d, time: %.3f s", done, workers, time.time() - start)
+        
+        return done
+    
+    def rekeyRecord(self, encrypted, secret_key, iv, salt, new_key):
+        """
+            Decrypt record of one password and encrypt it by new secret key in current format, see rekeyPasswords().
+            
+            @param encrypted: dictionary with format, record and encrypted columns of older format
+            @param secret_key: old secret key of row
+            @param iv: cipher input vector of row
+            @param salt: secret key salt of row
+            @param new_key: new secret key of row
+            @return: touple (encrypted record, dictionary of decrypted columns)
+        """
+        dic = self.decryptColumns(encrypted, secret_key, iv, salt, self._RECORD_COLUMNS)
+        
+        return (self.encryptRecord(dic, new_key, salt), dic)
+    
+    def checkSearchIndex(self, user_id):
+        """
+            Check blind search index of user passwords, compare stored tokens with tokens of decrypted values.
+            
+            @param user_id: user ID
+            @return: list of IDs of passwords with wrong tokens
+        """
+        stored = self._search_ctrl.selectTokens(user_id)
+        wrong = []
+        
+        for passwd in self.selectByUserId(user_id, ["title", "url"]):
+            if (stored.get(passwd._id, set()) != self._search_ctrl.genTokens(user_id, [passwd._title, passwd._url])):
+                wrong.append(passwd._id)
+        
+        logging.info("passwords with wrong search index: %d", len(wrong))
+        
+        return wrong
+    
+    def selectByIds(self, p_ids, columns = None):
+        """
+            Search passwords by IDs.
+            
+            @param p_ids: list of password IDs
+            @param columns: encrypted columns to select, decrypted on first access, other are loaded from DB, None all
+            @return: rows
+        """
+        passwords = []
+        
+        # SQLite limits count of parameters
+        for i in range(0, len(p_ids), 500):
+            params = dict(("id_%d" % j, p_id) for j, p_id in enumerate(p_ids[i:i + 500]))
+            
+            passwords += self.selectHydrated("WHERE Passwords.id IN (" + ", ".join(":" + key for key in sorted(params)) + ")", 
+                                             params, columns)
+        return passwords
+    
+    def selectVersions(self, u_id):
+        """
+            Select versions of user passwords, to detect changed passwords without decryption.
+            Record is encrypted by new nonce or IV on every password update, so its length and last block, 
+            authentication tag or last CBC block, change. Older rows use encrypted modification date.
+            Whole records are not kept in memory.
+            
+            @param u_id: user ID
+            @return: dictionary password ID: version string
+        """
+        try:
+            self._cursor.execute("""SELECT id, COALESCE(length(record) || ':' || hex(substr(record, -16)), hex(m_date)) AS version 
+                FROM Passwords WHERE user_id = :id;""", {"id" : u_id})
+            
+            return dict((row["id"], str(row["version"])) for row in self._cursor.fetchall())
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+    
     def deletePassword(self, p_id):
         """
-            Delete password with ID.
+            Delete password with ID, with its attachment and search index tokens, in one transaction.
             @param p_id: password ID
         """
         try:
-            self._cursor.execute("DELETE FROM Passwords WHERE id = :id", {"id" : p_id})
-            self._connection.commit()
-            
-            count = self._cursor.rowcount
+            with self._db_ctrl.transaction():
+                # foreign key cascade deletes them too, but it can be disabled
+                AttachmentController(self._db_ctrl, self._master).deleteAttachment(p_id)
+                self._search_ctrl.deletePasswords([p_id])
+                
+                self._cursor.execute("DELETE FROM Passwords WHERE id = :id", {"id" : p_id})
+                count = self._cursor.rowcount
+                
+                self._db_ctrl.recordChange("Passwords", ChangeEvent.DELETED, [p_id])
             
             if (count > 0):
                 logging.info("%d password with id: %d deleted", count, p_id)
@@ -300,15 +1185,15 @@ class PasswdController:
         except sqlite3.Error as e:
             logging.exception(e)
             
-            self._connection.rollback()
             raise e
             
-    def encryptAndPrepRow(self, title, username, passwd, url, comment, c_date, e_date, grp_id, user_id, attachment, att_name, salt, iv, expire):
+    def encryptAndPrepRow(self, title, username, passwd, url, comment, c_date, e_date, grp_id, user_id, attachment, att_name, salt, iv, expire,
+                          m_date = None):
         """
             Encrypts password in table Passwords. Encrypts inserted data. Only grp_id, user_id salt and iv are not encrypted.
+            Encrypted columns are packed to one record and encrypted at once, separate columns are empty.
             Also change m_date column, modification date, to current timestamp. Encrypted data are inserted as BLOB type.
             
-            And prepares them for sqlite binary data.
             @param title: password title
             @param username: account username
             @param passwd: account password
@@ -318,57 +1203,37 @@ class PasswdController:
             @param e_date: date of expiration
             @param grp_id: password group ID, from Groups table
             @param user_id: user ID, from Users table
-            @param attachment: attachment of password
+            @param attachment: attachment of password, None if attachment is stored in Attachments table
             @param att_name: attachment name
             @param salt: secret key salt
-            @param iv: cipher input vector
+            @param iv: cipher input vector, of attachment
             @param expire: if password expires, should be set to 'true' string
+            @param m_date: date of modification, None current timestamp, i.e. kept when record is repacked
             
             @return: encrypted dictionary data
         """
-        secret_key = CryptoBasics.genCipherKey(self._master, salt)
+        secret_key = self.cipherKey(salt)
         
-        # pack time (float) to bytes, need to encrypt it, add padding
-        m_date = time.time()
+        if (m_date is None):
+            m_date = time.time()
         logging.debug("modification timestamp: %f", m_date)
         
-        # use little endian and float type to convert timestamp
-        c_date = struct.pack(self._TIME_PRECISION, c_date)
-        e_date = struct.pack(self._TIME_PRECISION, e_date)
-        m_date = struct.pack(self._TIME_PRECISION, m_date)
-
-        # encrypt data
-        title = CryptoBasics.encryptDataAutoPad(title, secret_key, iv)
-        username = CryptoBasics.encryptDataAutoPad(username, secret_key, iv)
-        passwd = CryptoBasics.encryptDataAutoPad(passwd, secret_key, iv)
-        url = CryptoBasics.encryptDataAutoPad(url, secret_key, iv)
-        comment = CryptoBasics.encryptDataAutoPad(comment, secret_key, iv)
-        c_date = CryptoBasics.encryptDataAutoPad(c_date, secret_key, iv)
-        m_date = CryptoBasics.encryptDataAutoPad(m_date, secret_key, iv)
-        e_date = CryptoBasics.encryptDataAutoPad(e_date, secret_key, iv)
-        attachment = CryptoBasics.encryptDataAutoPad(attachment, secret_key, iv)
-        att_name = CryptoBasics.encryptDataAutoPad(att_name, secret_key, iv)
-        expire = CryptoBasics.encryptDataAutoPad(expire, secret_key, iv)
+        # encrypt data at once
+        record = self.encryptRecord({"title" : title, "username" : username, "passwd" : passwd, "url" : url, 
+                                     "comment" : comment, "c_date" : c_date, "m_date" : m_date, "e_date" : e_date, 
+                                     "att_name" : att_name, "expire" : expire}, secret_key, salt)
+        
+        if (attachment is not None):
+            attachment = sqlite3.Binary(CryptoBasics.encryptDataAutoPad(attachment, secret_key, iv))
         
         # prepare binary data
-        title = sqlite3.Binary(title)
-        username = sqlite3.Binary(username)
-        passwd = sqlite3.Binary(passwd)
-        url = sqlite3.Binary(url)
-        comment = sqlite3.Binary(comment)
-        c_date = sqlite3.Binary(c_date)
-        m_date = sqlite3.Binary(m_date)
-        e_date = sqlite3.Binary(e_date)
-#         grp_id = sqlite3.Binary(grp_id)
-#         user_id = sqlite3.Binary(user_id)
-        attachment = sqlite3.Binary(attachment)
-        att_name = sqlite3.Binary(att_name)
+        record = sqlite3.Binary(record)
         iv = sqlite3.Binary(iv)
-        expire = sqlite3.Binary(expire)
         
-        return {'title' : title, 'username' : username, 'passwd' : passwd, 'url' : url, 'comment' : comment, 
-            'c_date' : c_date, 'm_date' : m_date, 'e_date' : e_date, 'grp_id' : grp_id, 'user_id' : user_id,
-            'attachment' : attachment, 'att_name' : att_name, 'salt' : salt, 'iv' : iv, 'expire' : expire}
+        return {'title' : None, 'username' : None, 'passwd' : None, 'url' : None, 'comment' : None, 
+            'c_date' : None, 'm_date' : None, 'e_date' : None, 'grp_id' : grp_id, 'user_id' : user_id,
+            'attachment' : attachment, 'att_name' : None, 'salt' : salt, 'iv' : iv, 'expire' : None,
+            'format' : self._FORMAT_CURRENT, 'record' : record}
     
     def decryptRow(self, p_id, title, username, passwd, url, comment, c_date, m_date, e_date, grp_id, user_id, attachment, att_name, salt, iv, expire):
         """
@@ -393,27 +1258,20 @@ class PasswdController:
             
             @return: enrypted dictionary data
         """
-        secret_key = CryptoBasics.genCipherKey(self._master, salt)
-        
-        # decrypt data
-        title = CryptoBasics.decryptDataAutoPad(title, secret_key, iv)
-        username = CryptoBasics.decryptDataAutoPad(username, secret_key, iv)
-        passwd = CryptoBasics.decryptDataAutoPad(passwd, secret_key, iv)
-        url = CryptoBasics.decryptDataAutoPad(url, secret_key, iv)
-        comment = CryptoBasics.decryptDataAutoPad(comment, secret_key, iv)
-        c_date = CryptoBasics.decryptDataAutoPad(c_date, secret_key, iv)
-        e_date = CryptoBasics.decryptDataAutoPad(e_date, secret_key, iv)
-        m_date = CryptoBasics.decryptDataAutoPad(m_date, secret_key, iv)
+        secret_key = self.cipherKey(salt, self._FORMAT_COLUMNS)
         
+        # decrypt data at once, columns have same key
+        (title, username, passwd, url, comment, c_date, e_date, m_date, att_name, 
+         expire) = CryptoBasics.decryptMany([(iv, title), (iv, username), (iv, passwd), (iv, url), (iv, comment), (iv, c_date), 
+                                             (iv, e_date), (iv, m_date), (iv, att_name), (iv, expire)], secret_key)
         
         # unpack returns a touple, but I need just one value
         m_date = struct.unpack(self._TIME_PRECISION, m_date)[0]
         c_date = struct.unpack(self._TIME_PRECISION, c_date)[0]
         e_date = struct.unpack(self._TIME_PRECISION, e_date)[0]
       
-        attachment = CryptoBasics.decryptDataAutoPad(attachment, secret_key, iv)
-        att_name = CryptoBasics.decryptDataAutoPad(att_name, secret_key, iv)
-        expire = CryptoBasics.decryptDataAutoPad(expire, secret_key, iv)
+        if (attachment is not None):
+            attachment = CryptoBasics.decryptDataAutoPad(attachment, secret_key, iv)
         
         return {"id" :p_id, "title" : title, "username" : username, "passwd" : passwd, "url" : url, "comment" : comment, 
             "c_date" : c_date, "m_date" : m_date, "e_date" : e_date, "grp_id" : grp_id, "user_id" : user_id,
@@ -429,7 +1287,7 @@ class PasswdController:
         """
         return self.decryptRow(row["id"], row["title"], row["username"], row["passwd"], row["url"], row["comment"],
                             row["c_date"], row["m_date"], row["e_date"], row["grp_id"], row["user_id"], 
-                            row["attachment"], row["att_name"], row["salt"], row["iv"], row["expire"])
+                            None if row["attachment"] is None else str(row["attachment"]), row["att_name"], row["salt"], str(row["iv"]), row["expire"])
     
     def createPasswdObj(self, dic):
         """
@@ -462,4 +1320,35 @@ class PasswdController:
             
             @return: list of column names
         """
-        return [tr("Title"), tr("Username"), tr("Password"), tr("Url")]
\ No newline at end of file
+        return [tr("Title"), tr("Username"), tr("Password"), tr("Url")]
+
+# controller of worker process, just decrypts
+_task_ctrl = None
+
+def decryptTask(task):
+    """
+        Decrypt columns of one password in worker process, see PasswdController.decryptParallel().
+        
+        @param task: touple (encrypted data dictionary, secret key, iv, salt, columns)
+        @return: dictionary of decrypted columns
+    """
+    global _task_ctrl
+    
+    if (_task_ctrl is None):
+        _task_ctrl = PasswdController(None, None)
+    
+    return _task_ctrl.decryptColumns(*task)
+
+def rekeyTask(task):
+    """
+        Re-encrypt record of one password in worker process, see PasswdController.rekeyPasswords().
+        
+        @param task: touple (encrypted data dictionary, secret key, iv, salt, new secret key)
+        @return: touple (encrypted record, dictionary of decrypted columns)
+    """
+    global _task_ctrl
+    
+    if (_task_ctrl is None):
+        _task_ctrl = PasswdController(None, None)
+    
+    return _task_ctrl.rekeyRecord(*task)
\ No newline at end of file
@@ -28,6 +28,7 @@ from PyQt4 import QtGui, QtCore
 from TransController import tr
 from GroupController import GroupController
 import os
+import shutil
 import AppSettings
 from SaveDialog import SaveDialog
 import InfoMsgBoxes
@@ -112,8 +113,13 @@ class PasswdDialog(SaveDialog):
         # dafult never expire password
         self._e_date_never.setChecked(True)
         
-        # intialize variables
-        self._attachment_data = ""
+        # intialize variables, attachment is not loaded to memory
+        # path to new loaded attachment file
+        self._attachment_path = None
+        # function(file), writes stored attachment to file, set by edit dialog
+        self._attachment_writer = None
+        # attachment was loaded or deleted
+        self._attachment_changed = False
         
     def initUi(self):
         """
@@ -322,8 +328,10 @@ class PasswdDialog(SaveDialog):
         self._att_name.clear()
         self._att_name.setDisabled(True)
         
-        # empty binary data
-        self._attachment_data = ""
+        # forget attachment
+        self._attachment_path = None
+        self._attachment_writer = None
+        self._attachment_changed = True
         
         # diable del button
         self._att_del_button.setDisabled(True)
@@ -436,12 +444,13 @@ class PasswdDialog(SaveDialog):
                 # set attachment name
                 self._att_name.setText(QtCore.QString.fromUtf8(file_name))
                 
-                # read binary data
-                data = self.readFile(file_path)
+                # file is read when saving
+                logging.info("file size: %i", os.path.getsize(AppSettings.decodePath(file_path)))
                 
-                if (data):
-                    self._attachment_data = data
-                    self.enableSaveButton()
+                self._attachment_path = file_path
+                self._attachment_writer = None
+                self._attachment_changed = True
+                self.enableSaveButton()
             else:
                 logging.debug("file not selected")
         except Exception as e:
@@ -495,57 +504,50 @@ class PasswdDialog(SaveDialog):
             
     def writeFile(self, file_path):
         """
-            Write file to disk.
+            Write attachment to disk, copy new loaded file or decrypt stored attachment chunk by chunk.
             
             @param file_path: file to write
         """
         f = None
+        src = None
         try:
             f = open(AppSettings.decodePath(file_path), "wb")
             
-            f.write(self._attachment_data)
+            if (self._attachment_path):
+                src = open(AppSettings.decodePath(self._attachment_path), "rb")
+                
+                shutil.copyfileobj(src, f)
+            elif (self._attachment_writer):
+                self._attachment_writer(f)
         except IOError as e:
             logging.exception(e)
             
             raise e
-        except:
+        except Exception as e:
             logging.exception("exception writting file: %s", file_path)
             
             raise e
         finally:
+            if (src):
+                src.close()
             if (f):
                 f.close()
             
-    def readFile(self, file_path):
+    def openAttachmentSrc(self):
         """
-            Read file binary. Return read data.
+            Open attachment source for saving to DB.
             
-            @param file_path: path to file
-            @return: on succes binary data, else None
+            @return: opened binary file with new attachment, empty string if attachment was deleted, 
+                None if not changed, opened file have to be closed
         """
-        data = None
-        f = None
+        if (not self._attachment_changed):
+            return None
         
-        try:
-            logging.info("reading file: %s", file_path)
-            f = open(AppSettings.decodePath(file_path), "rb")
+        if (self._attachment_path):
+            logging.info("reading file: %s", self._attachment_path)
             
-            data = f.read()
-            
-            logging.info("file size: %i", len(data))
-        except IOError as e:
-            logging.exception(e)
-            
-            raise e
-        except:
-            # all other exceptions
-            logging.exception("exception, file: %s", file_path)
-            
-            raise "exception, file: " + file_path
-        finally:
-            if (f):
-                f.close()
-            return data
+            return open(AppSettings.decodePath(self._attachment_path), "rb")
+        return ""
         
     def saveChanges(self):
         """
@@ -36,7 +36,8 @@ class PasswdModel:
 
     def __init__(self, p_id=None, title=None, username=None, passwd=None,
                  url=None, comment=None, c_date=None, m_date=None, e_date=None, grp_id=None,
-                 user_id=None, attachment=None, att_name=None, salt=None, iv=None, expire=None, db_ctrl=None):
+                 user_id=None, attachment=None, att_name=None, salt=None, iv=None, expire=None, db_ctrl=None,
+                 grp=None, user=None):
         """
             Initialize PasswdModel.
             
@@ -56,6 +57,8 @@ class PasswdModel:
             @param iv: input vector for cipher
             @param expire: if password expires, should be set to 'true' string
             @param db_ctrl: DB controller
+            @param grp: already loaded GroupModel, if set group is not selected from DB
+            @param user: already loaded UserModel, if set user is not selected from DB
         """
         self._id = p_id
         self._title = title
@@ -66,16 +69,67 @@ class PasswdModel:
         self._c_date = c_date
         self._m_date = m_date
         self._e_date = e_date
-        self._grp = None
-        self._user = None
+        self._grp = grp
+        self._user = user
         self._attachment = attachment
         self._att_name = att_name
         self._salt = salt
         self._iv = iv
         self._expire = expire
 
-        self.selectGroup(grp_id, db_ctrl)
-        self.selectUser(user_id, db_ctrl)
+        # loader of not decrypted columns and their ciphertext, see setLoader()
+        self._loader = None
+        self._lazy = []
+        self._encrypted = {}
+
+        if (not grp):
+            self.selectGroup(grp_id, db_ctrl)
+        if (not user):
+            self.selectUser(user_id, db_ctrl)
+
+    def setLoader(self, loader, columns, encrypted = None):
+        """
+            Set loader for columns, which were not decrypted. Every column is decrypted on first access,
+            from kept ciphertext, or loaded from DB, if was not selected.
+
+            @param loader: function(passwd, column), returns dictionary of decrypted columns, at least column
+            @param columns: not decrypted column names, i.e. attachment
+            @param encrypted: selected ciphertext, dictionary column: encrypted data
+        """
+        self._loader = loader
+        self._lazy = list(columns)
+        self._encrypted = encrypted or {}
+
+        # remove attributes, so __getattr__ is called on access
+        for col in self._lazy:
+            self.__dict__.pop("_" + col, None)
+
+    def __getattr__(self, name):
+        """
+            Load not selected column on first access.
+        """
+        col = name[1:]
+
+        if (col not in self.__dict__.get("_lazy", [])):
+            raise AttributeError(name)
+
+        logging.debug("loading column: %s, password ID: %s", col, self._id)
+
+        # loader can decrypt more columns at once
+        self.setDecrypted(self._loader(self, col))
+
+        return self.__dict__[name]
+
+    def setDecrypted(self, columns):
+        """
+            Set decrypted columns, they are not loaded on access anymore.
+            
+            @param columns: dictionary of decrypted columns
+        """
+        for key, value in columns.items():
+            if (key in self._lazy):
+                self._lazy.remove(key)
+                setattr(self, "_" + key, value)
 
     def selectGroup(self, g_id, db_ctrl):
         """
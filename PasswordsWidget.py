@@ -28,6 +28,8 @@ from PyQt4 import QtGui, QtCore
 from PyQt4.Qt import Qt
 from PasswdController import PasswdController
 from GroupsWidget import GroupsWidget
+from GroupController import GroupController
+from ChangeEvent import ChangeEvent
 import AppSettings
 
 class PasswordsWidget(QtGui.QTableWidget):
@@ -48,6 +50,13 @@ class PasswordsWidget(QtGui.QTableWidget):
         
         # how password and username in visible form
         self._show_pass = False
+        
+        # displayed item type and ID, see showPasswords()
+        self._shown = (GroupsWidget._TYPE_ALL, -1)
+        
+        # password ID: item in ID column, to find row of changed password
+        self._id_items = {}
+        
         self._del_clipboard = None
         
         super(PasswordsWidget, self).__init__()
@@ -171,7 +180,7 @@ class PasswordsWidget(QtGui.QTableWidget):
                 pass_ctrl = PasswdController(self.__parent._db_ctrl, self.__parent._user._master)
                 p_id = self.currentItemID()
                 
-                passwd = pass_ctrl.selectById(p_id)[0]
+                passwd = pass_ctrl.selectById(p_id, ["username"])[0]
                 
                 data = passwd._username
             elif (col == self.__COL_PASSWORD and not self._show_pass):
@@ -179,7 +188,7 @@ class PasswordsWidget(QtGui.QTableWidget):
                 pass_ctrl = PasswdController(self.__parent._db_ctrl, self.__parent._user._master)
                 p_id = self.currentItemID()
                 
-                passwd = pass_ctrl.selectById(p_id)[0]
+                passwd = pass_ctrl.selectById(p_id, ["passwd"])[0]
                 
                 data = passwd._passwd
             else:
@@ -206,10 +215,21 @@ class PasswordsWidget(QtGui.QTableWidget):
             Show all passwords.
         """        
         passwd_ctrl = PasswdController(self.__parent._db_ctrl, self.__parent._user._master)
-        passwords = passwd_ctrl.selectByUserId(self.__parent._user._id)
+        passwords = passwd_ctrl.selectByUserId(self.__parent._user._id, self.tableColumns())
+        self._shown = (GroupsWidget._TYPE_ALL, -1)
         
         self.fillTable(passwords)
         
+    def tableColumns(self):
+        """
+            Return password columns displayed in table. Username and password only if are visible.
+            
+            @return: list of column names
+        """
+        if (self._show_pass):
+            return ["title", "username", "passwd", "url"]
+        return ["title", "url"]
+        
     def reloadItems(self):
         """
             Reload items from DB.
@@ -234,27 +254,47 @@ class PasswordsWidget(QtGui.QTableWidget):
             row = self.rowCount()
             logging.debug("adding password: %s , at row: %i", passwd, row)
             self.insertRow(row)
-       
-            pix = QtGui.QPixmap()
-            pix.loadFromData(passwd._grp._icon._icon)
-       
-            # set data
-            self.setItem(row, self.__COL_TITLE, QtGui.QTableWidgetItem((QtGui.QIcon(pix)), QtCore.QString.fromUtf8(passwd._title)))
-            
-            if (self._show_pass):
-                # have to show pass username in visible form
-                self.setItem(row, self.__COL_USERNAME, QtGui.QTableWidgetItem(QtCore.QString.fromUtf8(passwd._username)))
-                self.setItem(row, self.__COL_PASSWORD, QtGui.QTableWidgetItem(QtCore.QString.fromUtf8(passwd._passwd)))
-            else:
-                # show as stars
-                self.setItem(row, self.__COL_USERNAME, QtGui.QTableWidgetItem("******"))
-                self.setItem(row, self.__COL_PASSWORD, QtGui.QTableWidgetItem("******"))
-            self.setItem(row, self.__COL_URL, QtGui.QTableWidgetItem(QtCore.QString.fromUtf8(passwd._url)))
-            self.setItem(row, self.__COL_ID, QtGui.QTableWidgetItem(str(passwd._id)))
+            
+            self.setRowItems(row, passwd)
         # enable sorting
         self.setSortingEnabled(True)
         self.sortByColumn(self.__COL_TITLE, Qt.AscendingOrder)
         
+    def setRowItems(self, row, passwd):
+        """
+            Set password data to table row. When sorting is enabled, row is moved after sorted column is set,
+            so sorted column is set last.
+            
+            @param row: row index in table
+            @param passwd: password, PasswdModel
+        """
+        pix = QtGui.QPixmap()
+        pix.loadFromData(passwd._grp._icon._icon)
+        
+        items = {}
+        items[self.__COL_TITLE] = QtGui.QTableWidgetItem((QtGui.QIcon(pix)), QtCore.QString.fromUtf8(passwd._title))
+        
+        if (self._show_pass):
+            # have to show pass username in visible form
+            items[self.__COL_USERNAME] = QtGui.QTableWidgetItem(QtCore.QString.fromUtf8(passwd._username))
+            items[self.__COL_PASSWORD] = QtGui.QTableWidgetItem(QtCore.QString.fromUtf8(passwd._passwd))
+        else:
+            # show as stars
+            items[self.__COL_USERNAME] = QtGui.QTableWidgetItem("******")
+            items[self.__COL_PASSWORD] = QtGui.QTableWidgetItem("******")
+        items[self.__COL_URL] = QtGui.QTableWidgetItem(QtCore.QString.fromUtf8(passwd._url))
+        items[self.__COL_ID] = QtGui.QTableWidgetItem(str(passwd._id))
+        
+        # group ID, to change icon when group is changed
+        items[self.__COL_ID].setData(Qt.UserRole, passwd._grp._id)
+        
+        sort_col = self.horizontalHeader().sortIndicatorSection()
+        
+        for col in sorted(items, key = lambda col: col == sort_col):
+            self.setItem(row, col, items[col])
+        
+        self._id_items[passwd._id] = items[self.__COL_ID]
+        
     def showPasswords(self, item_type, item_id):
         """
             Public slot to show passwords in table, whe signal emitPasswords(int, int)
@@ -267,20 +307,116 @@ class PasswordsWidget(QtGui.QTableWidget):
         self.removeAllRows()
 
         logging.info("signal: type: %i, ID: %i", item_type, item_id)
+        self._shown = (item_type, item_id)
         passwd_ctrl = PasswdController(self.__parent._db_ctrl, self.__parent._user._master)
         
         # detect type
         if (item_type == GroupsWidget._TYPE_ALL):
             # select all
-            passwords = passwd_ctrl.selectByUserId(self.__parent._user._id)
+            passwords = passwd_ctrl.selectByUserId(self.__parent._user._id, self.tableColumns())
         elif (item_type == GroupsWidget._TYPE_GROUP):
             #select by group
-            passwords = passwd_ctrl.selectByUserGrpId(self.__parent._user._id, item_id)
+            passwords = passwd_ctrl.selectByUserGrpId(self.__parent._user._id, item_id, self.tableColumns())
         elif (item_type == GroupsWidget._TYPE_PASS):
             #select just one password
-            passwords = passwd_ctrl.selectById(item_id)
+            passwords = passwd_ctrl.selectById(item_id, self.tableColumns())
         self.fillTable(passwords)
     
+    def applyChanges(self, changes):
+        """
+            Apply commited changes to displayed rows, instead of reloading whole table. Only changed passwords are decrypted,
+            changed passwords which don't belong to displayed group anymore are removed. Selection and scroll position are kept.
+            
+            @param changes: list of ChangeEvent objects
+        """
+        changed = set()
+        deleted = set()
+        groups = set()
+        
+        for change in changes:
+            if (change._table == "Passwords"):
+                if (change._change == ChangeEvent.DELETED):
+                    deleted.update(change._ids)
+                    changed.difference_update(change._ids)
+                else:
+                    changed.update(change._ids)
+                    deleted.difference_update(change._ids)
+            elif (change._table == "Groups" and change._change == ChangeEvent.UPDATED):
+                groups.update(change._ids)
+        
+        item_type, item_id = self._shown
+        passwords = []
+        
+        if (changed):
+            passwd_ctrl = PasswdController(self.__parent._db_ctrl, self.__parent._user._master)
+            passwords = passwd_ctrl.selectByIds(sorted(changed), self.tableColumns())
+        
+        # keep just displayed passwords
+        if (item_type == GroupsWidget._TYPE_GROUP):
+            passwords = [passwd for passwd in passwords if passwd._grp._id == item_id]
+        elif (item_type == GroupsWidget._TYPE_PASS):
+            passwords = [passwd for passwd in passwords if passwd._id == item_id]
+        
+        removed = deleted | changed
+        removed.difference_update(passwd._id for passwd in passwords)
+        
+        logging.info("applying changes, updated rows: %d, removed rows: %d", len(passwords), len(removed))
+        
+        # top visible row, to keep scroll position
+        anchor = self.item(self.rowAt(0), self.__COL_ID)
+        
+        for p_id in removed:
+            item = self._id_items.pop(p_id, None)
+            
+            if (item):
+                self.removeRow(self.row(item))
+        
+        for passwd in passwords:
+            item = self._id_items.get(passwd._id)
+            
+            if (item):
+                self.setRowItems(self.row(item), passwd)
+            else:
+                self.insertRow(self.rowCount())
+                self.setRowItems(self.rowCount() - 1, passwd)
+        
+        if (groups):
+            self.applyGroupsIcon(groups)
+        
+        if (anchor):
+            anchor = self._id_items.get(anchor.text().toInt()[0])
+            
+            if (anchor):
+                self.scrollToItem(anchor, QtGui.QAbstractItemView.PositionAtTop)
+        
+    def applyGroupsIcon(self, groups):
+        """
+            Set changed group icon to rows of passwords in group.
+            
+            @param groups: changed group IDs
+        """
+        group_ctrl = GroupController(self.__parent._db_ctrl)
+        icons = {}
+        
+        # group can be deleted, before change is applied
+        existing = group_ctrl.selectVersions()
+        
+        for g_id in groups:
+            if (g_id not in existing):
+                continue
+            group = group_ctrl.selectById(g_id)
+            
+            pix = QtGui.QPixmap()
+            pix.loadFromData(group._icon._icon)
+            
+            icons[g_id] = QtGui.QIcon(pix)
+        
+        for item in self._id_items.values():
+            g_id = item.data(Qt.UserRole).toInt()[0]
+            
+            if (g_id in icons):
+                self.item(self.row(item), self.__COL_TITLE).setIcon(icons[g_id])
+        
     def removeAllRows(self):
         """
             Remove all items from table.
@@ -288,6 +424,8 @@ class PasswordsWidget(QtGui.QTableWidget):
         # disable sorting
         self.setSortingEnabled(False)
         
+        self._id_items = {}
+        
         for i in range(0, self.rowCount()):
             i
             self.removeRow(self.rowCount() - 1)
@@ -372,7 +510,7 @@ class PasswordsWidget(QtGui.QTableWidget):
     
     def deletePassword(self, p_id):
         """
-            Delete password from DB. And reloads items.
+            Delete password from DB. Row is removed, when change is applied.
             
             @param p_id: password ID
         """
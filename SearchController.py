@@ -0,0 +1,272 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    MIT License
+
+    Copyright (c) 2013-2016 Frantisek Uhrecky
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import re
+import sqlite3
+import logging
+import CryptoBasics
+
+class SearchController:
+    """
+        Provides blind search index of passwords in table SearchIndex. Words and trigrams of indexed values are stored 
+        as keyed HMAC tokens, key is derived from vault key of user, so index doesn't reveal values or master password.
+        Search resolves candidate password IDs by indexed lookup, so just candidates have to be decrypted.
+        Trigrams can match more passwords, candidates have to be checked after decryption, see matches().
+        Every indexed password has indexed marker token, so passwords without indexed words are not indexed again.
+    """
+    # words are split by non alphanumeric characters
+    __WORD_SPLIT = re.compile(r"\W+", re.UNICODE)
+    
+    # SQLite limits count of parameters
+    __MAX_TOKENS = 500
+    
+    # indexed marker, query tokens have other prefixes
+    __INDEXED = "i:"
+    
+    def __init__(self, db_controller, vault_key = None):
+        """
+            @param db_controller: DB controller
+            @param vault_key: vault key of indexed passwords, i.e. new one on its change, None takes it from session
+        """
+        self._db_ctrl = db_controller
+        self._vault_key = vault_key
+        
+        # search index HMACs, by user ID
+        self._keys = {}
+        
+        # generated tokens, by user ID and indexed word or trigram, vault repeats them
+        self._tokens = {}
+    
+    @property
+    def _connection(self):
+        """
+            Connection of current thread from DB controller pool.
+        """
+        return self._db_ctrl.connection()
+    
+    @property
+    def _cursor(self):
+        """
+            Cursor of current thread connection from DB controller pool.
+        """
+        return self._db_ctrl.cursor()
+    
+    def genToken(self, user_id, data):
+        """
+            Return search index token of data, key is derived from vault key, see CryptoBasics.genIndexKey().
+            
+            @param user_id: user ID
+            @param data: word or trigram with its prefix
+            @return: token
+        """
+        token = self._tokens.get((user_id, data))
+        
+        if (token is None):
+            if (user_id not in self._keys):
+                if (self._vault_key is None):
+                    key = CryptoBasics.getSessionIndexKey(user_id)
+                else:
+                    key = CryptoBasics.genIndexKey(CryptoBasics.genVaultHmac(self._vault_key))
+                
+                self._keys[user_id] = CryptoBasics.genIndexHmac(key)
+            token = CryptoBasics.genIndexToken(self._keys[user_id], data)
+            
+            self._tokens[(user_id, data)] = token
+        return token
+    
+    def splitWords(self, value):
+        """
+            Split value to lower case words.
+            
+            @param value: utf8 string
+            @return: list of unicode words
+        """
+        return [word for word in self.__WORD_SPLIT.split(value.decode("utf8").lower()) if word]
+    
+    def genTokens(self, user_id, values):
+        """
+            Generate index tokens of values, every word and its trigrams, and indexed marker.
+            
+            @param user_id: user ID
+            @param values: list of indexed utf8 strings
+            @return: set of tokens
+        """
+        tokens = set([self.genToken(user_id, self.__INDEXED)])
+        
+        for value in values:
+            for word in self.splitWords(value or ""):
+                tokens.add(self.genToken(user_id, "w:" + word.encode("utf8")))
+                
+                for i in range(len(word) - 2):
+                    tokens.add(self.genToken(user_id, "t:" + word[i:i + 3].encode("utf8")))
+        return tokens
+    
+    def genQueryTokens(self, user_id, query):
+        """
+            Generate tokens of search query. Words shorter than trigram have to match whole word,
+            others match by trigrams, as substring.
+            
+            @param user_id: user ID
+            @param query: utf8 string
+            @return: set of tokens
+        """
+        tokens = set()
+        
+        for word in self.splitWords(query):
+            if (len(word) < 3):
+                tokens.add(self.genToken(user_id, "w:" + word.encode("utf8")))
+            else:
+                for i in range(len(word) - 2):
+                    tokens.add(self.genToken(user_id, "t:" + word[i:i + 3].encode("utf8")))
+        return tokens
+    
+    def matches(self, query, values):
+        """
+            Check if values match search query, every query word have to be in some value.
+            
+            @param query: utf8 string
+            @param values: list of utf8 strings
+            @return: True if matches
+        """
+        values = [(value or "").decode("utf8").lower() for value in values]
+        
+        for word in self.splitWords(query):
+            if (not [value for value in values if word in value]):
+                return False
+        return True
+    
+    def indexPasswords(self, passwords):
+        """
+            Index passwords, replace their tokens. Have to be called in transaction with passwords change.
+            
+            @param passwords: iterable of touples (password ID, user ID, list of indexed values)
+        """
+        passwords = list(passwords)
+        
+        # tokens generated before insert, generator is not consumed during executemany
+        rows = [{"token" : sqlite3.Binary(token), "id" : p_id} for p_id, user_id, values in passwords 
+                for token in self.genTokens(user_id, values)]
+        
+        try:
+            self.deletePasswords([p_id for p_id, user_id, values in passwords])
+            self._cursor.executemany("INSERT INTO SearchIndex(token, passwd_id) VALUES(:token, :id);", rows)
+            
+            logging.debug("passwords indexed: %d, tokens: %d", len(passwords), self._cursor.rowcount)
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+    
+    def deletePasswords(self, p_ids):
+        """
+            Delete tokens of passwords. Have to be called in transaction with passwords delete.
+            
+            @param p_ids: list of password IDs
+        """
+        try:
+            self._cursor.executemany("DELETE FROM SearchIndex WHERE passwd_id = :id;", [{"id" : p_id} for p_id in p_ids])
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+    
+    def selectCandidates(self, user_id, query):
+        """
+            Select IDs of user passwords, which contain all query tokens.
+            
+            @param user_id: user ID
+            @param query: utf8 search string
+            @return: list of password IDs
+        """
+        tokens = list(self.genQueryTokens(user_id, query))
+        
+        if (not tokens or len(tokens) > self.__MAX_TOKENS):
+            # nothing to search, or too long query, all passwords are candidates
+            logging.info("query tokens: %d, all passwords are candidates", len(tokens))
+            
+            self._cursor.execute("SELECT id FROM Passwords WHERE user_id = :user_id;", {"user_id" : user_id})
+            
+            return [row["id"] for row in self._cursor.fetchall()]
+        
+        params = dict(("t_%d" % i, sqlite3.Binary(token)) for i, token in enumerate(tokens))
+        params["user_id"] = user_id
+        params["count"] = len(tokens)
+        
+        try:
+            # tokens are searched first
+            self._cursor.execute("""SELECT SearchIndex.passwd_id FROM SearchIndex 
+                CROSS JOIN Passwords ON Passwords.id = SearchIndex.passwd_id 
+                WHERE SearchIndex.token IN (""" + ", ".join(":t_%d" % i for i in range(len(tokens))) + """) 
+                AND Passwords.user_id = :user_id 
+                GROUP BY SearchIndex.passwd_id HAVING COUNT(*) = :count;""", params)
+            
+            ids = [row["passwd_id"] for row in self._cursor.fetchall()]
+            
+            logging.info("query tokens: %d, candidates: %d", len(tokens), len(ids))
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+        return ids
+    
+    def selectTokens(self, user_id):
+        """
+            Select stored tokens of user passwords.
+            
+            @param user_id: user ID
+            @return: dictionary, password ID: set of tokens
+        """
+        tokens = {}
+        
+        try:
+            self._cursor.execute("""SELECT SearchIndex.passwd_id, SearchIndex.token FROM SearchIndex 
+                JOIN Passwords ON Passwords.id = SearchIndex.passwd_id WHERE Passwords.user_id = :user_id;""", {"user_id" : user_id})
+            
+            for row in self._cursor:
+                tokens.setdefault(row["passwd_id"], set()).add(str(row["token"]))
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
+        return tokens
+    
+    def selectUnindexed(self, user_id):
+        """
+            Select IDs of user passwords without indexed marker token, i.e. after database conversion.
+            Passwords indexed by other key have other marker, they are not indexed too.
+            
+            @param user_id: user ID
+            @return: list of password IDs
+        """
+        try:
+            self._cursor.execute("""SELECT id FROM Passwords WHERE user_id = :user_id 
+                AND id NOT IN (SELECT passwd_id FROM SearchIndex WHERE token = :token);""", 
+                {"user_id" : user_id, "token" : sqlite3.Binary(self.genToken(user_id, self.__INDEXED))})
+            
+            return [row["id"] for row in self._cursor.fetchall()]
+        except sqlite3.Error as e:
+            logging.exception(e)
+            
+            raise e
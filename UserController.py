@@ -34,8 +34,20 @@ class UserController:
     """
     def __init__(self, db_controller):
         self._db_ctrl = db_controller
-        self._connection = db_controller._connection
-        self._cursor = db_controller._cursor
+    
+    @property
+    def _connection(self):
+        """
+            Connection of current thread from DB controller pool.
+        """
+        return self._db_ctrl.connection()
+    
+    @property
+    def _cursor(self):
+        """
+            Cursor of current thread connection from DB controller pool.
+        """
+        return self._db_ctrl.cursor()
     
     def selectAll(self):
         """
@@ -64,6 +76,11 @@ class UserController:
             @param id: user id
             @return: UserModel object
         """
+        # already loaded user
+        user = self._db_ctrl.selectModel("Users", u_id)
+        
+        if (user):
+            return user
         try:
             self._cursor.execute("SELECT * FROM Users WHERE id = :id;", {"id" : u_id})
             row = self._cursor.fetchone()
@@ -106,7 +123,9 @@ class UserController:
 
     def selectByNameMaster(self, name, master):
         """
-            Select user from database by username and password.
+            Select user from database by username and password. Password is verified by unwrapping user vault key,
+            vault key is kept by session, see CryptoBasics.openSession(). User without vault key is verified 
+            by password hash and gets vault key.
             
             @param name: username
             @param master: plain text password
@@ -115,36 +134,112 @@ class UserController:
         """
         name = name.decode('utf-8')
         master = master.decode('utf-8')
-        user = None
-        try:
-            user = self.selectByName(name)
+        
+        user = self.selectByName(name)
+        
+        if (not user):
+            logging.info("username doesn't exist, %s", name)
             
-            if (not user):
-                logging.info("username doesn't exist, %s", name)
-                
-                return None
+            return None
+        
+        if (user._vault_key is not None):
+            # already unwrapped in this session, master key derivation is slow
+            vault_key = CryptoBasics.getSessionVaultKey(user._id, master)
+            
+            if (vault_key is None):
+                try:
+                    master_key = CryptoBasics.genMasterKey(master, user._kdf_salt, user._kdf_iter)
+                    vault_key = CryptoBasics.unwrapVaultKey(user._vault_key, master_key, user._kdf_salt)
+                except ValueError:
+                    logging.info("user password not correct")
+                    
+                    return None
+        elif (user._passwd == CryptoBasics.getUserPassHash(user._salt, master)):
+            vault_key = self.upgradeUser(user, master)
             
-            # prepare hash
-            passwd = CryptoBasics.getUserPassHash(user._salt, master)
+            user = self.selectById(user._id)
+        else:
+            logging.info("user password not correct")
+            
+            return None
+        
+        CryptoBasics.openSession(user._id, master, vault_key)
+        
+        logging.debug("user with username '%s' selected", name)
+        
+        # do not store master password to shared user object
+        return UserModel(user._id, user._name, user._passwd, user._salt, master, user._kdf_salt, user._kdf_iter, user._vault_key)
+    
+    def prepVaultKey(self, master, vault_key = None):
+        """
+            Prepare user columns with vault key wrapped by master key. Master key derivation is calibrated
+            to CryptoBasics.KDF_TARGET_MSEC on this machine. Password hash is not stored, it is faster to verify.
+            
+            @param master: plain text password
+            @param vault_key: vault key, None generates new one
+            
+            @return: tuple (dictionary of Users columns, vault key)
+        """
+        if (vault_key is None):
+            vault_key = CryptoBasics.genVaultKey()
+        
+        kdf_salt = CryptoBasics.genKeySalt()
+        kdf_iter = CryptoBasics.calibrateKdf()
+        
+        master_key = CryptoBasics.genMasterKey(master, kdf_salt, kdf_iter)
+        wrapped = CryptoBasics.wrapVaultKey(vault_key, master_key, kdf_salt)
+        
+        return ({"passwd" : "", "kdf_salt" : kdf_salt, "kdf_iter" : kdf_iter, "vault_key" : sqlite3.Binary(wrapped)}, vault_key)
+    
+    def upgradeUser(self, user, master):
+        """
+            Give vault key to user verified by password hash, older database version. Password hash is removed.
+            
+            @param user: UserModel object
+            @param master: plain text password, already verified
+            
+            @return: vault key
+        """
+        vault_key = self.updateVaultKey(user._id, master)
+        
+        logging.info("user with ID: %d upgraded to vault key", user._id)
+        
+        return vault_key
+    
+    def updateVaultKey(self, u_id, master, vault_key = None):
+        """
+            Wrap vault key by key derived from master password and store it to user, i.e. when master password is changed.
+            Commit is postponed, when called in transaction, see DbController.transaction().
+            
+            @param u_id: user ID
+            @param master: plain text password
+            @param vault_key: vault key, None generates new one
+            
+            @return: vault key
+        """
+        row, vault_key = self.prepVaultKey(master, vault_key)
+        row["id"] = u_id
+        
+        try:
+            self._cursor.execute("""UPDATE Users SET passwd = :passwd, kdf_salt = :kdf_salt, kdf_iter = :kdf_iter, 
+                                  vault_key = :vault_key WHERE id = :id;""", row)
+            self._db_ctrl.commit()
+            
+            logging.info("vault key of user with ID: %d stored, KDF iterations: %d", u_id, row["kdf_iter"])
         except sqlite3.Error as e:
             logging.exception(e)
             
+            self._db_ctrl.rollback()
             raise e
-        finally:
-            if (user and user._passwd == passwd):
-                logging.debug("user with username '%s' selected", name)
-                
-                user._master = master
-                
-                return user
-            else:
-                logging.info("user password not correct")
-
-                return None
+        
+        # shared user object is old
+        self._db_ctrl.invalidateModel("Users", u_id)
+        
+        return vault_key
 
     def insertUser(self, name, passwd):
         """
-            Insert user in talbe Users. User password is hashed with salt_p.
+            Insert user in talbe Users. User gets random vault key wrapped by key derived from password.
             @param name: user name
             @param passwd: user password
         """
@@ -153,20 +248,20 @@ class UserController:
         # generate salt using cryptographic safe pseudo-random generator
         salt_p = CryptoBasics.genUserPassSalt()
         
-        # prepends salts and create hash
-        passwd = CryptoBasics.getUserPassHash(salt_p, passwd)
+        row = self.prepVaultKey(passwd)[0]
+        row.update({"name" : name, "salt_p" : salt_p})
         
         try:
-            self._cursor.execute("INSERT INTO Users(name, passwd, salt_p) VALUES(:name, :passwd, :salt_p)",
-                                  {"name" : name, "passwd" : passwd, "salt_p" : salt_p})
-            self._connection.commit()
+            self._cursor.execute("""INSERT INTO Users(name, passwd, salt_p, kdf_salt, kdf_iter, vault_key) 
+                                  VALUES(:name, :passwd, :salt_p, :kdf_salt, :kdf_iter, :vault_key)""", row)
+            self._db_ctrl.commit()
             logging.info("users with ID: %i, inserted: %s", self._cursor.lastrowid, self._cursor.rowcount)
         except sqlite3.IntegrityError as e:
             logging.warning(e)
         except sqlite3.Error as e:
             logging.exception(e)
             
-            self._connection.rollback()
+            self._db_ctrl.rollback()
             raise e
             
     def deleteUser(self, u_id):
@@ -174,9 +269,11 @@ class UserController:
             Delete user with ID.
             @param u_id: user ID
         """
+        self._db_ctrl.invalidateModel("Users", u_id)
+        
         try:
             self._cursor.execute("DELETE FROM Users WHERE id = :u_id", {"u_id" : u_id})
-            self._connection.commit()
+            self._db_ctrl.commit()
             
             count = self._cursor.rowcount
             
@@ -187,7 +284,7 @@ class UserController:
         except sqlite3.Error as e:
             logging.exception(e)
             
-            self._connection.rollback()
+            self._db_ctrl.rollback()
             raise e
         
     def createUserObj(self, dic):
@@ -196,11 +293,17 @@ class UserController:
             
             @param dic: user returned from db
             
-            @return: UserModel object, or None
+            @return: UserModel object shared by identity map, or None
         """
         user = None
         try:
-            user = UserModel(dic["id"], dic["name"], dic["passwd"], dic["salt_p"])
+            user = self._db_ctrl.selectModel("Users", dic["id"])
+            
+            if (not user):
+                user = UserModel(dic["id"], dic["name"], dic["passwd"], dic["salt_p"], None, dic["kdf_salt"], 
+                                 dic["kdf_iter"], dic["vault_key"])
+                
+                self._db_ctrl.storeModel("Users", dic["id"], user)
         except Exception as e:
             logging.exception(e)
         finally:
@@ -27,18 +27,25 @@ class UserModel:
     """
         Holds User data.
     """
-    def __init__(self, u_id = None, name = None, passwd = None, salt = None, master = None):
+    def __init__(self, u_id = None, name = None, passwd = None, salt = None, master = None, kdf_salt = None, kdf_iter = None, 
+                 vault_key = None):
         """
             Initialize UserModel.
             
             @param u_id: user id
             @param name: user name
-            @param passwd: user passwd hash
+            @param passwd: user passwd hash, empty if user has vault key
             @param salt: password salt
             @param master: master password, plain text
+            @param kdf_salt: master key derivation salt
+            @param kdf_iter: master key derivation iterations, None if user has no vault key yet
+            @param vault_key: vault key wrapped by master key
         """
         self._id = u_id
         self._name = name
         self._passwd = passwd
         self._salt = salt
-        self._master = master
\ No newline at end of file
+        self._master = master
+        self._kdf_salt = kdf_salt
+        self._kdf_iter = kdf_iter
+        self._vault_key = vault_key
\ No newline at end of file